@@ -0,0 +1,191 @@
+"""
+Benchmarks for carthorse's hot paths, run against synthetic repositories.
+
+For each tag count requested, this builds a bare remote and a local clone containing
+that many tags, with the tags in the clone either packed or loose, along with a large
+changelog, and then times the tag checks, tag actions, version sources and complete
+carthorse runs against it.
+
+Run from the root of a checkout with::
+
+    python -m benchmarks.run --tags 1000 10000 100000 --repeat 5 --json results.json
+"""
+import json
+import os
+import statistics
+from argparse import ArgumentParser
+from contextlib import redirect_stdout, contextmanager
+from functools import partial
+from itertools import count
+from pathlib import Path
+from subprocess import check_output, STDOUT
+from tempfile import TemporaryDirectory
+from textwrap import dedent
+from time import perf_counter
+from typing import Callable, Dict, List
+
+from carthorse.actions import create_tag, update_major_tag
+from carthorse.cli import carthorse
+from carthorse.config import load_config
+from carthorse.documents import documents
+from carthorse.plugins import Plugins
+from carthorse import version_from
+from carthorse.when import version_not_tagged
+
+
+def git(*command, cwd, input=None):
+    return check_output(('git',) + command, cwd=cwd, stderr=STDOUT, input=input).decode()
+
+
+def make_changelog(path: Path, entries: int):
+    with path.open('w') as target:
+        for i in range(entries, 0, -1):
+            target.write(f'## 1.{i}.0 (1 Jan 2025)\n\n')
+            target.write('- A change that was made, described in enough words to be realistic.\n' * 5)
+            target.write('\n')
+
+
+def make_repos(root: Path, tags: int, packed: bool, changelog_entries: int) -> Path:
+    remote = root / 'remote.git'
+    local = root / 'local'
+    git('init', '--bare', '-q', str(remote), cwd=root)
+    git('init', '-q', str(local), cwd=root)
+    git('config', 'user.email', 'bench@example.com', cwd=local)
+    git('config', 'user.name', 'Benchmark', cwd=local)
+    git('remote', 'add', 'origin', str(remote), cwd=local)
+    (local / 'pyproject.toml').write_text(dedent("""
+        [project]
+        version = "2.0.0"
+        [tool.poetry]
+        version = "2.0.0"
+        [tool.carthorse]
+        version-from = "pyproject"
+        when = ["version-not-tagged"]
+        actions = []
+    """))
+    (local / 'setup.py').write_text('from setuptools import setup\nsetup(version="2.0.0")\n')
+    (local / 'bench.py').write_text('__version__ = "2.0.0"\n')
+    make_changelog(local / 'CHANGELOG.md', changelog_entries)
+    git('add', '.', cwd=local)
+    git('commit', '-q', '-m', 'initial', cwd=local)
+    sha = git('rev-parse', 'HEAD', cwd=local).strip()
+    updates = ''.join(f'create refs/tags/v1.{i}.0 {sha}\n' for i in range(tags)).encode()
+    git('update-ref', '--stdin', cwd=local, input=updates)
+    git('push', '-q', 'origin', 'HEAD', 'refs/tags/*:refs/tags/*', cwd=local)
+    git('pack-refs', '--all', cwd=remote)
+    if packed:
+        git('pack-refs', '--all', cwd=local)
+    return local
+
+
+@contextmanager
+def quiet():
+    with open(os.devnull, 'w') as devnull, redirect_stdout(devnull):
+        yield
+
+
+def measure(function: Callable, repeat: int) -> Dict[str, float]:
+    times = []
+    for _ in range(repeat):
+        documents.clear()
+        start = perf_counter()
+        with quiet():
+            function()
+        times.append(perf_counter() - start)
+    return {'min': min(times), 'median': statistics.median(times), 'max': max(times)}
+
+
+def with_tag(tag: str, function: Callable, *args, **kw):
+    def call():
+        os.environ['TAG'] = tag if '{' not in tag else tag.format(next(counter))
+        return function(*args, **kw)
+    counter = count()
+    return call
+
+
+def full_run(config_path: str, plugins):
+    def call():
+        carthorse(load_config(config_path), plugins, dry_run=False)
+    return call
+
+
+def benchmarks(local: Path) -> Dict[str, Callable]:
+    plugins = Plugins.load()
+    changelog = str(local / 'CHANGELOG.md')
+    return {
+        'version-not-tagged fetch (untagged)':
+            with_tag('v9.9.9', version_not_tagged),
+        'version-not-tagged fetch (tagged)':
+            with_tag('v1.0.0', version_not_tagged),
+        'version-not-tagged ls-remote (untagged)':
+            with_tag('v9.9.9', version_not_tagged, lookup='ls-remote'),
+        'version-not-tagged ls-remote (tagged)':
+            with_tag('v1.0.0', version_not_tagged, lookup='ls-remote'),
+        'create-tag':
+            with_tag('bench-{}', create_tag),
+        'update-major-tag':
+            with_tag('v999.0.0', update_major_tag),
+        'version-from pyproject': version_from.pyproject,
+        'version-from poetry': version_from.poetry,
+        'version-from setup.py (static)': version_from.setup_py,
+        'version-from file (changelog)':
+            lambda: version_from.file(changelog, pattern=r'## (?P<version>\S+)'),
+        'version-from file (changelog, no match)': partial(no_match, changelog),
+        'version-from flit': lambda: version_from.flit('bench'),
+        'version-from env': with_tag('', version_from.env, variable='TAG'),
+        'version-from none': version_from.none,
+        'carthorse (pyproject, version-not-tagged)':
+            full_run(str(local / 'pyproject.toml'), plugins),
+    }
+
+
+def no_match(path):
+    try:
+        version_from.file(path, pattern=r'## (?P<version>9\S+)')
+    except ValueError:
+        pass
+
+
+def main():
+    parser = ArgumentParser(description=__doc__.split('\n\n')[0])
+    parser.add_argument('--tags', type=int, nargs='+', default=[1000, 10000])
+    parser.add_argument('--layout', choices=['packed', 'loose'], nargs='+',
+                        default=['packed', 'loose'])
+    parser.add_argument('--changelog-entries', type=int, default=20000)
+    parser.add_argument('--repeat', type=int, default=5)
+    parser.add_argument('--only', metavar='SUBSTRING',
+                        help='Only run benchmarks whose names contain this.')
+    parser.add_argument('--json', metavar='PATH', help='Write results to PATH as JSON.')
+    args = parser.parse_args()
+
+    results: List[Dict] = []
+    cwd = os.getcwd()
+    saved_tag = os.environ.get('TAG')
+    try:
+        for tags in args.tags:
+            for layout in args.layout:
+                with TemporaryDirectory() as root:
+                    local = make_repos(Path(root), tags, layout == 'packed', args.changelog_entries)
+                    os.chdir(local)
+                    print(f'{tags} tags, {layout}:')
+                    for name, function in benchmarks(local).items():
+                        if args.only and args.only not in name:
+                            continue
+                        timing = measure(function, args.repeat)
+                        print(f"  {name:<45} {timing['min']*1000:10.2f}ms min "
+                              f"{timing['median']*1000:10.2f}ms median")
+                        results.append(dict(tags=tags, layout=layout, benchmark=name, **timing))
+                    os.chdir(cwd)
+    finally:
+        os.chdir(cwd)
+        if saved_tag is None:
+            os.environ.pop('TAG', None)
+        else:
+            os.environ['TAG'] = saved_tag
+
+    if args.json:
+        Path(args.json).write_text(json.dumps(results, indent=2))
+
+
+if __name__ == '__main__':
+    main()
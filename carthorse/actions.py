@@ -1,38 +1,198 @@
-import os
 import re
-from subprocess import check_output, CalledProcessError, STDOUT
+import shlex
+import sys
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+from contextvars import copy_context
+from dataclasses import asdict
+from datetime import datetime, timezone
+from subprocess import TimeoutExpired
+from typing import Callable, Dict, Sequence, Union
 
+from .context import current, deadline, cancellation
+from .execution import Command
+from .timing import recording
 
-def run(command):
-    print('$ '+command)
+#: The number of lines of output from a command that are kept for its return value.
+#: Long lines are split into pieces of up to :data:`~carthorse.execution.MAX_LINE`
+#: characters, each counting as a line, so no more than ``TAIL_LINES * MAX_LINE``
+#: characters are kept.
+TAIL_LINES = 1000
+
+#: The default maximum number of remotes that will be pushed to at the same time.
+PUSH_WORKERS = 4
+
+Remotes = Union[str, Sequence[str]]
+
+
+def display(command: Command) -> str:
+    """
+    Return the command as it would be typed into a shell.
+    """
+    return command if isinstance(command, str) else shlex.join(command)
+
+
+def execute(command: Command, output: Callable[[str], None]) -> int:
+    """
+    Execute the command using the current context's backend, within any time limit
+    that has been set, and return its exit code. The command is killed if the work it is
+    part of is cancelled. The resources it used are added to the
+    :class:`~carthorse.timing.Timing` being recorded, if there is one.
+    """
+    context = current()
+    limit = deadline()
+    start = datetime.now(timezone.utc).timestamp()
     returncode = None
+    usage = []
     try:
-        output = check_output(command, shell=True, stderr=STDOUT)
-    except CalledProcessError as e:
-        output = e.output
-        returncode = e.returncode
-    if returncode is not None:
+        if limit is not None and not limit.remaining():
+            raise TimeoutExpired(command, limit.seconds)
+        returncode = context.backend.execute(
+            command, output, cwd=context.cwd, env=context.env,
+            timeout=None if limit is None else limit.remaining(), usage=usage.append,
+            cancel=cancellation(),
+        )
+        return returncode
+    except TimeoutExpired as e:
+        seconds = e.timeout if limit is None else limit.seconds
+        print(f'timed out after {seconds:g}s', flush=True)
+        raise TimeoutExpired(command, seconds) from None
+    finally:
+        timing = recording.get()
+        if timing is not None and usage:
+            timing.commands.append(dict(
+                command=display(command), start=start, returncode=returncode, **asdict(usage[0])
+            ))
+
+
+def run(command: Command):
+    """
+    Run the command, in a shell if it is a string or directly if it is a sequence of
+    arguments, echoing its output and returning the end of it. If the command fails,
+    :class:`SystemExit` is raised with its exit code.
+    """
+    print('$ '+display(command), flush=True)
+    tail = deque(maxlen=TAIL_LINES)
+
+    def output(line):
+        sys.stdout.write(line)
+        sys.stdout.flush()
+        tail.append(line)
+
+    returncode = execute(command, output)
+    if returncode:
         print(f'returncode={returncode}')
-    text = output.decode()
-    if text:
-        print(text, end='')
-    if returncode is not None:
         raise SystemExit(returncode)
-    return text.strip()
+    return ''.join(tail).strip()
+
+
+def capture(command: Command) -> str:
+    """
+    Execute the command as :func:`run` does, but without echoing it or its output,
+    and return its output. If the command fails, it and its output are printed and
+    :class:`SystemExit` is raised with its exit code.
+    """
+    chunks = []
+    returncode = execute(command, chunks.append)
+    if returncode:
+        print('$ '+display(command))
+        sys.stdout.write(''.join(chunks))
+        print(f'returncode={returncode}')
+        raise SystemExit(returncode)
+    return ''.join(chunks)
+
+
+class Pushes(object):
+    """
+    Tags to be pushed once all actions have succeeded, using one atomic push per
+    remote so that either all of a release's tags are pushed or none of them are.
+    """
+
+    def __init__(self):
+        self.refs: Dict[str, Dict[str, bool]] = {}
+
+    def add(self, remote: str, tag: str, force: bool = False):
+        refs = self.refs.setdefault(remote, {})
+        refs[tag] = refs.get(tag, False) or force
+
+    def push(self, workers: int = PUSH_WORKERS):
+        def push(remote):
+            refspecs = [
+                f"{'+' if force else ''}refs/tags/{tag}" for tag, force in self.refs[remote].items()
+            ]
+            run(['git', 'push', '--atomic', remote, *refspecs])
+        try:
+            for_each_remote(push, list(self.refs), workers, 'pushed')
+        finally:
+            self.refs.clear()
+
+
+def for_each_remote(function: Callable[[str], None], remotes: Sequence[str], workers: int, done: str):
+    """
+    Call ``function`` for each of the remotes, concurrently if there is more than one,
+    using no more than ``workers`` threads. The outcome for each remote is reported once
+    all have finished, and the first failure, in the order the remotes were given, is
+    then raised.
+    """
+    if len(remotes) < 2:
+        for remote in remotes:
+            function(remote)
+        return
+    with ThreadPoolExecutor(max_workers=max(1, min(workers, len(remotes)))) as executor:
+        futures = [(remote, executor.submit(copy_context().run, function, remote))
+                   for remote in remotes]
+    failures = []
+    for remote, future in futures:
+        exception = future.exception()
+        if exception is None:
+            print(f'{remote}: {done}')
+        else:
+            if isinstance(exception, SystemExit):
+                print(f'{remote}: failed, returncode={exception.code}')
+            else:
+                print(f'{remote}: failed, {exception!r}')
+            failures.append(exception)
+    if failures:
+        raise failures[0]
+
+
+def push_tag(remote: Remotes, tag: str, force: bool = False, workers: int = PUSH_WORKERS):
+    remotes = [remote] if isinstance(remote, str) else list(remote)
+    batch = current().pushes
+    if batch is None:
+        def push(remote):
+            run(['git', 'push', *(['--force'] if force else []), remote, 'tag', tag])
+        for_each_remote(push, remotes, workers, f'pushed {tag}')
+    else:
+        for remote in remotes:
+            batch.add(remote, tag, force)
+
+
+def tag_at_head(tag: str) -> bool:
+    """
+    Return ``True`` if the named tag already exists in the repository being released and
+    points at the commit checked out, such as when an earlier run created the tag but
+    failed to push it.
+    """
+    store = current().ref_store()
+    if store is None:
+        return False
+    head = store.resolve('HEAD')
+    return head is not None and store.resolve('refs/tags/'+tag) == head
 
 
-def create_tag(remote='origin', update=False):
-    tag = os.environ['TAG']
-    force = '--force ' if update else ''
-    run(f"git tag {force}{tag}")
-    run(f'git push {force}{remote} tag {tag}')
+def create_tag(remote='origin', update=False, workers=PUSH_WORKERS):
+    tag = current().tag
+    if update or not tag_at_head(tag):
+        run(['git', 'tag', *(['--force'] if update else []), tag])
+    push_tag(remote, tag, force=update, workers=workers)
 
 
-def update_major_tag(remote='origin', pattern='v[0-9]+'):
-    env_tag = os.environ['TAG']
+def update_major_tag(remote='origin', pattern='v[0-9]+', workers=PUSH_WORKERS):
+    env_tag = current().tag
     match = re.match(pattern, env_tag)
     if match is None:
         raise ValueError(f"pattern {pattern!r} does not match {env_tag!r}")
     tag = match.group(0)
-    run(f"git tag --force {tag}")
-    run(f'git push --force {remote} tag {tag}')
+    run(['git', 'tag', '--force', tag])
+    push_tag(remote, tag, force=True, workers=workers)
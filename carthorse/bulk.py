@@ -0,0 +1,149 @@
+import json
+import os
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor
+from contextlib import redirect_stdout
+from dataclasses import dataclass, asdict
+from pathlib import Path
+from time import perf_counter
+from typing import List, Optional, Sequence
+
+from .cli import carthorse
+from .config import load_config
+from .context import RunContext
+from .execution import MAX_LINE
+from .plugins import Plugins
+from .timing import Timings, format_table
+
+#: The number of lines of output kept from each repository's release.
+OUTPUT_LINES = 20
+
+_plugins: Optional[Plugins] = None
+
+
+@dataclass
+class Result:
+    path: str
+    #: ``'released'``, ``'skipped'`` if a check did not pass, or ``'failed'``.
+    status: str
+    tag: Optional[str] = None
+    error: Optional[str] = None
+    wall: float = 0
+    output: str = ''
+
+
+class Tail(object):
+    """
+    A text stream that only keeps the last few lines written to it.
+    """
+
+    def __init__(self, lines: int):
+        self.lines = deque(maxlen=lines)
+        self.partial = ''
+
+    def write(self, text: str):
+        *complete, self.partial = (self.partial + text).split('\n')
+        self.lines.extend(complete)
+        # output with no newlines is kept in pieces, so it is bounded too:
+        while len(self.partial) > MAX_LINE:
+            self.lines.append(self.partial[:MAX_LINE])
+            self.partial = self.partial[MAX_LINE:]
+        return len(text)
+
+    def flush(self):
+        pass
+
+    def getvalue(self) -> str:
+        return '\n'.join([*self.lines, self.partial]).strip('\n')
+
+
+def read_manifest(path: str) -> List[str]:
+    """
+    Read repository paths from a manifest file, one per line, ignoring blank lines and
+    those starting with ``#``. Relative paths are relative to the manifest's directory.
+    """
+    base = Path(path).parent
+    paths = []
+    for line in Path(path).read_text().splitlines():
+        line = line.strip()
+        if line and not line.startswith('#'):
+            paths.append(str((base / line).resolve()))
+    return paths
+
+
+def _initialise(plugins: Plugins):
+    global _plugins
+    _plugins = plugins
+
+
+def release(
+        path: str, config_path: str = 'pyproject.toml', dry_run: bool = False,
+        resume: bool = False,
+) -> Result:
+    """
+    Perform the release for the repository at the specified path, in the current
+    process, using the plugins this worker was initialised with. If ``resume`` is
+    true, an unfinished earlier release is resumed as described in
+    :func:`~carthorse.cli.carthorse`.
+    """
+    output = Tail(OUTPUT_LINES)
+    timings = Timings()
+    start = perf_counter()
+    try:
+        with redirect_stdout(output):
+            config = load_config(os.path.join(path, config_path))
+            released = carthorse(
+                config, _plugins, dry_run, timings, context=RunContext(cwd=path), resume=resume
+            )
+    except (Exception, SystemExit) as e:
+        status, error = 'failed', repr(e)
+    else:
+        status, error = 'released' if released else 'skipped', None
+    return Result(
+        path=path,
+        status=status,
+        tag=timings.attributes.get('tag'),
+        error=error,
+        wall=perf_counter() - start,
+        output=output.getvalue(),
+    )
+
+
+def release_many(
+        paths: Sequence[str],
+        config_path: str = 'pyproject.toml',
+        dry_run: bool = False,
+        processes: Optional[int] = None,
+        plugins: Optional[Plugins] = None,
+        resume: bool = False,
+) -> List[Result]:
+    """
+    Perform releases for many repositories using a pool of ``processes`` worker
+    processes, with plugins only discovered once. Results are returned in the
+    order the paths were given.
+    """
+    plugins = Plugins.load() if plugins is None else plugins
+    paths = [str(Path(path).resolve()) for path in paths]
+    with ProcessPoolExecutor(
+            max_workers=processes, initializer=_initialise, initargs=(plugins,)
+    ) as executor:
+        return list(executor.map(
+            release, paths, [config_path] * len(paths), [dry_run] * len(paths),
+            [resume] * len(paths),
+        ))
+
+
+def report(results: Sequence[Result]) -> str:
+    rows = [('path', 'status', 'tag', 'wall')]
+    for result in results:
+        rows.append((result.path, result.status, result.tag or '', f'{result.wall:.3f}s'))
+    lines = [format_table(rows, left=4)]
+    for result in results:
+        if result.error:
+            lines.append(f'\n{result.path} failed with {result.error}:\n{result.output}')
+    return '\n'.join(lines)
+
+
+def write_report(results: Sequence[Result], path: str):
+    with open(path, 'w') as target:
+        json.dump([asdict(result) for result in results], target, indent=2)
@@ -1,40 +1,325 @@
 import os
 from argparse import ArgumentParser
+from contextlib import contextmanager
+from dataclasses import replace
 from datetime import datetime
+from subprocess import TimeoutExpired
+from typing import Dict
 
 from .config import load_config
-from .plugins import Plugins
+from .context import RunContext, activated, time_limit
+from .execution import DryRunBackend, make_backend
+from .journal import Journal
+from .plugins import Plugins, estimate
+from .profiling import PROFILERS, Profiler
+from .refs import UnsupportedRepository
+from .scheduler import run_in_order, first_failure, by_cost, dependency_order
+from .timing import Timings, describe
+from .trace import write_trace
+from .when import TagSnapshot
 from . import actions
 
 
+# Options that only apply when releasing a single repository:
+BULK_UNSUPPORTED = 'timings', 'timings_json', 'trace', 'profile'
+
+
 def parse_args():
     parser = ArgumentParser()
     parser.add_argument('--config', default='pyproject.toml')
     parser.add_argument('--dry-run', action='store_true')
-    return parser.parse_args()
+    parser.add_argument('--resume', action='store_true',
+                        help='Skip the checks and any actions already completed by an '
+                             'earlier run for the same tag and commit.')
+    parser.add_argument('--timings', action='store_true',
+                        help='Print how long each phase and plugin took.')
+    parser.add_argument('--timings-json', metavar='PATH',
+                        help='Write how long each phase and plugin took to PATH as JSON.')
+    parser.add_argument('--trace', metavar='PATH',
+                        help='Write a trace of the run to PATH in OpenTelemetry JSON format.')
+    parser.add_argument('--profile', metavar='DIR',
+                        help='Profile each phase of the run, writing the results to DIR.')
+    parser.add_argument('--profiler', choices=sorted(PROFILERS), default='cprofile',
+                        help='How to profile: using cProfile, '
+                             'or by sampling stacks for lower overhead.')
+    parser.add_argument('--manifest', metavar='PATH',
+                        help='Release each of the repositories listed in PATH.')
+    parser.add_argument('--processes', type=int,
+                        help='The number of repositories from a manifest to release at once.')
+    parser.add_argument('--report', metavar='PATH',
+                        help='Write the results of releasing a manifest to PATH as JSON.')
+    args = parser.parse_args()
+    if args.manifest:
+        unsupported = [option for option in BULK_UNSUPPORTED if getattr(args, option)]
+        if unsupported:
+            parser.error(', '.join(
+                '--'+option.replace('_', '-') for option in unsupported
+            )+' cannot be used with --manifest')
+    return args
 
 
 def main():
     args = parse_args()
-    config = load_config(args.config)
-    plugins = Plugins.load()
-    carthorse(config, plugins, args.dry_run)
+    if args.manifest:
+        return main_bulk(args)
+    timings = Timings()
+    profiler = PROFILERS[args.profiler](args.profile) if args.profile else Profiler()
+    try:
+        with timings.record('carthorse'):
+            with timings.record('config', args.config), profiler.phase('config'):
+                config = load_config(args.config)
+            with timings.record('plugins'), profiler.phase('plugins'):
+                plugins = Plugins.load()
+            history = Timings.previous(args.timings_json, 'when') if args.timings_json else {}
+            carthorse(
+                config, plugins, args.dry_run, timings, history,
+                profiler=profiler, resume=args.resume,
+            )
+    finally:
+        profiler.close()
+        if args.timings:
+            print(timings.table())
+        if args.timings_json:
+            timings.write(args.timings_json)
+        if args.trace:
+            write_trace(timings, args.trace)
 
 
-def carthorse(config, plugins, dry_run):
-    version = config.run(plugins['version_from'], config['version-from'])
-    tag_format = config.get('tag-format', 'v{version}')
-    os.environ['TAG'] = tag_format.format(
-        now=datetime.now(),
-        version=version,
+def main_bulk(args):
+    from .bulk import read_manifest, release_many, report, write_report
+    results = release_many(
+        read_manifest(args.manifest), args.config, args.dry_run, args.processes,
+        resume=args.resume,
     )
-    ok = True
-    for check in config['when']:
-        ok = config.run(plugins['when'], check)
-        if not ok:
-            break
-    if ok:
-        if dry_run:
-            actions.check_output = lambda *_, **__: b''
-        for action in config['actions']:
-            config.run(plugins['actions'], action)
+    print(report(results))
+    if args.report:
+        write_report(results, args.report)
+    if any(result.status == 'failed' for result in results):
+        raise SystemExit(1)
+
+
+WHEN_ORDERS = 'config', 'cost'
+
+#: The exit code used when a step takes longer than its time limit, as used by ``timeout``.
+TIMED_OUT = 124
+
+
+@contextmanager
+def stop_on_timeout(name: str):
+    try:
+        yield
+    except TimeoutExpired as e:
+        print(f'Stopping as {name!r} timed out after {e.timeout:g}s.')
+        raise SystemExit(TIMED_OUT) from None
+
+
+def carthorse(
+        config, plugins, dry_run, timings=None, history=None, context=None, profiler=None,
+        resume=False,
+):
+    """
+    Perform a release as specified by the config using the supplied plugins,
+    returning ``True`` if the checks passed and the actions were performed.
+    ``history`` may contain the wall clock times of checks from previous runs, keyed
+    by their description, for use when ordering checks by cost.
+
+    If a :class:`~carthorse.context.RunContext` is supplied, the release is
+    performed in its working directory and environment, leaving those of this
+    process untouched, so that several releases can be performed at once.
+    Otherwise, the process's working directory is used and ``$TAG`` is set in its
+    environment.
+
+    If the config has ``projects``, each is released as described in
+    :func:`release_projects` and ``True`` is returned if any of them were released.
+
+    If a :class:`~carthorse.profiling.Profiler` is supplied, the version extraction,
+    checks and actions are each profiled as a separate phase.
+
+    If ``dry_run`` is true, the version is extracted and the checks are performed as
+    normal, but the commands the actions would run are only printed.
+
+    Unless ``dry_run`` is true, the release is recorded in a
+    :class:`~carthorse.journal.Journal` once the checks pass, as are the actions
+    completed. If ``resume`` is true and an earlier run of the release for the same tag
+    and commit passed its checks but did not finish, the checks and the actions it
+    completed are skipped.
+    """
+    timings = Timings() if timings is None else timings
+    history = {} if history is None else history
+    profiler = Profiler() if profiler is None else profiler
+    if context is None:
+        context = RunContext.from_environment()
+    backend = None
+    if 'backend' in config.data:
+        backend = context.backend = make_backend(config['backend'])
+    try:
+        with time_limit(config.get('timeout', None)):
+            if 'projects' in config.data:
+                released = release_projects(
+                    config, plugins, context, timings, history, profiler, dry_run, resume
+                )
+                return any(released.values())
+            with activated(context):
+                return _carthorse(
+                    config, plugins, context, timings, history, profiler, dry_run, resume
+                )
+    finally:
+        if backend is not None:
+            backend.close()
+
+
+def _carthorse(config, plugins, context, timings, history, profiler, dry_run, resume):
+    version_from = config['version-from']
+    with stop_on_timeout('version-from'):
+        with timings.record('version-from', describe(version_from)), profiler.phase('version-from'):
+            version = config.run(plugins['version_from'], version_from)
+    tag_format = config.get('tag-format', 'v{version}')
+    with timings.record('tag-format', tag_format):
+        tag = context.tag = context.env['TAG'] = tag_format.format(
+            now=datetime.now(),
+            version=version,
+        )
+    timings.attributes.update(version=version, tag=tag)
+
+    try:
+        journal = Journal.find(context)
+    except UnsupportedRepository as e:
+        journal = None
+        if resume:
+            print(f"Can't resume as {e}.")
+    record = journal is not None and not dry_run
+    resuming = resume and journal is not None and journal.started()
+    completed = journal.completed() if resuming else set()
+    if resuming:
+        print(f'Resuming the release of {tag} from {journal.commit}, skipping checks.')
+    elif not _check(config, plugins, timings, history, profiler):
+        return False
+    elif record:
+        journal.record()
+
+    keys = {id(action): Journal.key(position, action)
+            for position, action in enumerate(config['actions'])}
+    pending = journal.pushes() if resuming else {}
+    pushes = actions.Pushes() if config.get('atomic-push', False) or pending else None
+    for remote, refs in pending.items():
+        for pending_tag, force in refs.items():
+            pushes.add(remote, pending_tag, force)
+    context.pushes = pushes
+    backend = context.backend
+    if dry_run:
+        context.backend = DryRunBackend()
+    # actions that batched tags aren't done until the tags are pushed or journalled:
+    batched = []
+
+    def run_action(action):
+        name = describe(action)
+        key = keys[id(action)]
+        if key in completed:
+            print(f'Skipping {name!r} as it was completed by an earlier run.')
+            return
+        with stop_on_timeout(name), time_limit(action.get('timeout')):
+            with timings.record('actions', name):
+                config.run(plugins['actions'], action)
+        if pushes is not None:
+            batched.append(key)
+        elif record:
+            journal.record(key)
+
+    try:
+        with profiler.phase('actions'):
+            try:
+                run_in_order(config['actions'], run_action, config.get('jobs', 1))
+            finally:
+                if record and pushes is not None:
+                    journal.record(*batched, pushes=pushes.refs)
+            if pushes is not None:
+                with stop_on_timeout('push'), timings.record('push'):
+                    pushes.push()
+    finally:
+        context.pushes = None
+        context.backend = backend
+    if record:
+        journal.clear()
+    return True
+
+
+def _check(config, plugins, timings, history, profiler) -> bool:
+    checks = config['when']
+    when_order = config.get('when-order', 'config')
+    if when_order not in WHEN_ORDERS:
+        raise ValueError(f'when-order must be one of {WHEN_ORDERS!r}, not {when_order!r}')
+    if when_order == 'cost':
+        def cost_of(check):
+            name = describe(check)
+            if name in history:
+                return history[name]
+            return estimate(plugins['when'][check['name']])
+        checks = by_cost(checks, [cost_of(check) for check in checks])
+
+    def run_check(check):
+        name = describe(check)
+        with stop_on_timeout(name), time_limit(check.get('timeout')):
+            with timings.record('when', name):
+                return config.run(plugins['when'], check)
+
+    with profiler.phase('when'):
+        failed = first_failure(checks, run_check, config.get('when-jobs', 1))
+    if failed is not None:
+        print(f'Stopping as {describe(failed)!r} did not pass.')
+        return False
+    return True
+
+
+def release_projects(
+        config, plugins, context, timings, history, profiler=None, dry_run=False, resume=False
+) -> Dict[str, bool]:
+    """
+    Release each of the projects in the config, in its own directory within the
+    context's working directory and with its own tag, returning whether each was
+    released.
+
+    A project is only started once the projects it ``needs`` have finished, with up to
+    ``project-jobs`` projects being released at once. Remote tags are only fetched or
+    listed once for all the projects.
+    """
+    profiler = Profiler() if profiler is None else profiler
+    projects = config['projects']
+    needs = {}
+    for name, project in projects.items():
+        required = project.get('needs', [])
+        needs[name] = [required] if isinstance(required, str) else list(required)
+    snapshot = TagSnapshot()
+    released: Dict[str, bool] = {}
+
+    def release(item):
+        name = item['id']
+        project = projects[name]
+        project_context = replace(
+            context,
+            tag='',
+            cwd=os.path.join(context.cwd, project.get('path', name)),
+            env=dict(context.env),
+            pushes=None,
+            snapshot=snapshot,
+        )
+        project_timings = Timings()
+        limit = time_limit(project.get('timeout', None))
+        try:
+            with limit, timings.record('project', name), activated(project_context):
+                released[name] = _carthorse(
+                    project, plugins, project_context, project_timings, history, profiler,
+                    dry_run, resume,
+                )
+        finally:
+            timings.entries.extend(project_timings.entries)
+            for key, value in project_timings.attributes.items():
+                timings.attributes[f'{name}.{key}'] = value
+        if released[name]:
+            print(f'{name}: released {project_context.tag}')
+        else:
+            print(f'{name}: skipped')
+
+    order = dependency_order(needs)
+    items = [dict(name=name, id=name, needs=needs[name]) for name in order]
+    run_in_order(items, release, config.get('project-jobs', 1))
+    return released
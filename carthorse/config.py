@@ -1,4 +1,6 @@
-from functools import reduce
+from copy import deepcopy
+from functools import reduce, lru_cache
+from inspect import signature, Parameter
 from operator import __getitem__
 from os.path import splitext
 from typing import Callable, TextIO, Dict, Sequence, cast
@@ -6,16 +8,51 @@ from typing import Callable, TextIO, Dict, Sequence, cast
 from yaml import safe_load as parse_yaml
 from toml import load as parse_toml
 
+from .context import current
+from .documents import documents
+
+
+@lru_cache(maxsize=None)
+def accepts_context(plugin: Callable) -> bool:
+    """
+    Whether the plugin has an explicit ``context`` parameter, in which case the
+    :class:`~carthorse.context.RunContext` of the current release is passed to it.
+    """
+    try:
+        parameter = signature(plugin).parameters.get('context')
+    except (TypeError, ValueError):
+        return False
+    return parameter is not None and parameter.kind in (
+        Parameter.POSITIONAL_OR_KEYWORD, Parameter.KEYWORD_ONLY
+    )
+
 
 class Config(object):
 
     root_key: Sequence[str]
     parse: Callable[[TextIO], Dict]
+    #: Keys in an item's configuration that are used by carthorse rather than
+    #: being passed to the plugin. These are only recognised alongside the plugin's
+    #: name as a key, as in ``{run="make", timeout=60}``, since when ``name`` is used,
+    #: all the other keys are passed to the plugin.
+    options: Sequence[str] = ('id', 'needs', 'timeout')
 
     def __init__(self, path: str):
-        with open(path) as source:
-            data = self.parse(source)
-        self.data = cast(Dict, reduce(__getitem__, self.root_key, data))
+        data = documents.load(path, self.parse)
+        self.data = cast(Dict, deepcopy(reduce(__getitem__, self.root_key, data)))
+        if 'projects' in self.data:
+            self.expand_projects()
+        else:
+            self.expand_items()
+
+    def expand_projects(self):
+        defaults = {key: value for key, value in self.data.items() if key != 'projects'}
+        self.data['projects'] = {
+            name: ProjectConfig(name, deepcopy({**defaults, **project}))
+            for name, project in self.data['projects'].items()
+        }
+
+    def expand_items(self):
         self.data['version-from'] = self.expand(self.data['version-from'])
         for name in 'when', 'actions':
             self.data[name] = [self.expand(item) for item in self.data[name]]
@@ -26,8 +63,10 @@ class Config(object):
         else:
             name = item.pop('name', None)
             if name is None:
+                options = {key: item.pop(key) for key in self.options if key in item}
                 (name, arg),  = item.items()
             else:
+                options = {}
                 arg = item
             if isinstance(arg, dict):
                 kw = arg
@@ -35,7 +74,7 @@ class Config(object):
             else:
                 kw = {}
                 args = (arg,)
-            return dict(name=name, args=args, kw=kw)
+            return dict(name=name, args=args, kw=kw, **options)
 
     def __getitem__(self, item):
         return self.data[item]
@@ -44,22 +83,33 @@ class Config(object):
         return self.data.get(item, default)
 
     def run(self, plugins, config):
+        plugin = plugins[config['name']]
         kw = config['kw'].copy()
-        return plugins[config['name']](*config['args'], **kw)
+        if accepts_context(plugin):
+            kw['context'] = current()
+        return plugin(*config['args'], **kw)
+
+
+class ProjectConfig(Config):
+    """
+    The configuration for one of several projects released from the same
+    configuration file, such as the packages in a monorepo.
+    """
+
+    def __init__(self, name: str, data: Dict):
+        self.name = name
+        self.data = data
+        self.expand_items()
 
 
 class TomlConfig(Config):
     root_key = ['tool', 'carthorse']
-
-    def parse(self, source):
-        return parse_toml(source)
+    parse = staticmethod(parse_toml)
 
 
 class YamlConfig(Config):
     root_key = ['carthorse']
-
-    def parse(self, source):
-        return parse_yaml(source)
+    parse = staticmethod(parse_yaml)
 
 
 parsers = {
@@ -0,0 +1,159 @@
+import os
+from contextlib import contextmanager
+from contextvars import ContextVar
+from dataclasses import dataclass, field
+from time import monotonic
+from typing import Iterator, MutableMapping, Optional, TYPE_CHECKING
+
+from .execution import Backend, Cancellation, SubprocessBackend
+from .refs import RefStore, UnsupportedRepository
+
+if TYPE_CHECKING:  # pragma: no cover
+    from .actions import Pushes
+    from .when import TagSnapshot
+
+
+@dataclass
+class RunContext:
+    """
+    Everything a plugin needs to know about the release being performed. Plugins can
+    obtain this using :func:`current`, or by accepting a ``context`` parameter.
+    """
+
+    #: The tag computed from the tag format.
+    tag: str = ''
+    #: The directory containing the project being released.
+    cwd: str = field(default_factory=os.getcwd)
+    #: The environment commands should be executed with.
+    env: MutableMapping[str, str] = field(default_factory=lambda: dict(os.environ))
+    #: How commands should be executed.
+    backend: Backend = field(default_factory=SubprocessBackend)
+    #: Tag pushes that are being batched, see :class:`~carthorse.actions.Pushes`.
+    pushes: Optional['Pushes'] = None
+    #: Remote tags shared by several projects, see :class:`~carthorse.when.TagSnapshot`.
+    snapshot: Optional['TagSnapshot'] = None
+
+    @classmethod
+    def from_environment(cls) -> 'RunContext':
+        """
+        A context that uses, and updates, this process's working directory and
+        environment, as carthorse has always done.
+        """
+        return cls(
+            tag=os.environ.get('TAG', ''),
+            cwd=os.getcwd(),
+            env=os.environ,
+            backend=SubprocessBackend(),
+        )
+
+    def path(self, *parts: str) -> str:
+        """
+        Return the path, relative to this context's working directory, of the parts
+        supplied.
+        """
+        return os.path.join(self.cwd, *parts)
+
+    def ref_store(self) -> Optional[RefStore]:
+        """
+        Return the :class:`~carthorse.refs.RefStore` of the repository containing this
+        context's working directory, or ``None`` if there is no repository or its refs
+        cannot be read in-process.
+        """
+        try:
+            return RefStore.find(self.cwd, self.env)
+        except UnsupportedRepository:
+            return None
+
+
+_current: ContextVar[Optional[RunContext]] = ContextVar('context', default=None)
+
+
+def current() -> RunContext:
+    """
+    Return the context of the release currently being performed, or a context based
+    on this process's environment if there is none.
+    """
+    context = _current.get()
+    if context is None:
+        context = RunContext.from_environment()
+    return context
+
+
+@contextmanager
+def activated(context: RunContext) -> Iterator[RunContext]:
+    """
+    Make the supplied context current for the duration of the ``with`` block.
+    """
+    token = _current.set(context)
+    try:
+        yield context
+    finally:
+        _current.reset(token)
+
+
+@dataclass(frozen=True)
+class Deadline:
+    """
+    The time by which the step currently being performed must finish.
+    """
+
+    #: The :func:`~time.monotonic` time of the deadline.
+    at: float
+    #: The time limit, in seconds, that the deadline was set from.
+    seconds: float
+
+    def remaining(self) -> float:
+        return max(self.at - monotonic(), 0)
+
+
+_deadline: ContextVar[Optional[Deadline]] = ContextVar('deadline', default=None)
+
+
+def deadline() -> Optional[Deadline]:
+    """
+    Return the earliest deadline set by the enclosing :func:`time_limit` blocks, if any.
+    """
+    return _deadline.get()
+
+
+@contextmanager
+def time_limit(seconds: Optional[float]) -> Iterator[Optional[Deadline]]:
+    """
+    Require commands executed within the ``with`` block to finish within ``seconds``
+    of it starting, or by any earlier deadline that has already been set.
+    """
+    existing = _deadline.get()
+    if seconds is None:
+        yield existing
+        return
+    new = Deadline(monotonic() + seconds, seconds)
+    if existing is not None and existing.at <= new.at:
+        new = existing
+    token = _deadline.set(new)
+    try:
+        yield new
+    finally:
+        _deadline.reset(token)
+
+
+_cancellation: ContextVar[Optional[Cancellation]] = ContextVar('cancellation', default=None)
+
+
+def cancellation() -> Optional[Cancellation]:
+    """
+    Return the :class:`~carthorse.execution.Cancellation` set by the enclosing
+    :func:`cancellable` block, if any.
+    """
+    return _cancellation.get()
+
+
+@contextmanager
+def cancellable(cancel: Cancellation) -> Iterator[Cancellation]:
+    """
+    Kill any commands executed within the ``with`` block if ``cancel`` is cancelled.
+    """
+    token = _cancellation.set(cancel)
+    try:
+        yield cancel
+    finally:
+        _cancellation.reset(token)
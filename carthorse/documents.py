@@ -0,0 +1,57 @@
+import json
+import os
+from collections import OrderedDict
+from pathlib import Path
+from typing import Any, Callable, Dict, TextIO, Tuple
+
+Parser = Callable[[TextIO], Dict]
+
+
+class Documents(object):
+    """
+    A cache of parsed configuration files, such as ``pyproject.toml``, so that each is
+    only read and parsed once even when both carthorse's configuration and a version
+    extraction plugin need it.
+
+    Entries are keyed on the path and parser used, and are only used while the
+    file's size, inode and modification time are unchanged.
+
+    Parsed documents are shared, so must not be modified.
+    """
+
+    def __init__(self, size: int = 16):
+        self.size = size
+        self.cache: OrderedDict[Tuple[str, Parser], Tuple[Tuple[int, ...], Dict]] = OrderedDict()
+
+    def load(self, path: str, parse: Parser) -> Dict:
+        key = os.path.abspath(path), parse
+        stat = os.stat(path)
+        signature = stat.st_ino, stat.st_size, stat.st_mtime_ns
+        cached = self.cache.get(key)
+        if cached is not None and cached[0] == signature:
+            self.cache.move_to_end(key)
+            return cached[1]
+        with open(path) as source:
+            data = parse(source)
+        self.cache[key] = signature, data
+        self.cache.move_to_end(key)
+        while len(self.cache) > self.size:
+            self.cache.popitem(last=False)
+        return data
+
+    def clear(self):
+        self.cache.clear()
+
+
+documents = Documents()
+
+
+def write_json(path: Path, data: Any, **options):
+    """
+    Write the data to the path as JSON, formatted using the options supplied to
+    :func:`json.dumps`. A temporary file is written and then renamed over the path,
+    so that nothing reading it ever sees a partial write.
+    """
+    temp = path.with_suffix(f'.{os.getpid()}.tmp')
+    temp.write_text(json.dumps(data, **options))
+    os.replace(temp, path)
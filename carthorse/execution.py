@@ -0,0 +1,441 @@
+import asyncio
+import os
+import signal
+import sys
+from codecs import getincrementaldecoder
+from contextlib import contextmanager, nullcontext
+from dataclasses import dataclass
+from subprocess import Popen, PIPE, STDOUT, TimeoutExpired
+from threading import Event, Thread, Timer, Lock
+from time import perf_counter, sleep
+from typing import Callable, Dict, Iterator, List, Mapping, Optional, Sequence, Type, Union
+
+Output = Callable[[str], None]
+#: A command to be run by a shell, or a sequence of arguments to be executed directly.
+Command = Union[str, Sequence[str]]
+
+#: The number of seconds a command that has timed out is given to exit after being sent
+#: ``SIGTERM``, before it is sent ``SIGKILL``.
+GRACE = 5
+
+#: The number of bytes of a command's output read at a time.
+READ_SIZE = 65536
+
+#: The longest piece of output passed to an :data:`Output` at once, in characters. Longer
+#: lines, such as progress bars drawn using carriage returns, are passed in pieces.
+MAX_LINE = 4096
+
+
+@dataclass
+class Usage:
+    """
+    The resources used by a command, including those used by any processes it
+    waited for. Only the wall clock time is known for some backends.
+    """
+    #: Elapsed wall clock time in seconds.
+    wall: float
+    #: CPU time spent in user mode, in seconds.
+    user: Optional[float] = None
+    #: CPU time spent in the kernel, in seconds.
+    system: Optional[float] = None
+    #: The largest resident set size of any of the processes, in bytes.
+    max_rss: Optional[int] = None
+    #: The number of blocks read from the file system.
+    inblock: Optional[int] = None
+    #: The number of blocks written to the file system.
+    oublock: Optional[int] = None
+
+    @classmethod
+    def from_rusage(cls, wall: float, rusage) -> 'Usage':
+        # ru_maxrss is in kilobytes everywhere except macOS:
+        scale = 1 if sys.platform == 'darwin' else 1024
+        return cls(
+            wall=wall,
+            user=rusage.ru_utime,
+            system=rusage.ru_stime,
+            max_rss=rusage.ru_maxrss * scale,
+            inblock=rusage.ru_inblock,
+            oublock=rusage.ru_oublock,
+        )
+
+
+def signal_group(pid: int, signum: int):
+    """
+    Send the signal to every process in the process group led by ``pid``, if any remain.
+    """
+    try:
+        os.killpg(pid, signum)
+    except ProcessLookupError:
+        pass
+
+
+def not_executed(command: Command, error: OSError, output: Output) -> int:
+    """
+    Report a program that could not be executed as a shell would, returning the exit
+    code a shell would use. Any other reason for a command not starting, such as its
+    working directory not existing, is re-raised.
+    """
+    if isinstance(command, str) or error.filename != command[0]:
+        raise error
+    output(f'{error.filename}: {error.strerror}\n')
+    return 127 if isinstance(error, FileNotFoundError) else 126
+
+
+class Lines(object):
+    """
+    Split chunks of a command's output into lines, passing each to ``output`` in pieces
+    of no more than :data:`MAX_LINE` characters, so that output with no newlines is
+    never held in memory.
+    """
+
+    def __init__(self, output: Output):
+        self.output = output
+        self.decoder = getincrementaldecoder('utf-8')('replace')
+        self.partial = ''
+
+    def feed(self, chunk: bytes):
+        *lines, self.partial = (self.partial + self.decoder.decode(chunk)).split('\n')
+        for line in lines:
+            self.emit(line + '\n')
+        while len(self.partial) >= MAX_LINE:
+            self.output(self.partial[:MAX_LINE])
+            self.partial = self.partial[MAX_LINE:]
+
+    def emit(self, text: str):
+        for start in range(0, len(text), MAX_LINE):
+            self.output(text[start:start+MAX_LINE])
+
+    def close(self):
+        self.emit(self.partial + self.decoder.decode(b'', True))
+        self.partial = ''
+
+
+class Cancelled(Exception):
+    """
+    Raised when a command is killed, or never started, because the work it was being
+    executed for has been cancelled.
+    """
+
+
+class Cancellation(object):
+    """
+    A signal that work is no longer needed, such as a check that is still running when
+    an earlier one has failed. Commands executed with a cancellation are run in a new
+    process group, which is terminated in the same way as when a command times out.
+    """
+
+    def __init__(self):
+        self.lock = Lock()
+        self.cancelled = False
+        self.callbacks: List[Callable[[], None]] = []
+
+    def cancel(self):
+        with self.lock:
+            self.cancelled = True
+            callbacks, self.callbacks = self.callbacks, []
+        for callback in callbacks:
+            callback()
+
+    @contextmanager
+    def watch(self, callback: Callable[[], None]) -> Iterator[None]:
+        """
+        Call ``callback`` if this is cancelled during the ``with`` block, or straight
+        away if it already has been.
+        """
+        with self.lock:
+            cancelled = self.cancelled
+            if not cancelled:
+                self.callbacks.append(callback)
+        if cancelled:
+            callback()
+        try:
+            yield
+        finally:
+            with self.lock:
+                self.callbacks = [c for c in self.callbacks if c is not callback]
+
+
+class Backend(object):
+    """
+    The interface for the ways in which carthorse can execute commands.
+    """
+
+    def execute(
+            self, command: Command, output: Output,
+            cwd: Optional[str] = None, env: Optional[Mapping[str, str]] = None,
+            timeout: Optional[float] = None, usage: Optional[Callable[[Usage], None]] = None,
+            cancel: Optional[Cancellation] = None,
+    ) -> int:
+        """
+        Execute the command, in a shell if it is a string, passing each line of its
+        combined stdout and stderr to ``output`` as it arrives, split as described in
+        :class:`Lines`, and return its exit code.
+        If ``usage`` is supplied, it is called with the :class:`Usage` of the command
+        once it has finished.
+
+        If a ``timeout`` is given, the command is run in a new process group. If it has
+        not finished within that many seconds, the whole group is sent ``SIGTERM``, and
+        then ``SIGKILL`` if it has not exited after a grace period, and
+        :class:`~subprocess.TimeoutExpired` is raised.
+
+        If a :class:`Cancellation` is given, the command is also run in a new process
+        group, which is terminated in the same way if it is cancelled, with
+        :class:`Cancelled` then being raised.
+        """
+        raise NotImplementedError
+
+    def close(self):
+        """
+        Release any resources used by this backend.
+        """
+
+
+class SubprocessBackend(Backend):
+    """
+    Execute commands synchronously using :class:`subprocess.Popen`. Commands given
+    as sequences of arguments are executed without starting a shell.
+    """
+
+    def __init__(self, grace: float = GRACE):
+        self.grace = grace
+
+    def execute(
+            self, command, output, cwd=None, env=None, timeout=None, usage=None, cancel=None
+    ):
+        if cancel is not None and cancel.cancelled:
+            raise Cancelled(command)
+        shell = isinstance(command, str)
+        new_session = timeout is not None or cancel is not None
+        start = perf_counter()
+        try:
+            process = Popen(
+                command, shell=shell, stdout=PIPE, stderr=STDOUT, cwd=cwd, env=env,
+                start_new_session=new_session,
+            )
+        except (FileNotFoundError, PermissionError) as e:
+            return not_executed(command, e, output)
+        timed_out = Event()
+        timer = None
+        if timeout is not None:
+            timer = Timer(timeout, self.terminate, (process, timed_out))
+            timer.daemon = True
+            timer.start()
+        cancelled = Event()
+        watch = nullcontext() if cancel is None else cancel.watch(lambda: Thread(
+            target=self.terminate, args=(process, cancelled), daemon=True
+        ).start())
+        with process, watch:
+            try:
+                lines = Lines(output)
+                while chunk := process.stdout.read1(READ_SIZE):
+                    lines.feed(chunk)
+                lines.close()
+                rusage = self.reap(process)
+            except BaseException:
+                if new_session:
+                    signal_group(process.pid, signal.SIGKILL)
+                raise
+        wall = perf_counter() - start
+        if timer is not None:
+            timer.cancel()
+            timer.join()
+        if usage is not None:
+            usage(Usage(wall) if rusage is None else Usage.from_rusage(wall, rusage))
+        if timed_out.is_set():
+            raise TimeoutExpired(command, timeout)
+        if cancelled.is_set():
+            raise Cancelled(command)
+        return process.returncode
+
+    @staticmethod
+    def reap(process: Popen):
+        """
+        Wait for the process to exit, returning its resource usage.
+        """
+        try:
+            _, status, rusage = os.wait4(process.pid, 0)
+        except ChildProcessError:  # pragma: no cover
+            # something else has already waited for it:
+            process.wait()
+            return None
+        process.returncode = os.waitstatus_to_exitcode(status)
+        return rusage
+
+    def terminate(self, process: Popen, stopped: Event):
+        # The process is not waited for here, so that its resource usage can be
+        # collected once it has exited:
+        if exited(process):
+            return
+        stopped.set()
+        signal_group(process.pid, signal.SIGTERM)
+        deadline = perf_counter() + self.grace
+        while perf_counter() < deadline:
+            if exited(process):
+                return
+            sleep(0.05)
+        signal_group(process.pid, signal.SIGKILL)
+
+
+def exited(process: Popen) -> bool:
+    """
+    Whether the process has exited, without waiting for it.
+    """
+    try:
+        return os.waitid(os.P_PID, process.pid, os.WEXITED | os.WNOHANG | os.WNOWAIT) is not None
+    except ChildProcessError:
+        return True
+
+
+class DryRunBackend(Backend):
+    """
+    Don't execute commands at all, as if they all succeeded with no output.
+    """
+
+    def execute(
+            self, command, output, cwd=None, env=None, timeout=None, usage=None, cancel=None
+    ):
+        return 0
+
+
+class AsyncioBackend(Backend):
+    """
+    Execute commands using :mod:`asyncio` subprocesses in an event loop running in a
+    background thread, so that commands run from many threads overlap, with no more
+    than ``limit`` running at once.
+
+    If ``timeout`` is specified, it is the longest any command may run for.
+    """
+
+    def __init__(self, limit: int = 4, timeout: Optional[float] = None, grace: float = GRACE):
+        self.limit = limit
+        self.timeout = timeout
+        self.grace = grace
+        self.loop: Optional[asyncio.AbstractEventLoop] = None
+        self.thread: Optional[Thread] = None
+        self.semaphore: Optional[asyncio.Semaphore] = None
+        self.lock = Lock()
+
+    def start(self) -> asyncio.AbstractEventLoop:
+        with self.lock:
+            if self.loop is None:
+                self.loop = asyncio.new_event_loop()
+                self.semaphore = asyncio.Semaphore(self.limit)
+                self.thread = Thread(
+                    target=self.loop.run_forever, name='carthorse-asyncio', daemon=True
+                )
+                self.thread.start()
+            return self.loop
+
+    def execute(
+            self, command, output, cwd=None, env=None, timeout=None, usage=None, cancel=None
+    ):
+        future = asyncio.run_coroutine_threadsafe(
+            self.execute_async(command, output, cwd, env, timeout, usage, cancel), self.start()
+        )
+        return future.result()
+
+    async def execute_async(
+            self, command: Command, output: Output,
+            cwd: Optional[str] = None, env: Optional[Mapping[str, str]] = None,
+            timeout: Optional[float] = None, usage: Optional[Callable[[Usage], None]] = None,
+            cancel: Optional[Cancellation] = None,
+    ) -> int:
+        """
+        The coroutine behind :meth:`execute`, which must be run in this backend's loop.
+        As processes are waited for by :mod:`asyncio`, only their wall clock time is
+        reported to ``usage``.
+        """
+        if self.timeout is not None:
+            timeout = self.timeout if timeout is None else min(timeout, self.timeout)
+        if cancel is None:
+            return await self.run(command, output, cwd, env, timeout, usage, False)
+        if cancel.cancelled:
+            raise Cancelled(command)
+        loop, task = asyncio.get_running_loop(), asyncio.current_task()
+        try:
+            with cancel.watch(lambda: loop.call_soon_threadsafe(task.cancel)):
+                return await self.run(command, output, cwd, env, timeout, usage, True)
+        except asyncio.CancelledError:
+            raise Cancelled(command) from None
+
+    async def run(
+            self, command: Command, output: Output, cwd: Optional[str],
+            env: Optional[Mapping[str, str]], timeout: Optional[float],
+            usage: Optional[Callable[[Usage], None]], cancellable: bool,
+    ) -> int:
+        new_session = timeout is not None or cancellable
+        async with self.semaphore:
+            start = perf_counter()
+            try:
+                if isinstance(command, str):
+                    process = await asyncio.create_subprocess_shell(
+                        command, stdout=PIPE, stderr=STDOUT, cwd=cwd, env=env,
+                        start_new_session=new_session,
+                    )
+                else:
+                    process = await asyncio.create_subprocess_exec(
+                        *command, stdout=PIPE, stderr=STDOUT, cwd=cwd, env=env,
+                        start_new_session=new_session,
+                    )
+            except (FileNotFoundError, PermissionError) as e:
+                return not_executed(command, e, output)
+            try:
+                await asyncio.wait_for(self.stream(process, output), timeout)
+            except asyncio.TimeoutError:
+                await self.terminate(process)
+                raise TimeoutExpired(command, timeout) from None
+            except asyncio.CancelledError:
+                asyncio.current_task().uncancel()
+                await self.terminate(process)
+                raise
+            finally:
+                if usage is not None:
+                    usage(Usage(perf_counter() - start))
+            return process.returncode
+
+    async def terminate(self, process: asyncio.subprocess.Process):
+        signal_group(process.pid, signal.SIGTERM)
+        try:
+            await asyncio.wait_for(process.wait(), self.grace)
+        except asyncio.TimeoutError:
+            signal_group(process.pid, signal.SIGKILL)
+            await process.wait()
+
+    @staticmethod
+    async def stream(process: asyncio.subprocess.Process, output: Output):
+        # Lines are split here, rather than using readline(), so that very long lines
+        # don't exceed the stream's buffer limit:
+        lines = Lines(output)
+        while chunk := await process.stdout.read(READ_SIZE):
+            lines.feed(chunk)
+        lines.close()
+        await process.wait()
+
+    def close(self):
+        with self.lock:
+            if self.loop is not None:
+                self.loop.call_soon_threadsafe(self.loop.stop)
+                self.thread.join()
+                self.loop.close()
+                self.loop = self.thread = self.semaphore = None
+
+
+BACKENDS: Dict[str, Type[Backend]] = {
+    'subprocess': SubprocessBackend,
+    'asyncio': AsyncioBackend,
+}
+
+
+def make_backend(spec: Union[str, Dict]) -> Backend:
+    """
+    Make the backend described by a name, or a mapping containing a ``name`` along
+    with the parameters for the backend.
+    """
+    if isinstance(spec, str):
+        name, params = spec, {}
+    else:
+        params = dict(spec)
+        name = params.pop('name')
+    if name not in BACKENDS:
+        raise ValueError(f'backend must be one of {tuple(BACKENDS)!r}, not {name!r}')
+    return BACKENDS[name](**params)
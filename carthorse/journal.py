@@ -0,0 +1,116 @@
+import json
+from hashlib import sha256
+from pathlib import Path
+from threading import Lock
+from typing import Dict, Optional, Set
+
+from .context import RunContext
+from .documents import write_json
+from .refs import RefStore, UnsupportedRepository
+
+#: The name of the journal file, kept in the repository's git directory.
+FILENAME = 'carthorse-journal.json'
+
+# Projects in the same repository share a journal, and may be released at once:
+_lock = Lock()
+
+
+class Journal(object):
+    """
+    A record, kept in the repository's git directory, of the actions that have been
+    completed for a release of a particular tag from a particular commit, so that a
+    release that fails part way through can be resumed.
+    """
+
+    def __init__(self, path: Path, tag: str, commit: str):
+        self.path = path
+        self.tag = tag
+        self.commit = commit
+
+    @classmethod
+    def find(cls, context: RunContext) -> 'Journal':
+        """
+        The journal for releasing the context's tag from the commit currently checked
+        out in its working directory.
+        :class:`~carthorse.refs.UnsupportedRepository` is raised if there is no
+        repository or no commit checked out.
+        """
+        store = RefStore.find(context.cwd, context.env)
+        commit = store.resolve('HEAD')
+        if commit is None:
+            raise UnsupportedRepository(f'no commit checked out in {context.cwd}')
+        return cls(store.git_dir / FILENAME, context.tag, commit)
+
+    @staticmethod
+    def key(position: int, action: Dict) -> str:
+        """
+        The key used to record an action, which changes if the action's configuration
+        or its position in the list of actions changes.
+        """
+        config = [position, action['name'], action['args'], action['kw']]
+        return sha256(json.dumps(config, sort_keys=True, default=str).encode()).hexdigest()
+
+    def _read(self) -> Dict[str, Dict]:
+        try:
+            data = json.loads(self.path.read_text())
+        except (OSError, ValueError):
+            return {}
+        return data if isinstance(data, dict) else {}
+
+    def _write(self, data: Dict[str, Dict]):
+        write_json(self.path, data, indent=2, sort_keys=True)
+
+    def _entry(self, data: Dict[str, Dict]) -> Dict:
+        entry = data.get(self.tag)
+        if not isinstance(entry, dict) or entry.get('commit') != self.commit:
+            return {}
+        return entry
+
+    def started(self) -> bool:
+        """
+        Whether a release of this tag from this commit passed its checks but has not
+        yet finished, and so can be resumed.
+        """
+        with _lock:
+            return bool(self._entry(self._read()))
+
+    def completed(self) -> Set[str]:
+        """
+        The keys of the actions already completed for this tag and commit.
+        """
+        with _lock:
+            return set(self._entry(self._read()).get('actions', ()))
+
+    def pushes(self) -> Dict[str, Dict[str, bool]]:
+        """
+        The tags to be pushed to each remote that were batched by completed actions
+        but not pushed, as described in :class:`~carthorse.actions.Pushes`.
+        """
+        with _lock:
+            return self._entry(self._read()).get('pushes', {})
+
+    def record(self, *keys: str, pushes: Optional[Dict[str, Dict[str, bool]]] = None):
+        """
+        Record that the actions with the keys supplied have been completed, along
+        with any tags they batched that have yet to be pushed. Recording no keys marks
+        the release as started. Any record for another commit of this tag is discarded.
+        """
+        with _lock:
+            data = self._read()
+            entry = self._entry(data)
+            done = entry.get('actions', [])
+            data[self.tag] = {
+                'commit': self.commit,
+                'actions': [*done, *(key for key in keys if key not in done)],
+                'pushes': entry.get('pushes', {}) if pushes is None else pushes,
+            }
+            self._write(data)
+
+    def clear(self):
+        """
+        Discard the record for this tag, once there is nothing left to resume.
+        """
+        with _lock:
+            data = self._read()
+            if data.pop(self.tag, None) is not None:
+                self._write(data)
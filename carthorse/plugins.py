@@ -1,6 +1,163 @@
+import json
+import os
+import sys
 from collections import defaultdict
+from collections.abc import MutableMapping
+from hashlib import sha256
+from importlib.metadata import entry_points, EntryPoint
+from pathlib import Path
+from typing import Callable, Dict, Iterator, List, Optional
 
-from importlib.metadata import entry_points
+from .documents import write_json
+
+TYPES = 'version_from', 'when', 'actions'
+
+#: Rough estimates, in seconds, of how long a plugin with each cost will take.
+COSTS = {
+    'local': 0.001,
+    'subprocess': 0.05,
+    'network': 1.0,
+}
+
+
+def cost(locality: str):
+    """
+    A decorator for declaring how expensive a plugin is likely to be, so that cheap
+    checks can be performed first. ``locality`` should be one of ``'local'``,
+    ``'subprocess'`` or ``'network'``.
+    """
+    if locality not in COSTS:
+        raise ValueError(f'cost must be one of {tuple(COSTS)!r}, not {locality!r}')
+
+    def decorator(plugin):
+        plugin.cost = locality
+        return plugin
+
+    return decorator
+
+
+def estimate(plugin: Callable) -> float:
+    """
+    The estimated cost of calling a plugin, where plugins that don't declare a cost
+    are assumed to be as expensive as those that use the network.
+    """
+    return COSTS[getattr(plugin, 'cost', 'network')]
+
+
+class LazyPlugins(MutableMapping):
+    """
+    A mapping of names to plugins, where plugins registered from entrypoints are
+    only imported the first time they are looked up.
+    """
+
+    def __init__(self):
+        self.entry_points: Dict[str, EntryPoint] = {}
+        self.loaded: Dict[str, Callable] = {}
+
+    def register(self, entrypoint: EntryPoint):
+        self.entry_points[entrypoint.name] = entrypoint
+        self.loaded.pop(entrypoint.name, None)
+
+    def __getitem__(self, name: str) -> Callable:
+        plugin = self.loaded.get(name)
+        if plugin is None:
+            plugin = self.loaded[name] = self.entry_points[name].load()
+        return plugin
+
+    def __setitem__(self, name: str, plugin: Callable):
+        self.loaded[name] = plugin
+
+    def __delitem__(self, name: str):
+        found = self.loaded.pop(name, None) is not None
+        found = self.entry_points.pop(name, None) is not None or found
+        if not found:
+            raise KeyError(name)
+
+    def __contains__(self, name) -> bool:
+        return name in self.loaded or name in self.entry_points
+
+    def __iter__(self) -> Iterator[str]:
+        return iter(dict.fromkeys([*self.entry_points, *self.loaded]))
+
+    def __len__(self) -> int:
+        return len(self.entry_points.keys() | self.loaded.keys())
+
+    def __repr__(self):
+        return f'<{type(self).__name__}: {", ".join(self)}>'
+
+
+def cache_path() -> Optional[Path]:
+    """
+    The path of the entrypoint cache. ``$CARTHORSE_CACHE`` can be used to specify
+    the directory containing it, or set to an empty string to disable caching.
+    """
+    directory = os.environ.get('CARTHORSE_CACHE')
+    if directory == '':
+        return None
+    if directory is None:
+        directory = Path(os.environ.get('XDG_CACHE_HOME') or Path.home() / '.cache', 'carthorse')
+    return Path(directory, 'entry-points.json')
+
+
+#: The suffixes of the directories holding an installed distribution's metadata.
+METADATA = '.dist-info', '.egg-info'
+
+
+def fingerprint() -> str:
+    """
+    A fingerprint of the directories on ``sys.path`` and of the entry points of the
+    distributions in them, which changes when distributions are installed into, or
+    removed from, any of them, or when their entry points are edited in place.
+    """
+    hash = sha256()
+    for entry in sys.path:
+        path = entry or '.'
+        try:
+            stat = os.stat(path)
+        except OSError:
+            continue
+        hash.update(f'{entry}\0{stat.st_ino}\0{stat.st_mtime_ns}\n'.encode())
+        try:
+            with os.scandir(path) as entries:
+                names = sorted(e.name for e in entries if e.name.endswith(METADATA))
+        except OSError:
+            continue
+        for name in names:
+            try:
+                mtime = os.stat(os.path.join(path, name, 'entry_points.txt')).st_mtime_ns
+            except OSError:
+                mtime = None
+            hash.update(f'{name}\0{mtime}\n'.encode())
+    return hash.hexdigest()
+
+
+def discover() -> List[EntryPoint]:
+    """
+    Find the entrypoints for all types of plugin, using the entrypoint cache where
+    it is still valid for the installed distributions.
+    """
+    path = cache_path()
+    current = fingerprint()
+    if path is not None:
+        try:
+            cached = json.loads(path.read_text())
+        except (OSError, ValueError):
+            pass
+        else:
+            if cached.get('fingerprint') == current:
+                return [EntryPoint(*spec) for spec in cached['entry_points']]
+    installed = entry_points()
+    found = [ep for type in TYPES for ep in installed.select(group='carthorse.'+type)]
+    if path is not None:
+        try:
+            path.parent.mkdir(parents=True, exist_ok=True)
+            write_json(path, {
+                'fingerprint': current,
+                'entry_points': [(ep.name, ep.value, ep.group) for ep in found],
+            })
+        except OSError:
+            pass
+    return found
 
 
 class Plugins(defaultdict):
@@ -8,11 +165,10 @@ class Plugins(defaultdict):
     @classmethod
     def load(cls):
         """
-        Load plugins from entrypoints specified in packages and register them
+        Register plugins from entrypoints specified in packages. Plugins are only
+        imported when first used.
         """
-        plugins = Plugins(dict)
-        for type in 'version_from', 'when', 'actions':
-            for entrypoint in entry_points(group='carthorse.'+type):
-                plugin = entrypoint.load()
-                plugins[type][entrypoint.name] = plugin
+        plugins = Plugins(LazyPlugins)
+        for entrypoint in discover():
+            plugins[entrypoint.group[len('carthorse.'):]].register(entrypoint)
         return plugins
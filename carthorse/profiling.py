@@ -0,0 +1,137 @@
+import cProfile
+import os
+import pstats
+import sys
+from collections import Counter, defaultdict
+from contextlib import contextmanager
+from threading import Event, Lock, Thread, get_ident
+from types import FrameType
+from typing import Dict, Iterator, Optional, Type
+
+#: The default number of seconds between the samples taken by :class:`StackSampler`.
+INTERVAL = 0.005
+
+
+class Profiler(object):
+    """
+    Profiles the phases of a carthorse run. This base class does nothing, so can be
+    used when no profiling is wanted.
+    """
+
+    @contextmanager
+    def phase(self, name: str) -> Iterator[None]:
+        """
+        Profile the code run within the ``with`` block as part of the named phase.
+        """
+        yield
+
+    def close(self):
+        """
+        Stop profiling and write out the results.
+        """
+
+
+class CProfiler(Profiler):
+    """
+    Profile each phase using :mod:`cProfile`, writing a ``<phase>.pstats`` file for each
+    phase to ``directory`` that can be read using :mod:`pstats`.
+
+    Only one phase is profiled at a time, so if phases overlap, such as when projects
+    are released at the same time, the later ones are included in the earliest.
+    """
+
+    def __init__(self, directory: str):
+        os.makedirs(directory, exist_ok=True)
+        self.directory = directory
+        self.stats: Dict[str, pstats.Stats] = {}
+        self.lock = Lock()
+        self.active = False
+
+    @contextmanager
+    def phase(self, name):
+        with self.lock:
+            nested, self.active = self.active, True
+        if nested:
+            yield
+            return
+        profile = cProfile.Profile()
+        profile.enable()
+        try:
+            yield
+        finally:
+            profile.disable()
+            with self.lock:
+                if name in self.stats:
+                    self.stats[name].add(profile)
+                else:
+                    self.stats[name] = pstats.Stats(profile)
+                self.active = False
+
+    def close(self):
+        for name, stats in self.stats.items():
+            stats.dump_stats(os.path.join(self.directory, name+'.pstats'))
+
+
+def collapse(frame: Optional[FrameType]) -> str:
+    """
+    Describe the stack ending in the supplied frame, outermost call first, in the
+    collapsed format used by flame graph tools.
+    """
+    names = []
+    while frame is not None:
+        code = frame.f_code
+        module = frame.f_globals.get('__name__', '?')
+        names.append(f'{module}:{code.co_qualname}'.replace(';', ':'))
+        frame = frame.f_back
+    return ';'.join(reversed(names))
+
+
+class StackSampler(Profiler):
+    """
+    Profile by sampling the stacks of all threads every ``interval`` seconds, which adds
+    far less overhead than :class:`CProfiler`. A ``<phase>.collapsed`` file is written
+    for each phase to ``directory``, with a line for each stack seen and the number of
+    times it was seen, suitable for passing to flame graph tools.
+
+    As this measures wall clock time, threads that are waiting are also included.
+    """
+
+    def __init__(self, directory: str, interval: float = INTERVAL):
+        os.makedirs(directory, exist_ok=True)
+        self.directory = directory
+        self.interval = interval
+        self.samples: Dict[str, Counter] = defaultdict(Counter)
+        self.current = 'carthorse'
+        self.stopped = Event()
+        self.thread = Thread(target=self.sample, name='carthorse-sampler', daemon=True)
+        self.thread.start()
+
+    def sample(self):
+        me = get_ident()
+        while not self.stopped.wait(self.interval):
+            counts = self.samples[self.current]
+            for ident, frame in sys._current_frames().items():
+                if ident != me:
+                    counts[collapse(frame)] += 1
+
+    @contextmanager
+    def phase(self, name):
+        previous, self.current = self.current, name
+        try:
+            yield
+        finally:
+            self.current = previous
+
+    def close(self):
+        self.stopped.set()
+        self.thread.join()
+        for name, counts in self.samples.items():
+            with open(os.path.join(self.directory, name+'.collapsed'), 'w') as target:
+                for stack, count in counts.most_common():
+                    target.write(f'{stack} {count}\n')
+
+
+PROFILERS: Dict[str, Type[Profiler]] = {
+    'cprofile': CProfiler,
+    'sample': StackSampler,
+}
@@ -0,0 +1,153 @@
+import os
+import re
+from mmap import mmap, ACCESS_READ
+from pathlib import Path
+from typing import Mapping, Optional, Union
+
+Data = Union[bytes, mmap]
+
+# Anything git itself would refuse as a ref name, so we never wander outside the ref store:
+INVALID_REF = re.compile(r'(^/|/$|//|\.\.|@\{|/\.|^\.|\.lock(/|$)|[\x00-\x20\x7f~^:?*\[\\])')
+
+
+class UnsupportedRepository(Exception):
+    """
+    Raised when a repository's refs cannot be read in-process, such as when it is
+    using the reftable format, or when no repository can be found.
+    """
+
+
+class RefStore(object):
+    """
+    A minimal, read-only view of a repository's "files" ref store, for looking up refs
+    without spawning ``git``.
+    """
+
+    max_depth = 5
+
+    def __init__(self, git_dir: Path, common_dir: Path):
+        self.git_dir = git_dir
+        self.common_dir = common_dir
+
+    @classmethod
+    def find(
+            cls, path: Union[str, Path] = '.', env: Optional[Mapping[str, str]] = None
+    ) -> 'RefStore':
+        """
+        Find the repository containing the supplied path, honouring ``$GIT_DIR`` in
+        the supplied environment, or this process's environment if none is supplied.
+        """
+        git_dir_env = (os.environ if env is None else env).get('GIT_DIR')
+        if git_dir_env:
+            git_dir = Path(path, git_dir_env)
+        else:
+            git_dir = cls._discover(Path(path).resolve())
+        common_dir = git_dir
+        commondir_file = git_dir / 'commondir'
+        if commondir_file.exists():
+            common_dir = git_dir / commondir_file.read_text().strip()
+        cls._check_format(common_dir)
+        return cls(git_dir, common_dir)
+
+    @staticmethod
+    def _discover(path: Path) -> Path:
+        for candidate in (path, *path.parents):
+            dot_git = candidate / '.git'
+            if dot_git.is_dir():
+                return dot_git
+            if dot_git.is_file():
+                content = dot_git.read_text().strip()
+                if not content.startswith('gitdir:'):
+                    raise UnsupportedRepository(f'unexpected content in {dot_git}')
+                return candidate / content[len('gitdir:'):].strip()
+        raise UnsupportedRepository(f'no git repository found at {path}')
+
+    @staticmethod
+    def _check_format(common_dir: Path):
+        if (common_dir / 'reftable').exists():
+            raise UnsupportedRepository(f'{common_dir} uses reftable')
+        try:
+            config = (common_dir / 'config').read_text()
+        except FileNotFoundError:
+            raise UnsupportedRepository(f'{common_dir} has no config')
+        for line in config.splitlines():
+            key, _, value = line.partition('=')
+            if key.strip().lower() == 'refstorage' and value.strip().lower() != 'files':
+                raise UnsupportedRepository(f'{common_dir} uses {value.strip()} refs')
+
+    def resolve(self, name: str) -> Optional[str]:
+        """
+        Return the object id the named ref points to, following symbolic refs, or
+        ``None`` if it does not exist.
+        """
+        for _ in range(self.max_depth):
+            if INVALID_REF.search(name):
+                return None
+            value = self._loose(name)
+            if value is None:
+                return self._packed(name)
+            if not value.startswith('ref:'):
+                return value
+            name = value[len('ref:'):].strip()
+        return None
+
+    def _loose(self, name: str) -> Optional[str]:
+        base = self.common_dir if name.startswith('refs/') else self.git_dir
+        try:
+            return (base / name).read_text().strip()
+        except (FileNotFoundError, NotADirectoryError, IsADirectoryError):
+            return None
+
+    def _packed(self, name: str) -> Optional[str]:
+        try:
+            source = open(self.common_dir / 'packed-refs', 'rb')
+        except FileNotFoundError:
+            return None
+        with source:
+            if os.fstat(source.fileno()).st_size == 0:
+                return None
+            with mmap(source.fileno(), 0, access=ACCESS_READ) as data:
+                return search_packed(data, name.encode())
+
+
+def _record(data: Data, start: int) -> tuple[int, bytes, bytes]:
+    end = data.find(b'\n', start)
+    if end == -1:
+        end = len(data)
+    oid, _, name = data[start:end].rstrip(b'\r').partition(b' ')
+    return end + 1, oid, name
+
+
+def search_packed(data: Data, name: bytes) -> Optional[str]:
+    """
+    Find the named ref in the content of a ``packed-refs`` file, using a binary search
+    when the file declares that it is sorted.
+    """
+    lo = 0
+    sorted_ = False
+    if data[:1] == b'#':
+        lo, _, header = _record(data, 0)
+        sorted_ = b' sorted' in header
+    if not sorted_:
+        while lo < len(data):
+            lo, oid, ref = _record(data, lo)
+            if ref == name:
+                return oid.decode()
+        return None
+    hi = len(data)
+    while lo < hi:
+        mid = (lo + hi) // 2
+        start = data.rfind(b'\n', lo, mid) + 1 or lo
+        if data[start:start+1] == b'^':
+            # peeled line, step back to the record it belongs to:
+            start = data.rfind(b'\n', lo, start - 1) + 1 or lo
+        end, oid, ref = _record(data, start)
+        if ref == name:
+            return oid.decode()
+        if ref < name:
+            lo = end
+            if data[lo:lo+1] == b'^':
+                lo, _, _ = _record(data, lo)
+        else:
+            hi = start
+    return None
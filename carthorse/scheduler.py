@@ -0,0 +1,154 @@
+from concurrent.futures import ThreadPoolExecutor, wait, FIRST_COMPLETED, Future
+from contextvars import copy_context
+from typing import Callable, Dict, List, Optional, Sequence, Set
+
+from .context import cancellable
+from .execution import Cancellation
+
+
+def dependencies(items: Sequence[Dict]) -> List[Set[int]]:
+    """
+    Work out the indexes of the items each item depends on. An item that specifies
+    ``needs`` depends only on the earlier items with those ids, while an item that
+    does not depends on all earlier items.
+    """
+    ids: Dict[str, int] = {}
+    result = []
+    for index, item in enumerate(items):
+        needs = item.get('needs')
+        if needs is None:
+            result.append(set(range(index)))
+        else:
+            if isinstance(needs, str):
+                needs = [needs]
+            required = set()
+            for id_ in needs:
+                if id_ not in ids:
+                    raise ValueError(
+                        f'{item["name"]!r} needs {id_!r}, which is not the id of an earlier action'
+                    )
+                required.add(ids[id_])
+            result.append(required)
+        id_ = item.get('id')
+        if id_ is not None:
+            if id_ in ids:
+                raise ValueError(f'More than one action has an id of {id_!r}')
+            ids[id_] = index
+    return result
+
+
+def dependency_order(needs: Dict[str, Sequence[str]]) -> List[str]:
+    """
+    Order the names supplied so that each comes after all of the names it needs,
+    otherwise keeping the order in which they were supplied.
+    """
+    for name, required in needs.items():
+        for other in required:
+            if other not in needs:
+                raise ValueError(f'{name!r} needs {other!r}, which does not exist')
+    ordered: List[str] = []
+    remaining = dict(needs)
+    while remaining:
+        for name, required in remaining.items():
+            if set(required) <= set(ordered):
+                break
+        else:
+            raise ValueError(f"Circular dependency between {', '.join(map(repr, remaining))}")
+        ordered.append(name)
+        del remaining[name]
+    return ordered
+
+
+def run_in_order(items: Sequence[Dict], call: Callable[[Dict], object], jobs: int = 1):
+    """
+    Call ``call`` for each item once all the items it depends on have succeeded, with
+    up to ``jobs`` calls in progress at once. Once a call fails, no more are started, and
+    the failure is raised once those already in progress have finished.
+    """
+    depends_on = dependencies(items)
+    if jobs <= 1:
+        for item in items:
+            call(item)
+        return
+    pending = list(range(len(items)))
+    succeeded: Set[int] = set()
+    running: Dict[Future, int] = {}
+    failure = None
+    with ThreadPoolExecutor(max_workers=jobs) as executor:
+        while True:
+            if failure is None:
+                for index in list(pending):
+                    if len(running) < jobs and depends_on[index] <= succeeded:
+                        future = executor.submit(copy_context().run, call, items[index])
+                        running[future] = index
+                        pending.remove(index)
+            if not running:
+                break
+            finished, _ = wait(running, return_when=FIRST_COMPLETED)
+            for future in finished:
+                index = running.pop(future)
+                exception = future.exception()
+                if exception is None:
+                    succeeded.add(index)
+                elif failure is None:
+                    failure = exception
+    if failure is not None:
+        raise failure
+
+
+def first_failure(
+        items: Sequence[Dict], call: Callable[[Dict], object], jobs: int = 1
+) -> Optional[Dict]:
+    """
+    Return the first item, in the order given, for which ``call`` returns a false value,
+    or ``None`` if it returns a true value for all of them.
+
+    If ``jobs`` is more than one, up to that many calls will be made at once. As soon as a
+    call fails, calls for later items that have not started are cancelled, and those in
+    progress are cancelled by killing any commands they are running. All calls in
+    progress are waited for, so nothing is still running once this returns, and the
+    result, or any exception raised, is the same as when the calls are made one at a time.
+    """
+    if jobs <= 1:
+        for item in items:
+            if not call(item):
+                return item
+        return None
+    cancellations = [Cancellation() for _ in items]
+
+    def cancellable_call(index):
+        with cancellable(cancellations[index]):
+            return call(items[index])
+
+    with ThreadPoolExecutor(max_workers=jobs) as executor:
+        futures = [executor.submit(copy_context().run, cancellable_call, index)
+                   for index in range(len(items))]
+        indexes = {future: index for index, future in enumerate(futures)}
+        failed = None
+        remaining = set(futures)
+        while remaining:
+            finished, remaining = wait(remaining, return_when=FIRST_COMPLETED)
+            for future in finished:
+                index = indexes[future]
+                if future.cancelled() or (failed is not None and index > failed):
+                    continue
+                if future.exception() is not None or not future.result():
+                    if failed is None or index < failed:
+                        failed = index
+                        for later in range(failed+1, len(items)):
+                            futures[later].cancel()
+                            cancellations[later].cancel()
+    if failed is None:
+        return None
+    # raise any exception from the failed call:
+    futures[failed].result()
+    return items[failed]
+
+
+def by_cost(items: Sequence[Dict], costs: Sequence[float]) -> List[Dict]:
+    """
+    Order items cheapest first, keeping the configured order for items of equal cost.
+    """
+    return [item for _, _, item in sorted(
+        zip(costs, range(len(items)), items), key=lambda entry: entry[:2]
+    )]
@@ -0,0 +1,147 @@
+import json
+import os
+import secrets
+import shlex
+from contextlib import contextmanager
+from contextvars import ContextVar
+from dataclasses import dataclass, asdict, field
+from datetime import datetime, timezone
+from time import perf_counter, thread_time
+from typing import Dict, Iterator, List, Optional, Sequence
+
+
+def children_cpu() -> float:
+    times = os.times()
+    return times.children_user + times.children_system
+
+
+def describe(item: Dict) -> str:
+    """
+    A short description of a plugin call from its expanded configuration.
+    """
+    name = item['name']
+    if item['args']:
+        name += ': ' + ' '.join(
+            shlex.join(arg) if isinstance(arg, list) else str(arg) for arg in item['args']
+        )
+    return name
+
+
+@dataclass
+class Timing:
+    phase: str
+    name: str
+    #: When this phase started, in seconds since the epoch.
+    start: float = 0
+    #: Elapsed wall clock time in seconds.
+    wall: float = 0
+    #: CPU time used by the thread running the phase, in seconds.
+    cpu: float = 0
+    #: CPU time used by child processes that finished during the phase, in seconds.
+    children_cpu: float = 0
+    error: Optional[str] = None
+    #: The resources used by each command run during the phase, see
+    #: :class:`~carthorse.execution.Usage`.
+    commands: List[Dict] = field(default_factory=list)
+    #: Identifies this phase when it is exported as a span.
+    span_id: str = field(default_factory=lambda: secrets.token_hex(8))
+    #: The ``span_id`` of the phase this one happened within, if any.
+    parent_id: Optional[str] = None
+
+    @property
+    def max_rss(self) -> Optional[int]:
+        sizes = [command['max_rss'] for command in self.commands if command['max_rss']]
+        return max(sizes) if sizes else None
+
+
+#: The :class:`Timing` being recorded, to which commands that are run should be added.
+recording: ContextVar[Optional[Timing]] = ContextVar('recording', default=None)
+
+
+def format_table(rows: Sequence[Sequence[str]], left: int) -> str:
+    """
+    Format rows of strings as a table, with the first ``left`` columns left-aligned
+    and the rest right-aligned.
+    """
+    widths = [max(len(row[i]) for row in rows) for i in range(len(rows[0]))]
+    lines = []
+    for row in rows:
+        values = [value.ljust(width) if i < left else value.rjust(width)
+                  for i, (value, width) in enumerate(zip(row, widths))]
+        lines.append('  '.join(values).rstrip())
+    return '\n'.join(lines)
+
+
+class Timings(object):
+    """
+    A record of how long each phase of a carthorse run, and each plugin call within
+    it, took.
+    """
+
+    def __init__(self):
+        self.entries: List[Timing] = []
+        self.attributes: Dict[str, str] = {}
+
+    @contextmanager
+    def record(self, phase: str, name: str = '') -> Iterator[Timing]:
+        parent = recording.get()
+        timing = Timing(
+            phase, name, start=datetime.now(timezone.utc).timestamp(),
+            parent_id=None if parent is None else parent.span_id,
+        )
+        wall, cpu, children = perf_counter(), thread_time(), children_cpu()
+        token = recording.set(timing)
+        try:
+            yield timing
+        except BaseException as e:
+            timing.error = repr(e)
+            raise
+        finally:
+            recording.reset(token)
+            timing.wall = perf_counter() - wall
+            timing.cpu = thread_time() - cpu
+            timing.children_cpu = children_cpu() - children
+            self.entries.append(timing)
+
+    def table(self) -> str:
+        rows = [('phase', 'name', 'wall', 'cpu', 'children', 'max rss')]
+        for timing in sorted(self.entries, key=lambda t: t.start):
+            name = timing.name if len(timing.name) <= 40 else timing.name[:37]+'...'
+            if timing.error:
+                name += ' (error)'
+            rows.append((
+                timing.phase,
+                name,
+                f'{timing.wall:.3f}s',
+                f'{timing.cpu:.3f}s',
+                f'{timing.children_cpu:.3f}s',
+                '' if timing.max_rss is None else f'{timing.max_rss / 2**20:.1f}M',
+            ))
+        return format_table(rows, left=2)
+
+    def as_dict(self) -> Dict:
+        return {
+            'attributes': self.attributes,
+            'timings': [asdict(timing) for timing in self.entries],
+        }
+
+    @staticmethod
+    def previous(path: str, phase: str) -> Dict[str, float]:
+        """
+        Read the wall clock times of successful calls in the specified phase from
+        timings written by an earlier run, returning an empty mapping if there are none.
+        """
+        try:
+            with open(path) as source:
+                data = json.load(source)
+        except (OSError, ValueError):
+            return {}
+        return {
+            timing['name']: timing['wall']
+            for timing in data.get('timings', ())
+            if timing.get('phase') == phase and not timing.get('error')
+        }
+
+    def write(self, path: str):
+        with open(path, 'w') as target:
+            json.dump(self.as_dict(), target, indent=2)
@@ -0,0 +1,113 @@
+import json
+import secrets
+from importlib.metadata import version, PackageNotFoundError
+from typing import Dict, List, Optional
+
+from .timing import Timings
+
+SPAN_KIND_INTERNAL = 1
+STATUS_CODE_ERROR = 2
+
+
+def attribute(key: str, value) -> Dict:
+    """
+    An OpenTelemetry attribute, encoded as JSON.
+    """
+    if isinstance(value, bool):
+        encoded = {'boolValue': value}
+    elif isinstance(value, int):
+        encoded = {'intValue': str(value)}
+    elif isinstance(value, float):
+        encoded = {'doubleValue': value}
+    else:
+        encoded = {'stringValue': str(value)}
+    return {'key': key, 'value': encoded}
+
+
+def nanoseconds(seconds: float) -> str:
+    # rounded to the microsecond to avoid floating point noise:
+    return str(round(seconds * 1_000_000) * 1000)
+
+
+def span(
+        trace_id: str, span_id: str, parent_id: Optional[str], name: str,
+        start: float, wall: float, attributes: Dict, error: Optional[str],
+) -> Dict:
+    result = {
+        'traceId': trace_id,
+        'spanId': span_id,
+        'name': name,
+        'kind': SPAN_KIND_INTERNAL,
+        'startTimeUnixNano': nanoseconds(start),
+        'endTimeUnixNano': nanoseconds(start + wall),
+        'attributes': [
+            attribute(key, value) for key, value in attributes.items() if value is not None
+        ],
+    }
+    if parent_id is not None:
+        result['parentSpanId'] = parent_id
+    if error is not None:
+        result['status'] = {'code': STATUS_CODE_ERROR, 'message': error}
+    return result
+
+
+def spans(timings: Timings, trace_id: str) -> List[Dict]:
+    """
+    Return a span for each phase recorded in the timings, along with a span for each
+    command run during those phases.
+    """
+    result = []
+    for timing in sorted(timings.entries, key=lambda t: t.start):
+        attributes = {'carthorse.phase': timing.phase, 'carthorse.name': timing.name or None}
+        if timing.parent_id is None:
+            for key, value in timings.attributes.items():
+                attributes['carthorse.'+key] = value
+        result.append(span(
+            trace_id, timing.span_id, timing.parent_id,
+            f'{timing.phase}: {timing.name}' if timing.name else timing.phase,
+            timing.start, timing.wall, attributes, timing.error,
+        ))
+        for command in timing.commands:
+            returncode = command.get('returncode')
+            if returncode is None:
+                error = 'did not finish'
+            elif returncode:
+                error = f'returncode={returncode}'
+            else:
+                error = None
+            result.append(span(
+                trace_id, secrets.token_hex(8), timing.span_id, command['command'],
+                command['start'], command['wall'], {
+                    'process.command_line': command['command'],
+                    'process.exit.code': returncode,
+                    'carthorse.cpu.user': command['user'],
+                    'carthorse.cpu.system': command['system'],
+                    'carthorse.memory.max_rss': command['max_rss'],
+                    'carthorse.disk.blocks_read': command['inblock'],
+                    'carthorse.disk.blocks_written': command['oublock'],
+                }, error,
+            ))
+    return result
+
+
+def as_otlp(timings: Timings) -> Dict:
+    """
+    Return the timings as a trace in the OpenTelemetry protocol's JSON encoding.
+    """
+    scope = {'name': 'carthorse'}
+    try:
+        scope['version'] = version('carthorse')
+    except PackageNotFoundError:  # pragma: no cover
+        pass
+    return {'resourceSpans': [{
+        'resource': {'attributes': [attribute('service.name', 'carthorse')]},
+        'scopeSpans': [{
+            'scope': scope,
+            'spans': spans(timings, secrets.token_hex(16)),
+        }],
+    }]}
+
+
+def write_trace(timings: Timings, path: str):
+    with open(path, 'w') as target:
+        json.dump(as_otlp(timings), target, indent=2)
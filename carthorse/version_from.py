@@ -1,42 +1,130 @@
-import os
+import ast
 import re
+from codecs import getincrementaldecoder
+from collections import Counter
+from io import IncrementalNewlineDecoder
 from pathlib import Path
-from subprocess import check_output
+from typing import Optional
 
 import toml
 
+from .actions import capture
+from .context import current
+from .documents import documents
+
 
 def pyproject():
-    with open('pyproject.toml') as source:
-        data = toml.load(source)
-        return data['project']['version']
+    data = documents.load(current().path('pyproject.toml'), toml.load)
+    return data['project']['version']
 
 
 def poetry():
-    with open('pyproject.toml') as source:
-        data = toml.load(source)
-        return data['tool']['poetry']['version']
+    data = documents.load(current().path('pyproject.toml'), toml.load)
+    return data['tool']['poetry']['version']
 
 
-def setup_py(python='python'):
-    return check_output([python, 'setup.py', '--version']).decode('ascii').strip()
+# Versions that setuptools would report unchanged, see PEP 440's normalization rules:
+NORMALIZED_VERSION = re.compile(
+    r'([1-9][0-9]*!)?(0|[1-9][0-9]*)(\.(0|[1-9][0-9]*))*'
+    r'((a|b|rc)(0|[1-9][0-9]*))?(\.post(0|[1-9][0-9]*))?(\.dev(0|[1-9][0-9]*))?'
+    r'(\+[a-z0-9]+(\.[a-z0-9]+)*)?'
+)
 
 
-def file(path, pattern='(?P<version>.*)'):
-    with open(path) as source:
-        match = re.search(pattern, source.read())
-        if match is None:
-            raise ValueError(f'{pattern} not found in {path}')
+def static_setup_py(path='setup.py') -> Optional[str]:
+    """
+    Find the version passed to ``setup()`` without executing the ``setup.py``.
+    This only succeeds if the version is a string literal, or a module-level
+    constant that is only assigned once, and is already normalized.
+    """
+    with open(current().path(path)) as source:
         try:
-            version = match.group('version')
-        except IndexError:
-            raise ValueError(f"pattern {pattern} has no group named 'version'")
-        return version.strip()
+            tree = ast.parse(source.read(), path)
+        except SyntaxError:
+            # it may be for a different version of python:
+            return None
+    assignments = Counter(
+        node.id for node in ast.walk(tree)
+        if isinstance(node, ast.Name) and not isinstance(node.ctx, ast.Load)
+    )
+    constants = {}
+    for node in tree.body:
+        if isinstance(node, (ast.Assign, ast.AnnAssign)) and isinstance(node.value, ast.Constant):
+            for target in getattr(node, 'targets', [getattr(node, 'target', None)]):
+                if isinstance(target, ast.Name) and assignments[target.id] == 1:
+                    constants[target.id] = node.value.value
+    versions = []
+    for node in ast.walk(tree):
+        if isinstance(node, ast.Call) and (
+            getattr(node.func, 'id', None) == 'setup' or getattr(node.func, 'attr', None) == 'setup'
+        ):
+            for keyword in node.keywords:
+                if keyword.arg == 'version':
+                    if isinstance(keyword.value, ast.Constant):
+                        versions.append(keyword.value.value)
+                    elif isinstance(keyword.value, ast.Name):
+                        versions.append(constants.get(keyword.value.id))
+                    else:
+                        versions.append(None)
+    if len(versions) == 1:
+        version, = versions
+        if isinstance(version, str) and NORMALIZED_VERSION.fullmatch(version):
+            return version
+    return None
+
+
+def setup_py(python='python'):
+    version = static_setup_py()
+    if version is None:
+        # stderr is included, but the version is the last thing printed:
+        lines = capture([python, 'setup.py', '--version']).strip().splitlines()
+        version = lines[-1].strip() if lines else ''
+    return version
+
+
+#: The number of bytes first read when searching a file for a version.
+CHUNK_SIZE = 64 * 1024
+
+
+def file(path, pattern='(?P<version>.*)', limit=None):
+    """
+    Extract the version from the first match of ``pattern`` in the file, looking no
+    further than ``limit`` bytes into it if specified. The file is decoded and searched
+    in growing chunks, stopping once a match is found that ends before the text read so
+    far, so huge files need not be read in full.
+    """
+    regex = re.compile(pattern)
+    decoder = IncrementalNewlineDecoder(getincrementaldecoder('utf-8')('replace'), translate=True)
+    text = ''
+    size = CHUNK_SIZE
+    remaining = limit
+    with open(current().path(path), 'rb') as source:
+        while True:
+            chunk = source.read(size if remaining is None else min(size, remaining))
+            if remaining is not None:
+                remaining -= len(chunk)
+            final = not chunk
+            text += decoder.decode(chunk, final)
+            match = regex.search(text)
+            if final or (match is not None and match.end() < len(text)):
+                break
+            # doubling keeps the total searching proportional to the text read:
+            size *= 2
+    return _version_from(match, path, pattern).strip()
+
+
+def _version_from(match, path, pattern):
+    if match is None:
+        raise ValueError(f'{pattern} not found in {path}')
+    try:
+        return match.group('version')
+    except IndexError:
+        raise ValueError(f"pattern {pattern} has no group named 'version'")
 
 
 def flit(module):
     path = Path(module)
-    if path.is_dir():
+    if Path(current().cwd, path).is_dir():
         path = str(path / '__init__.py')
     else:
         path = str(path) + '.py'
@@ -48,4 +136,4 @@ def none():
 
 
 def env(variable='VERSION'):
-    return os.environ[variable]
+    return current().env[variable]
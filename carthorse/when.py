@@ -1,27 +1,122 @@
-import os
-
-from .actions import run
-
-
-def version_not_tagged(remote='origin'):
-    version = os.environ['TAG']
-    if run('git remote -v'):
-        run("git fetch {} 'refs/tags/*:refs/tags/*'".format(remote))
-    try:
-        run('git rev-parse --verify -q '+version)
-    except SystemExit as e:
-        if e.code == 1:
-            print('No tag found.')
-            return True
-        raise
+from pathlib import Path
+from threading import Lock
+from typing import Dict, Set, Tuple
+
+from .actions import run, display, execute
+from .context import current
+from .plugins import cost
+
+
+LOOKUPS = 'fetch', 'ls-remote'
+
+
+class TagSnapshot(object):
+    """
+    The tags in remote repositories, looked up no more than once for each remote of
+    each repository, however many projects are checked against them.
+    """
+
+    def __init__(self):
+        self.lock = Lock()
+        self.fetched: Set[Tuple[str, str]] = set()
+        self.listed: Dict[Tuple[str, str], Set[str]] = {}
+
+    @staticmethod
+    def key(remote: str) -> Tuple[str, str]:
+        """
+        The key for the remote of the repository being released, as projects can be in
+        different repositories with remotes of the same name, such as submodules.
+        """
+        context = current()
+        store = context.ref_store()
+        repository = Path(context.cwd if store is None else store.common_dir).resolve()
+        return str(repository), remote
+
+    def fetch(self, remote: str):
+        """
+        Fetch the remote's tags into the local repository, if not already done.
+        """
+        key = self.key(remote)
+        with self.lock:
+            if key not in self.fetched:
+                fetch_tags(remote)
+                self.fetched.add(key)
+
+    def tags(self, remote: str) -> Set[str]:
+        """
+        Return the names of the tags in the remote, listing them if not already done.
+        """
+        key = self.key(remote)
+        with self.lock:
+            if key not in self.listed:
+                command = ['git', 'ls-remote', '--tags', remote]
+                print('$ '+display(command), flush=True)
+                lines = []
+                returncode = execute(command, lines.append)
+                if returncode:
+                    print(''.join(lines), end='')
+                    print(f'returncode={returncode}')
+                    raise SystemExit(returncode)
+                self.listed[key] = {
+                    line.split()[1][len('refs/tags/'):]
+                    for line in lines if line.strip() and not line.rstrip().endswith('^{}')
+                }
+            return self.listed[key]
+
+
+def fetch_tags(remote):
+    run(['git', 'fetch', remote, 'refs/tags/*:refs/tags/*'])
+
+
+@cost('network')
+def version_not_tagged(remote='origin', lookup='fetch'):
+    context = current()
+    version = context.tag
+    if lookup not in LOOKUPS:
+        raise ValueError(f'lookup must be one of {LOOKUPS!r}, not {lookup!r}')
+    if run(['git', 'remote', '-v']):
+        if lookup == 'ls-remote':
+            if context.snapshot is None:
+                tagged = run(['git', 'ls-remote', '--tags', remote, 'refs/tags/'+version])
+            else:
+                tagged = version in context.snapshot.tags(remote)
+            if tagged:
+                print('Version is already tagged.')
+                return False
+        elif context.snapshot is None:
+            fetch_tags(remote)
+        else:
+            context.snapshot.fetch(remote)
+    if tag_rev(version) is None:
+        print('No tag found.')
+        return True
     else:
         print('Version is already tagged.')
         return False
 
 
+def tag_rev(tag):
+    """
+    Return the object id of the named tag in the repository being released, or ``None`` if
+    there is no such tag. The ref store is read directly where possible, with ``git``
+    used for repository formats that cannot be.
+    """
+    store = current().ref_store()
+    if store is None:
+        try:
+            return run(['git', 'rev-parse', '--verify', '-q', 'refs/tags/'+tag])
+        except SystemExit as e:
+            if e.code == 1:
+                return None
+            raise
+    return store.resolve('refs/tags/'+tag)
+
+
+@cost('local')
 def never():
     pass
 
 
+@cost('local')
 def always():
     return True
@@ -1,5 +1,6 @@
 import os
 import re
+import shlex
 from doctest import ELLIPSIS
 from functools import partial, reduce
 from operator import __getitem__
@@ -31,6 +32,13 @@ def dir():
             chdir(current)
 
 
+@pytest.fixture(autouse=True)
+def cache_dir(tmp_path_factory):
+    path = tmp_path_factory.mktemp('cache')
+    with Replace('os.environ.CARTHORSE_CACHE', str(path), strict=False):
+        yield path
+
+
 class GitHelper(object):
 
     repo = 'local/'
@@ -66,6 +74,21 @@ class GitHelper(object):
         self('add .', repo)
         self('commit -m initial', repo)
 
+    def make_clone(self, *mirrors: str) -> str:
+        """
+        Make a ``remote`` repository with some content and clone it as ``local``, along
+        with a bare clone of it for each of the mirrors, which are added to ``local`` as
+        remotes of the same name. ``local`` is made the current directory and the
+        commit it has checked out is returned.
+        """
+        self.make_repo_with_content('remote')
+        self('clone remote local', self.dir.path)
+        for mirror in mirrors:
+            self(f'clone --bare remote {mirror}', self.dir.path)
+            self(f'remote add {mirror} {self.dir.getpath(mirror)}')
+        os.chdir(self.dir.getpath('local'))
+        return self.rev_parse('HEAD')
+
 
 @pytest.fixture()
 def git(dir):
@@ -74,8 +97,7 @@ def git(dir):
 
 @pytest.fixture()
 def repo(git: GitHelper) -> Path:
-    git.make_repo_with_content('remote')
-    git('clone remote local', git.dir.path)
+    git.make_clone()
     repo = git.dir.as_path('local')
     remote = git.dir.as_path('remote')
     git(f'remote add upstream {remote}')
@@ -83,7 +105,6 @@ def repo(git: GitHelper) -> Path:
     (repo / 'foobar.py').write_text('__version__="2.0"\n')
     (repo / 'setup.py').write_text('version="3.0"\n')
     (repo / 'CHANGELOG.md').write_text('## 3.0.0\n')
-    os.chdir(repo)
     return repo
 
 
@@ -91,6 +112,9 @@ class ReadmeConfig(Config):
 
     def __init__(self, data: Dict, root_key: Sequence[str]):
         self.data = cast(Dict, reduce(__getitem__, root_key, data))
+        if 'projects' in self.data:
+            self.expand_projects()
+            return
         self.data['version-from'] = self.expand(self.data.get('version-from', 'env'))
         for name, default in (
                 ('when', 'always'),
@@ -101,7 +125,10 @@ class ReadmeConfig(Config):
 
 
 def run_config(
-        config: ReadmeConfig, *, expected_runs: Sequence = (), expected_phrases: Sequence = ()
+        config: ReadmeConfig, *,
+        expected_runs: Sequence = (),
+        expected_phrases: Sequence = (),
+        ordered: bool = True,
 ):
     actual = []
     environ = {'VERSION': '4.0', 'MYVERSION': '5.0'}
@@ -110,13 +137,17 @@ def run_config(
         return environ.get(match.group(1), '')
 
     def run(command):
-        actual.append(re.sub(r'\$(\w+)', envget, command))
+        if isinstance(command, str):
+            command = re.sub(r'\$(\w+)', envget, command)
+        else:
+            command = shlex.join(command)
+        actual.append(command)
 
     plugins = Plugins.load()
     plugins['actions']['run'] = run
     with Replace('os.environ', environ), OutputCapture(fd=True) as output:
         carthorse(config, plugins, dry_run=False)
-    compare(actual, expected=expected_runs)
+    compare(actual if ordered else sorted(actual), expected=expected_runs)
     assert not isinstance(expected_phrases, str)
     for phrase in expected_phrases:
         assert phrase in output.captured, f'{phrase!r} not in:\n{output.captured}'
@@ -136,5 +167,5 @@ pytest_collect_file = Sybil(
         CodeBlockParser('yaml', partial(make_config, parse_yaml)),
     ],
     patterns=['*.rst'],
-    fixtures=['repo']
+    fixtures=['repo', 'cache_dir']
 ).pytest()
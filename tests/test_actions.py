@@ -1,9 +1,13 @@
 import os
-from subprocess import CalledProcessError
+from subprocess import CalledProcessError, TimeoutExpired
 
 from testfixtures import compare, Replace, ShouldRaise, StringComparison
 
-from carthorse.actions import run, create_tag, update_major_tag
+from carthorse.actions import (
+    run, create_tag, update_major_tag, Pushes, push_tag, for_each_remote
+)
+from carthorse.context import RunContext, activated, time_limit
+from carthorse.execution import SubprocessBackend
 
 
 class TestRun(object):
@@ -24,8 +28,8 @@ class TestRun(object):
             capfd.readouterr().out,
             expected=StringComparison(
                 r'\$ /dev/null\n'
-                'returncode=126\n'
                 r'/bin/sh:( 1:)? /dev/null: Permission denied\n'
+                'returncode=126\n'
             ),
         )
 
@@ -36,9 +40,9 @@ class TestRun(object):
             capfd.readouterr().out,
             expected=(
                 '$ echo "stdout" >&1 && echo "stderr" >&2 && exit 32\n'
-                'returncode=32\n'
                 'stdout\n'
                 'stderr\n'
+                'returncode=32\n'
             ),
         )
 
@@ -52,6 +56,60 @@ class TestRun(object):
             ),
         )
 
+    def test_argv(self, capfd):
+        with Replace('os.environ.GREETING', 'hello', strict=False):
+            compare(run(['echo', '$GREETING', "it's"]), expected="$GREETING it's")
+        compare(capfd.readouterr().out, expected="$ echo '$GREETING' 'it'\"'\"'s'\n$GREETING it's\n")
+
+    def test_argv_not_found(self, capfd):
+        with ShouldRaise(SystemExit(127)):
+            run(['/does/not/exist', 'arg'])
+        compare(capfd.readouterr().out, expected=(
+            '$ /does/not/exist arg\n'
+            '/does/not/exist: No such file or directory\n'
+            'returncode=127\n'
+        ))
+
+    def test_argv_not_executable(self, capfd):
+        with ShouldRaise(SystemExit(126)):
+            run(['/dev/null'])
+        compare(capfd.readouterr().out, expected=(
+            '$ /dev/null\n'
+            '/dev/null: Permission denied\n'
+            'returncode=126\n'
+        ))
+
+    def test_time_limit(self, capfd):
+        with time_limit(0.2):
+            with ShouldRaise(TimeoutExpired('echo hello && sleep 5', 0.2)):
+                run('echo hello && sleep 5')
+        compare(capfd.readouterr().out, expected=(
+            '$ echo hello && sleep 5\nhello\ntimed out after 0.2s\n'
+        ))
+
+    def test_time_limit_already_passed(self, capfd):
+        with time_limit(0):
+            with ShouldRaise(TimeoutExpired(['touch', 'x'], 0)):
+                run(['touch', 'x'])
+        assert not os.path.exists('x')
+        compare(capfd.readouterr().out, expected='$ touch x\ntimed out after 0s\n')
+
+    def test_invalid_utf8_output(self, capfd):
+        run(r"printf 'caf\351\n'")
+        compare(capfd.readouterr().out, expected="$ printf 'caf\\351\\n'\ncaf\ufffd\n")
+
+    def test_output_bounded(self, capfd):
+        with Replace('carthorse.actions.TAIL_LINES', 2):
+            result = run('seq 1 5')
+        compare(result, expected='4\n5')
+        compare(capfd.readouterr().out, expected='$ seq 1 5\n1\n2\n3\n4\n5\n')
+
+    def test_output_bounded_without_newlines(self, capfd):
+        with Replace('carthorse.actions.TAIL_LINES', 2), Replace('carthorse.execution.MAX_LINE', 3):
+            result = run("printf 'aaabbbccc'")
+        compare(result, expected='bbbccc')
+        compare(capfd.readouterr().out, expected="$ printf 'aaabbbccc'\naaabbbccc")
+
 
 class TestCreateTag(object):
 
@@ -113,6 +171,31 @@ class TestCreateTag(object):
 
         capfd.readouterr()
 
+    def test_exists_locally_at_head(self, git, capfd):
+        with Replace('os.environ.TAG', 'v1.2.3', strict=False):
+            rev = git.make_clone()
+            git('tag v1.2.3')
+
+            create_tag()
+
+            compare(capfd.readouterr().out.splitlines()[0], expected='$ git push origin tag v1.2.3')
+            git.check_tags(repo='remote', expected={b'v1.2.3': rev})
+
+    def test_exists_locally_elsewhere(self, git, capfd):
+        with Replace('os.environ.TAG', 'v1.2.3', strict=False):
+            rev = git.make_clone()
+            git('tag v1.2.3')
+            git('config user.email "test@example.com"')
+            git('config user.name "Test User"')
+            git('commit --allow-empty -m another')
+
+            with ShouldRaise(SystemExit(128)):
+                create_tag()
+
+            assert 'already exists' in capfd.readouterr().out
+            git.check_tags(repo='local', expected={b'v1.2.3': rev})
+            git.check_tags(repo='remote', expected={})
+
 
 
 class TestUpdateMajorTag(object):
@@ -199,3 +282,121 @@ class TestUpdateMajorTag(object):
             git.check_tags(repo='local', expected={})
             git.check_tags(repo='remote', expected={})
         capfd.readouterr()
+
+
+class TestPushes(object):
+
+    def test_no_batch(self, git, capfd):
+        git.make_clone()
+        git('tag v1')
+        push_tag('origin', 'v1', force=True)
+        assert '$ git push --force origin tag v1\n' in capfd.readouterr().out
+
+    def test_single_atomic_push(self, git, capfd):
+        rev = git.make_clone()
+        batch = Pushes()
+        with activated(RunContext(tag='v1.2.3', pushes=batch)):
+            create_tag()
+            update_major_tag()
+        git.check_tags(repo='remote', expected={})
+        batch.push()
+        git.check_tags(repo='remote', expected={b'v1.2.3': rev, b'v1': rev})
+        out = capfd.readouterr().out
+        compare([line for line in out.splitlines() if line.startswith('$ git push')], expected=[
+            '$ git push --atomic origin refs/tags/v1.2.3 +refs/tags/v1',
+        ])
+
+    def test_remotes_pushed_separately(self, git, capfd):
+        git.make_clone()
+        batch = Pushes()
+        batch.add('origin', 'v1.2.3')
+        batch.add('upstream', 'v1.2.3')
+        batch.add('upstream', 'v1', force=True)
+        batch.add('upstream', 'v1')
+        with Replace('carthorse.execution.SubprocessBackend.execute', lambda *args, **kw: 0):
+            batch.push()
+        lines = capfd.readouterr().out.splitlines()
+        compare(sorted(lines[:2]), expected=[
+            '$ git push --atomic origin refs/tags/v1.2.3',
+            '$ git push --atomic upstream refs/tags/v1.2.3 +refs/tags/v1',
+        ])
+        compare(lines[2:], expected=['origin: pushed', 'upstream: pushed'])
+        compare(batch.refs, expected={})
+
+    def test_all_or_nothing(self, git, capfd):
+        old_rev = git.make_clone()
+        git('tag v1.2.3', 'remote')
+        git.dir.write('local/a', 'changed')
+        git('config user.email "test@example.com"')
+        git('config user.name "Test User"')
+        git('commit -am changed')
+        batch = Pushes()
+        with activated(RunContext(tag='v1.2.3', pushes=batch)):
+            create_tag()
+            update_major_tag()
+        with ShouldRaise(SystemExit):
+            batch.push()
+        git.check_tags(repo='remote', expected={b'v1.2.3': old_rev})
+        capfd.readouterr()
+
+
+class TestMultipleRemotes(object):
+
+    def test_create_tag(self, git, capfd):
+        rev = git.make_clone('dr', 'public')
+        with Replace('os.environ.TAG', 'v1.2.3', strict=False):
+            create_tag(remote=['origin', 'dr', 'public'])
+        for repo in 'remote', 'dr', 'public':
+            git.check_tags(repo=repo, expected={b'v1.2.3': rev})
+        lines = capfd.readouterr().out.splitlines()
+        compare(lines[-3:], expected=[
+            'origin: pushed v1.2.3',
+            'dr: pushed v1.2.3',
+            'public: pushed v1.2.3',
+        ])
+
+    def test_update_major_tag(self, git, capfd):
+        rev = git.make_clone('dr')
+        with Replace('os.environ.TAG', 'v1.2.3', strict=False):
+            update_major_tag(remote=['origin', 'dr'], workers=1)
+        for repo in 'remote', 'dr':
+            git.check_tags(repo=repo, expected={b'v1': rev})
+        compare(capfd.readouterr().out.splitlines()[-2:], expected=[
+            'origin: pushed v1',
+            'dr: pushed v1',
+        ])
+
+    def test_one_remote_fails(self, git, capfd):
+        rev = git.make_clone('dr', 'public')
+        git('tag v1.2.3', 'dr')
+        git.dir.write('local/a', 'changed')
+        git('config user.email "test@example.com"')
+        git('config user.name "Test User"')
+        git('commit -am changed')
+        new_rev = git.rev_parse('HEAD')
+        with Replace('os.environ.TAG', 'v1.2.3', strict=False):
+            with ShouldRaise(SystemExit(1)):
+                create_tag(remote=['origin', 'dr', 'public'])
+        git.check_tags(repo='remote', expected={b'v1.2.3': new_rev})
+        git.check_tags(repo='dr', expected={b'v1.2.3': rev})
+        git.check_tags(repo='public', expected={b'v1.2.3': new_rev})
+        compare(capfd.readouterr().out.splitlines()[-3:], expected=[
+            'origin: pushed v1.2.3',
+            'dr: failed, returncode=1',
+            'public: pushed v1.2.3',
+        ])
+
+    def test_exception(self, capfd):
+        def function(remote):
+            if remote == 'bad':
+                raise ValueError(remote)
+        with ShouldRaise(ValueError('bad')):
+            for_each_remote(function, ['good', 'bad'], workers=2, done='ok')
+        compare(capfd.readouterr().out, expected="good: ok\nbad: failed, ValueError('bad')\n")
+
+    def test_batched(self, capfd):
+        batch = Pushes()
+        with activated(RunContext(pushes=batch)):
+            push_tag(['origin', 'dr'], 'v1')
+        compare(batch.refs, expected={'origin': {'v1': False}, 'dr': {'v1': False}})
+        compare(capfd.readouterr().out, expected='')
@@ -0,0 +1,167 @@
+import json
+import os
+
+import toml
+from testfixtures import compare, Replacer, OutputCapture, ShouldRaise, Replace, StringComparison as S
+
+from carthorse.bulk import read_manifest, release_many, Tail, report, Result, release, _initialise
+from carthorse.cli import main
+from carthorse.plugins import Plugins
+from conftest import GitHelper
+
+
+def make_repo(git: GitHelper, name: str, version: str, actions=('create-tag',), tagged=False):
+    git.make_repo_with_content(name+'-remote')
+    git(f'clone {name}-remote {name}', git.dir.path)
+    git.dir.write([name, 'pyproject.toml'], toml.dumps({'tool': {
+        'poetry': {'version': version},
+        'carthorse': {
+            'version-from': 'poetry',
+            'when': ['version-not-tagged'],
+            'actions': list(actions),
+        },
+    }}))
+    if tagged:
+        git(f'tag v{version}', name+'-remote')
+    return git.dir.getpath(name)
+
+
+class TestReleaseMany(object):
+
+    def test_results(self, git: GitHelper):
+        released = make_repo(git, 'released', '1.0')
+        skipped = make_repo(git, 'skipped', '2.0', tagged=True)
+        failed = make_repo(git, 'failed', '3.0', actions=[{'run': 'echo oops && exit 3'}])
+        cwd = os.getcwd()
+
+        results = release_many([released, skipped, failed], processes=2)
+
+        compare(os.getcwd(), expected=cwd)
+        compare([(r.path, r.status, r.tag, r.error) for r in results], expected=[
+            (released, 'released', 'v1.0', None),
+            (skipped, 'skipped', 'v2.0', None),
+            (failed, 'failed', 'v3.0', 'SystemExit(3)'),
+        ])
+        git.check_tags(repo='released-remote', expected={
+            b'v1.0': git.rev_parse('HEAD', 'released-remote')
+        })
+        compare(results[1].output, expected=S("(?s).*Stopping as 'version-not-tagged' did not pass."))
+        compare(results[2].output, expected=S(r'(?s).*\$ echo oops && exit 3\noops\nreturncode=3'))
+
+    def test_dry_run(self, git: GitHelper):
+        path = make_repo(git, 'repo', '1.0')
+        result, = release_many([path], dry_run=True, processes=1)
+        compare(result.status, expected='released')
+        git.check_tags(repo='repo-remote', expected={})
+
+    def test_resume(self, git: GitHelper):
+        path = make_repo(git, 'repo', '1.0', actions=[
+            {'run': 'echo build >> ../log'}, {'run': 'test -e ../fixed'},
+        ])
+        result, = release_many([path], processes=1)
+        compare(result.status, expected='failed')
+        git.dir.write('fixed', '')
+        result, = release_many([path], processes=1, resume=True)
+        compare(result.status, expected='released')
+        compare(git.dir.read('log', encoding='ascii'), expected='build\n')
+
+    def test_missing_repo(self, dir):
+        result = release(dir.getpath('missing'))
+        compare(result.status, expected='failed')
+        compare(result.error, expected=S('FileNotFoundError.+'))
+
+    def test_release_in_worker(self, git: GitHelper):
+        path = make_repo(git, 'repo', '1.0', actions=[{'run': 'echo done'}])
+        with Replace('carthorse.bulk._plugins', None):
+            _initialise(Plugins.load())
+            result = release(path)
+        compare((result.status, result.tag, result.error), expected=('released', 'v1.0', None))
+        compare(result.output, expected=S(r'(?s).*\$ echo done\ndone'))
+
+
+class TestMain(object):
+
+    def test_manifest(self, git: GitHelper):
+        make_repo(git, 'one', '1.0')
+        make_repo(git, 'two', '2.0', tagged=True)
+        git.dir.write('repos.txt', '# nightly\none\n\n two\n')
+        with Replacer() as r, OutputCapture() as output:
+            r.replace('sys.argv', ['x', '--manifest', git.dir.getpath('repos.txt'),
+                                   '--report', git.dir.getpath('report.json')])
+            main()
+        compare(output.captured, expected=S(
+            r'path\s+status\s+tag\s+wall\n'
+            r'.+/one\s+released\s+v1.0\s+\d+\.\d+s\n'
+            r'.+/two\s+skipped\s+v2.0\s+\d+\.\d+s\n'
+        ))
+        data = json.loads(git.dir.read('report.json'))
+        compare([(r['status'], r['tag']) for r in data],
+                expected=[('released', 'v1.0'), ('skipped', 'v2.0')])
+
+    def test_manifest_failure(self, git: GitHelper):
+        make_repo(git, 'one', '1.0', actions=[{'run': 'exit 1'}])
+        git.dir.write('repos.txt', 'one\n')
+        with Replacer() as r, OutputCapture() as output:
+            r.replace('sys.argv', ['x', '--manifest', git.dir.getpath('repos.txt')])
+            with ShouldRaise(SystemExit(1)):
+                main()
+        assert 'one failed with SystemExit(1):\n' in output.captured, output.captured
+
+    def test_manifest_resume(self, git: GitHelper):
+        make_repo(git, 'one', '1.0', actions=[
+            {'run': 'echo build >> ../log'}, {'run': 'test -e ../fixed'},
+        ])
+        git.dir.write('repos.txt', 'one\n')
+        with Replacer() as r, OutputCapture():
+            r.replace('sys.argv', ['x', '--manifest', git.dir.getpath('repos.txt')])
+            with ShouldRaise(SystemExit(1)):
+                main()
+            git.dir.write('fixed', '')
+            r.replace('sys.argv', ['x', '--manifest', git.dir.getpath('repos.txt'), '--resume'])
+            main()
+        compare(git.dir.read('log', encoding='ascii'), expected='build\n')
+
+    def test_manifest_unsupported_options(self, dir):
+        with Replacer() as r, OutputCapture() as output:
+            r.replace('sys.argv', ['x', '--manifest', 'repos.txt', '--timings', '--trace', 't.json'])
+            with ShouldRaise(SystemExit(2)):
+                main()
+        assert output.captured.endswith(
+            'error: --timings, --trace cannot be used with --manifest\n'
+        ), output.captured
+
+
+def test_read_manifest(dir):
+    dir.write('sub/repos.txt', 'a\n  # comment\n\n/abs/b  \n../c\n')
+    compare(read_manifest(dir.getpath('sub/repos.txt')), expected=[
+        dir.getpath('sub/a'), '/abs/b', dir.getpath('c'),
+    ])
+
+
+def test_tail():
+    tail = Tail(2)
+    tail.write('one\ntw')
+    tail.write('o\nthree\nfo')
+    print('ur', file=tail, flush=True)
+    compare(tail.getvalue(), expected='three\nfour')
+
+
+def test_tail_no_newlines():
+    tail = Tail(2)
+    with Replace('carthorse.bulk.MAX_LINE', 3):
+        tail.write('aaabbbcccd')
+    compare(tail.getvalue(), expected='bbb\nccc\nd')
+
+
+def test_report():
+    compare(report([
+        Result('/a', 'released', 'v1', wall=1),
+        Result('/bb', 'failed', error='SystemExit(1)', output='boom'),
+    ]), expected=(
+        'path  status    tag  wall\n'
+        '/a    released  v1   1.000s\n'
+        '/bb   failed         0.000s\n'
+        '\n'
+        '/bb failed with SystemExit(1):\n'
+        'boom'
+    ))
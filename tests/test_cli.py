@@ -1,10 +1,14 @@
+import json
+from threading import Event
+from time import monotonic
 from unittest.mock import Mock, call
 
 import toml
 from coverage.annotate import os
 from testfixtures import Replacer, compare, ShouldRaise, not_there, Replace, test_datetime, \
-    OutputCapture
+    OutputCapture, StringComparison as S
 
+from carthorse.actions import run
 from carthorse.cli import main
 from carthorse.when import never
 
@@ -200,7 +204,7 @@ def test_dry_run(dir):
         raise Exception('Boom!')
 
     with Replacer() as replace, OutputCapture() as output:
-        replace('carthorse.actions.check_output', raiser)
+        replace('carthorse.execution.Popen', raiser)
         replace('sys.argv', ['x', '--dry-run'])
         main()
     output.compare(
@@ -208,3 +212,609 @@ def test_dry_run(dir):
         '$ git tag v1.0\n'
         '$ git push origin tag v1.0\n'
     )
+
+
+def test_dry_run_checks_still_performed(git):
+    git.make_clone()
+    git('tag v1.0', 'remote')
+    git.dir.write('local/pyproject.toml', toml.dumps({'tool': {
+        'carthorse': {
+            'version-from': 'poetry',
+            'when': ['version-not-tagged'],
+            'actions': [{'name': 'create-tag'}],
+        },
+        'poetry': {'version': '1.0'},
+    }}))
+    with Replacer() as r, OutputCapture(fd=True) as output:
+        r.replace('sys.argv', ['x', '--dry-run'])
+        main()
+    lines = output.captured.splitlines()
+    compare(lines[0], expected='$ git remote -v')
+    compare(lines[-2:], expected=[
+        'Version is already tagged.',
+        "Stopping as 'version-not-tagged' did not pass.",
+    ])
+    assert "$ git fetch origin 'refs/tags/*:refs/tags/*'" in lines, lines
+    assert '$ git tag v1.0' not in lines, lines
+
+
+def test_timings(dir):
+    m = Mock()
+    dir.write('pyproject.toml', toml.dumps({'tool': {'carthorse': {
+        'version-from': {'name': 'dummy'},
+        'when': [{'name': 'dummy'}],
+        'actions': [{'dummy': 'action 1'}],
+    }}}))
+    with Replacer() as r, OutputCapture() as output:
+        r.replace('carthorse.plugins.Plugins.load', lambda *args: {
+            'version_from': {'dummy': m.version_from},
+            'when': {'dummy': m.when},
+            'actions': {'dummy': m.action},
+        })
+        m.version_from.return_value = '1.2.3'
+        r.replace('sys.argv', ['x', '--timings', '--timings-json', 'timings.json'])
+        main()
+    data = json.loads(dir.read('timings.json'))
+    compare(data['attributes'], expected={'version': '1.2.3', 'tag': 'v1.2.3'})
+    compare([(t['phase'], t['name']) for t in data['timings']], expected=[
+        ('config', 'pyproject.toml'),
+        ('plugins', ''),
+        ('version-from', 'dummy'),
+        ('tag-format', 'v{version}'),
+        ('when', 'dummy'),
+        ('actions', 'dummy: action 1'),
+        ('carthorse', ''),
+    ])
+    lines = output.captured.splitlines()
+    compare(lines[0], expected=S(r'phase\s+name\s+wall\s+cpu\s+children'))
+    compare(lines[1], expected=S(r'carthorse\s+\d+\.\d{3}s\s+\d+\.\d{3}s\s+\d+\.\d{3}s'))
+    compare(len(lines), expected=8)
+
+
+def test_timings_when_action_fails(dir):
+    dir.write('pyproject.toml', toml.dumps({'tool': {'carthorse': {
+        'version-from': {'name': 'none'},
+        'when': [],
+        'actions': [{'run': 'exit 3'}],
+    }}}))
+    with Replacer() as r, OutputCapture(fd=True):
+        r.replace('sys.argv', ['x', '--timings-json', 'timings.json'])
+        with ShouldRaise(SystemExit(3)):
+            main()
+    data = json.loads(dir.read('timings.json'))
+    compare([(t['phase'], t['name'], t['error']) for t in data['timings']][-2:], expected=[
+        ('actions', 'run: exit 3', 'SystemExit(3)'),
+        ('carthorse', '', 'SystemExit(3)'),
+    ])
+
+
+def test_atomic_push(dir):
+    dir.write('pyproject.toml', toml.dumps({'tool': {'carthorse': {
+        'version-from': {'name': 'env'},
+        'atomic-push': True,
+        'when': [],
+        'actions': [
+            {'name': 'create-tag'},
+            {'run': 'echo built'},
+            {'name': 'update-major-tag', 'remote': 'upstream'},
+        ],
+    }}}))
+    with Replacer() as r, OutputCapture() as output:
+        r.replace('os.environ.VERSION', '1.2.3', strict=False)
+        r.replace('carthorse.execution.SubprocessBackend.execute', lambda *args, **kw: 0)
+        r.replace('sys.argv', ['x'])
+        main()
+    lines = output.captured.splitlines()
+    compare(lines[:3], expected=[
+        '$ git tag v1.2.3',
+        '$ echo built',
+        '$ git tag --force v1',
+    ])
+    compare(sorted(lines[3:5]), expected=[
+        '$ git push --atomic origin refs/tags/v1.2.3',
+        '$ git push --atomic upstream +refs/tags/v1',
+    ])
+    compare(lines[5:], expected=['origin: pushed', 'upstream: pushed'])
+
+
+def test_atomic_push_action_fails(dir):
+    dir.write('pyproject.toml', toml.dumps({'tool': {'carthorse': {
+        'version-from': {'name': 'env'},
+        'atomic-push': True,
+        'when': [],
+        'actions': [
+            {'name': 'create-tag'},
+            {'run': 'false'},
+        ],
+    }}}))
+    commands = []
+
+    def execute(
+            self, command, output, cwd=None, env=None, timeout=None, usage=None, cancel=None
+    ):
+        commands.append(command)
+        return 1 if command == 'false' else 0
+
+    with Replacer() as r, OutputCapture():
+        r.replace('os.environ.VERSION', '1.2.3', strict=False)
+        r.replace('carthorse.execution.SubprocessBackend.execute', execute)
+        r.replace('sys.argv', ['x'])
+        with ShouldRaise(SystemExit(1)):
+            main()
+    compare(commands, expected=[['git', 'tag', 'v1.2.3'], 'false'])
+
+
+def test_parallel_actions(dir):
+    # each build waits for the other to start, so they only finish if run at the same time:
+    docs = 'touch docs.started && until [ -e wheel.started ]; do sleep 0.01; done && echo docs'
+    wheel = 'touch wheel.started && until [ -e docs.started ]; do sleep 0.01; done && echo wheel'
+    dir.write('pyproject.toml', toml.dumps({'tool': {'carthorse': {
+        'version-from': {'name': 'none'},
+        'jobs': 2,
+        'when': [],
+        'actions': [
+            {'run': docs, 'id': 'docs', 'needs': [], 'timeout': 30},
+            {'run': wheel, 'id': 'wheel', 'needs': [], 'timeout': 30},
+            {'run': 'echo tag'},
+        ],
+    }}}))
+    with Replacer() as r, OutputCapture(fd=True) as output:
+        r.replace('sys.argv', ['x'])
+        main()
+    lines = output.captured.splitlines()
+    compare(sorted(lines[:4]), expected=sorted(['$ '+docs, '$ '+wheel, 'docs', 'wheel']))
+    compare(lines[4:], expected=['$ echo tag', 'tag'])
+
+
+def test_concurrent_checks(dir):
+    m = Mock()
+    dir.write('pyproject.toml', toml.dumps({'tool': {'carthorse': {
+        'version-from': {'name': 'dummy'},
+        'when-jobs': 3,
+        'when': [
+            {'name': 'dummy'},
+            {'name': 'never'},
+            {'name': 'dummy'},
+        ],
+        'actions': [{'name': 'dummy'}],
+    }}}))
+    with Replacer() as r, OutputCapture() as output:
+        r.replace('carthorse.plugins.Plugins.load', lambda *args: {
+            'version_from': {'dummy': m.version_from},
+            'when': {'dummy': m.when, 'never': never},
+            'actions': {'dummy': m.action},
+        })
+        m.version_from.return_value = '1.2.3'
+        m.when.return_value = True
+        r.replace('sys.argv', ['x'])
+        main()
+    output.compare("Stopping as 'never' did not pass.")
+    assert call.action() not in m.mock_calls
+
+
+def test_concurrent_checks_cancelled(dir):
+    slow_started = Event()
+
+    def slow():
+        slow_started.set()
+        run(['sleep', '30'])
+
+    def fail():
+        slow_started.wait()
+        return False
+
+    dir.write('pyproject.toml', toml.dumps({'tool': {'carthorse': {
+        'version-from': {'name': 'none'},
+        'when-jobs': 2,
+        'when': ['fail', 'slow'],
+        'actions': [{'run': 'echo released'}],
+    }}}))
+    with Replacer() as r, OutputCapture() as output:
+        r.replace('carthorse.plugins.Plugins.load', lambda *args: {
+            'version_from': {'none': lambda: ''},
+            'when': {'fail': fail, 'slow': slow},
+        })
+        r.replace('sys.argv', ['x'])
+        start = monotonic()
+        main()
+    # the slow check is killed and finished with before the outcome is reported:
+    output.compare("$ sleep 30\nStopping as 'fail' did not pass.")
+    assert monotonic() - start < 10
+
+
+def check_order(dir, order, history=None):
+    called = []
+
+    def plugin(name, cost_=None):
+        def check():
+            called.append(name)
+            return True
+        if cost_:
+            check.cost = cost_
+        return check
+
+    config = {'tool': {'carthorse': {
+        'version-from': {'name': 'none'},
+        'when': [{'name': 'remote'}, {'name': 'unknown'}, {'name': 'git'}, {'name': 'local'}],
+        'actions': [],
+    }}}
+    if order:
+        config['tool']['carthorse']['when-order'] = order
+    dir.write('pyproject.toml', toml.dumps(config))
+    argv = ['x']
+    if history is not None:
+        dir.write('timings.json', json.dumps({'timings': [
+            {'phase': 'when', 'name': name, 'wall': wall} for name, wall in history.items()
+        ]}))
+        argv += ['--timings-json', 'timings.json']
+    with Replacer() as r:
+        r.replace('carthorse.plugins.Plugins.load', lambda *args: {
+            'version_from': {'none': lambda: ''},
+            'when': {
+                'remote': plugin('remote', 'network'),
+                'unknown': plugin('unknown'),
+                'git': plugin('git', 'subprocess'),
+                'local': plugin('local', 'local'),
+            },
+        })
+        r.replace('sys.argv', argv)
+        main()
+    return called
+
+
+def test_when_order_default(dir):
+    compare(check_order(dir, None), expected=['remote', 'unknown', 'git', 'local'])
+
+
+def test_when_order_cost(dir):
+    compare(check_order(dir, 'cost'), expected=['local', 'git', 'remote', 'unknown'])
+
+
+def test_when_order_cost_learned(dir):
+    compare(check_order(dir, 'cost', history={'remote': 0.01, 'local': 0.02}),
+            expected=['remote', 'local', 'git', 'unknown'])
+
+
+def test_when_order_invalid(dir):
+    with ShouldRaise(ValueError("when-order must be one of ('config', 'cost'), not 'foo'")):
+        check_order(dir, 'foo')
+
+
+def test_projects(git, capfd):
+    git.make_repo_with_content('remote')
+    git('clone remote local', git.dir.path)
+    git('tag lib-v1.0', 'remote')
+    for name, version in ('lib', '1.0'), ('app', '2.0'), ('util', '3.0'):
+        git.dir.write(f'local/{name}/pyproject.toml', toml.dumps({'project': {'version': version}}))
+    git.dir.write('local/pyproject.toml', toml.dumps({'tool': {'carthorse': {
+        'project-jobs': 2,
+        'when': ['version-not-tagged'],
+        'actions': [{'name': 'create-tag'}],
+        'projects': {
+            'app': {'version-from': 'pyproject', 'tag-format': 'app-v{version}', 'needs': 'lib'},
+            'lib': {'version-from': 'pyproject', 'tag-format': 'lib-v{version}'},
+            'util': {'version-from': 'pyproject', 'tag-format': 'util-v{version}'},
+        },
+    }}}))
+    os.chdir(git.dir.getpath('local'))
+    with Replacer() as r:
+        r.replace('sys.argv', ['x'])
+        r.replace('os.environ.TAG', 'untouched', strict=False)
+        main()
+        compare(os.environ['TAG'], expected='untouched')
+    rev = git.rev_parse('HEAD')
+    git.check_tags(repo='remote', expected={
+        b'lib-v1.0': rev, b'app-v2.0': rev, b'util-v3.0': rev,
+    })
+    out = capfd.readouterr().out
+    compare(out.count("$ git fetch origin"), expected=1)
+    summary = [line for line in out.splitlines() if line.startswith(('lib:', 'app:', 'util:'))]
+    assert summary.index('app: released app-v2.0') > summary.index('lib: skipped'), summary
+    compare(sorted(summary), expected=[
+        'app: released app-v2.0', 'lib: skipped', 'util: released util-v3.0',
+    ])
+
+
+def test_projects_dry_run(dir):
+    dir.write('lib/pyproject.toml', toml.dumps({'project': {'version': '1.0'}}))
+    dir.write('pyproject.toml', toml.dumps({'tool': {'carthorse': {
+        'when': [],
+        'actions': [{'run': 'echo $TAG > tag.txt'}],
+        'projects': {'lib': {'version-from': 'pyproject'}},
+    }}}))
+    with Replacer() as r, OutputCapture() as output:
+        r.replace('sys.argv', ['x', '--dry-run'])
+        main()
+    output.compare('$ echo $TAG > tag.txt\nlib: released v1.0\n')
+
+
+def test_asyncio_backend(dir, capfd):
+    dir.write('pyproject.toml', toml.dumps({'tool': {'carthorse': {
+        'version-from': {'name': 'none'},
+        'backend': {'name': 'asyncio', 'limit': 2},
+        'jobs': 2,
+        'when': [],
+        'actions': [
+            {'run': 'sleep 0.3 && echo one', 'needs': []},
+            {'run': ['echo', 'two'], 'needs': []},
+        ],
+    }}}))
+    with Replace('sys.argv', ['x']):
+        main()
+    compare(sorted(capfd.readouterr().out.splitlines()), expected=[
+        '$ echo two', '$ sleep 0.3 && echo one', 'one', 'two',
+    ])
+
+
+def test_action_timeout(dir):
+    dir.write('pyproject.toml', toml.dumps({'tool': {'carthorse': {
+        'version-from': {'name': 'none'},
+        'when': [],
+        'actions': [
+            {'run': 'echo fast', 'timeout': 5},
+            {'run': 'sleep 5', 'timeout': 0.2},
+            {'run': 'echo never'},
+        ],
+    }}}))
+    with Replacer() as r, OutputCapture(fd=True) as output:
+        r.replace('sys.argv', ['x', '--timings-json', 'timings.json'])
+        with ShouldRaise(SystemExit(124)):
+            main()
+    output.compare(
+        '$ echo fast\n'
+        'fast\n'
+        '$ sleep 5\n'
+        'timed out after 0.2s\n'
+        "Stopping as 'run: sleep 5' timed out after 0.2s.\n"
+    )
+    data = json.loads(dir.read('timings.json'))
+    compare([(t['phase'], t['name'], t['error']) for t in data['timings']][-2:], expected=[
+        ('actions', 'run: sleep 5', "TimeoutExpired('sleep 5', 0.2)"),
+        ('carthorse', '', 'SystemExit(124)'),
+    ])
+
+
+def test_global_timeout(dir):
+    dir.write('pyproject.toml', """
+    [tool.carthorse]
+    version-from = "none"
+    timeout = 0.5
+    when = [{ always={}, timeout=10 }]
+    actions = [
+      { run="sleep 0.3" },
+      { run="sleep 5", timeout=10 },
+    ]
+    """)
+    with Replacer() as r, OutputCapture(fd=True) as output:
+        r.replace('sys.argv', ['x'])
+        with ShouldRaise(SystemExit(124)):
+            main()
+    assert output.captured.endswith(
+        "timed out after 0.5s\nStopping as 'run: sleep 5' timed out after 0.5s.\n"
+    ), output.captured
+
+
+def test_version_from_timeout(dir):
+    dir.write('setup.py', 'import time\ntime.sleep(5)\n')
+    dir.write('pyproject.toml', """
+    [tool.carthorse]
+    version-from = "setup.py"
+    timeout = 0.5
+    when = ["always"]
+    actions = []
+    """)
+    with Replacer() as r, OutputCapture(fd=True) as output:
+        r.replace('sys.argv', ['x'])
+        with ShouldRaise(SystemExit(124)):
+            main()
+    output.compare("timed out after 0.5s\nStopping as 'version-from' timed out after 0.5s.")
+
+
+def test_trace(dir):
+    dir.write('pyproject.toml', toml.dumps({'tool': {'carthorse': {
+        'version-from': {'name': 'none'},
+        'when': ['always'],
+        'actions': [{'run': 'echo hello'}],
+    }}}))
+    with Replacer() as r, OutputCapture(fd=True):
+        r.replace('sys.argv', ['x', '--trace', 'trace.json'])
+        main()
+    data = json.loads(dir.read('trace.json'))
+    spans = data['resourceSpans'][0]['scopeSpans'][0]['spans']
+    names = {span['spanId']: span['name'] for span in spans}
+    compare([(span['name'], names.get(span.get('parentSpanId'))) for span in spans], expected=[
+        ('carthorse', None),
+        ('config: pyproject.toml', 'carthorse'),
+        ('plugins', 'carthorse'),
+        ('version-from: none', 'carthorse'),
+        ('tag-format: v{version}', 'carthorse'),
+        ('when: always', 'carthorse'),
+        ('actions: run: echo hello', 'carthorse'),
+        ('echo hello', 'actions: run: echo hello'),
+    ])
+    compare({span['traceId'] for span in spans}, expected={spans[0]['traceId']})
+
+
+def profile(dir, profiler):
+    dir.write('pyproject.toml', toml.dumps({'tool': {'carthorse': {
+        'version-from': {'name': 'none'},
+        'when': ['always'],
+        'actions': [{'run': 'sleep 0.1'}],
+    }}}))
+    with Replacer() as r, OutputCapture(fd=True):
+        r.replace('sys.argv', ['x', '--profile', 'profile', '--profiler', profiler])
+        main()
+    return sorted(os.listdir(dir.getpath('profile')))
+
+
+def test_profile(dir):
+    compare(profile(dir, 'cprofile'), expected=[
+        'actions.pstats', 'config.pstats', 'plugins.pstats', 'version-from.pstats', 'when.pstats',
+    ])
+
+
+def test_profile_sampled(dir):
+    files = profile(dir, 'sample')
+    assert 'actions.collapsed' in files, files
+
+
+def release_with_failure(git, *args, **config):
+    git.make_repo_with_content()
+    git.dir.write('local/pyproject.toml', toml.dumps({'tool': {'carthorse': dict({
+        'version-from': {'name': 'none'},
+        'when': ['always'],
+        'actions': [
+            {'run': 'echo build >> ../log'},
+            {'run': 'test -e ../fixed'},
+            {'run': 'echo upload >> ../log'},
+        ],
+    }, **config)}}))
+    os.chdir(git.dir.getpath('local'))
+    with Replacer() as r, OutputCapture(fd=True) as output:
+        r.replace('sys.argv', ['x', *args])
+        with ShouldRaise(SystemExit(1)):
+            main()
+    return output
+
+
+def test_resume(git):
+    release_with_failure(git)
+    git.dir.write('fixed', '')
+    with Replacer() as r, OutputCapture(fd=True) as output:
+        r.replace('sys.argv', ['x', '--resume'])
+        main()
+    output.compare('\n'.join((
+        f"Resuming the release of v from {git.rev_parse('HEAD')}, skipping checks.",
+        "Skipping 'run: echo build >> ../log' as it was completed by an earlier run.",
+        '$ test -e ../fixed',
+        '$ echo upload >> ../log',
+    )))
+    compare(git.dir.read('log', encoding='ascii'), expected='build\nupload\n')
+    compare(json.loads(git.dir.read('local/.git/carthorse-journal.json')), expected={})
+
+
+def test_without_resume(git):
+    release_with_failure(git)
+    git.dir.write('fixed', '')
+    with Replacer() as r, OutputCapture(fd=True):
+        r.replace('sys.argv', ['x'])
+        main()
+    compare(git.dir.read('log', encoding='ascii'), expected='build\nbuild\nupload\n')
+
+
+def test_resume_different_commit(git):
+    release_with_failure(git)
+    git.dir.write('fixed', '')
+    git('commit --allow-empty -m another')
+    with Replacer() as r, OutputCapture(fd=True) as output:
+        r.replace('sys.argv', ['x', '--resume'])
+        main()
+    compare(output.captured.splitlines()[0], expected='$ echo build >> ../log')
+    compare(git.dir.read('log', encoding='ascii'), expected='build\nbuild\nupload\n')
+
+
+def test_resume_dry_run(git):
+    release_with_failure(git)
+    journal = git.dir.read('local/.git/carthorse-journal.json')
+    with Replacer() as r, OutputCapture(fd=True) as output:
+        r.replace('sys.argv', ['x', '--resume', '--dry-run'])
+        main()
+    output.compare('\n'.join((
+        f"Resuming the release of v from {git.rev_parse('HEAD')}, skipping checks.",
+        "Skipping 'run: echo build >> ../log' as it was completed by an earlier run.",
+        '$ test -e ../fixed',
+        '$ echo upload >> ../log',
+    )))
+    compare(git.dir.read('local/.git/carthorse-journal.json'), expected=journal)
+
+
+def test_resume_atomic_push(git):
+    git.make_repo_with_content('remote')
+    git('clone remote local', git.dir.path)
+    git.dir.write('local/pyproject.toml', toml.dumps({'tool': {'carthorse': {
+        'version-from': {'name': 'none'},
+        'atomic-push': True,
+        'when': ['always'],
+        'actions': [
+            {'name': 'create-tag'},
+            {'run': 'test -e ../fixed'},
+        ],
+    }}}))
+    os.chdir(git.dir.getpath('local'))
+    with Replacer() as r, OutputCapture(fd=True):
+        r.replace('sys.argv', ['x'])
+        with ShouldRaise(SystemExit(1)):
+            main()
+        git.check_tags(repo='remote', expected={})
+        git.dir.write('fixed', '')
+        r.replace('sys.argv', ['x', '--resume'])
+        main()
+    git.check_tags(repo='remote', expected={b'v': git.rev_parse('HEAD')})
+
+
+def test_resume_failed_tag_push(git):
+    git.make_clone()
+    git('remote set-url origin ../missing')
+    git.dir.write('local/pyproject.toml', toml.dumps({'tool': {'carthorse': {
+        'version-from': {'name': 'none'},
+        'when': ['always'],
+        'actions': [
+            {'run': 'echo build >> ../log'},
+            {'name': 'create-tag'},
+        ],
+    }}}))
+    with Replacer() as r, OutputCapture(fd=True):
+        r.replace('sys.argv', ['x'])
+        with ShouldRaise(SystemExit(128)):
+            main()
+    git.check_tags(repo='local', expected={b'v': git.rev_parse('HEAD')})
+    git('remote set-url origin ../remote')
+    with Replacer() as r, OutputCapture(fd=True) as output:
+        r.replace('sys.argv', ['x', '--resume'])
+        main()
+    compare(output.captured.splitlines()[:3], expected=[
+        f"Resuming the release of v from {git.rev_parse('HEAD')}, skipping checks.",
+        "Skipping 'run: echo build >> ../log' as it was completed by an earlier run.",
+        '$ git push origin tag v',
+    ])
+    compare(git.dir.read('log', encoding='ascii'), expected='build\n')
+    git.check_tags(repo='remote', expected={b'v': git.rev_parse('HEAD')})
+
+
+def test_resume_only_action_failed(git):
+    git.make_clone()
+    hook = git.dir.write('remote/.git/hooks/pre-receive', '#!/bin/sh\nexit 1\n')
+    os.chmod(hook, 0o755)
+    git.dir.write('local/pyproject.toml', toml.dumps({'tool': {'carthorse': {
+        'version-from': {'name': 'none'},
+        'when': ['version-not-tagged'],
+        'actions': [{'name': 'create-tag'}],
+    }}}))
+    with Replacer() as r, OutputCapture(fd=True):
+        r.replace('sys.argv', ['x'])
+        with ShouldRaise(SystemExit(1)):
+            main()
+    git.check_tags(repo='remote', expected={})
+    os.remove(hook)
+    with Replacer() as r, OutputCapture(fd=True) as output:
+        r.replace('sys.argv', ['x', '--resume'])
+        main()
+    compare(output.captured.splitlines()[:2], expected=[
+        f"Resuming the release of v from {git.rev_parse('HEAD')}, skipping checks.",
+        '$ git push origin tag v',
+    ])
+    git.check_tags(repo='remote', expected={b'v': git.rev_parse('HEAD')})
+    compare(json.loads(git.dir.read('local/.git/carthorse-journal.json')), expected={})
+
+
+def test_resume_no_repo(dir):
+    dir.write('pyproject.toml', toml.dumps({'tool': {'carthorse': {
+        'version-from': {'name': 'none'},
+        'when': ['always'],
+        'actions': [{'run': 'echo done'}],
+    }}}))
+    with Replacer() as r, OutputCapture(fd=True) as output:
+        r.replace('sys.argv', ['x', '--resume'])
+        r.replace('os.environ.GIT_DIR', 'missing', strict=False)
+        main()
+    output.compare(f"Can't resume as {dir.getpath('missing')} has no config.\n$ echo done\ndone")
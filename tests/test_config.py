@@ -3,6 +3,7 @@ from unittest.mock import Mock, call
 from testfixtures import compare
 
 from carthorse.config import load_config
+from carthorse.context import RunContext, activated
 
 
 EXPECTED_CONFIG = {
@@ -71,3 +72,117 @@ class TestConfig(object):
         plugins = {'a-func': a_func}
         result = config.run(plugins, config['version-from'])
         compare(result, expected=(1, 2, 3))
+
+    def test_options(self, dir):
+        path = dir.write('test.yaml', """
+        carthorse:
+          version-from: none
+          when: []
+          actions:
+            - run: "make docs"
+              id: docs
+              needs: []
+            - create-tag: {remote: upstream}
+              needs: [docs]
+              timeout: 60
+        """)
+        config = load_config(path)
+        compare(config['actions'], expected=[
+            {'name': 'run', 'args': ('make docs',), 'kw': {}, 'id': 'docs', 'needs': []},
+            {'name': 'create-tag', 'args': (), 'kw': {'remote': 'upstream'},
+             'needs': ['docs'], 'timeout': 60},
+        ])
+
+    def test_options_with_name_passed_to_plugin(self, dir):
+        path = dir.write('test.toml', """
+        [tool.carthorse]
+        version-from = "none"
+        when = []
+        actions = [{ name="upload", id="release-1", timeout=5 }]
+        """)
+        config = load_config(path)
+        compare(config['actions'], expected=[
+            {'name': 'upload', 'args': (), 'kw': {'id': 'release-1', 'timeout': 5}},
+        ])
+
+    def test_run_with_context(self, dir):
+        path = dir.write('test.toml', """
+        [tool.carthorse]
+        version-from = { name="with-context", a=1 }
+        when = []
+        actions = []
+        """)
+        config = load_config(path)
+
+        def with_context(a, context):
+            return a, context
+
+        context = RunContext(tag='v1')
+        with activated(context):
+            result = config.run({'with-context': with_context}, config['version-from'])
+        compare(result, expected=(1, context))
+
+    def test_run_without_signature(self, dir):
+        path = dir.write('test.toml', """
+        [tool.carthorse]
+        version-from = { max=[1, 2] }
+        when = []
+        actions = []
+        """)
+        config = load_config(path)
+        compare(config.run({'max': max}, config['version-from']), expected=2)
+
+    def test_run_kwargs_not_given_context(self, dir):
+        path = dir.write('test.toml', """
+        [tool.carthorse]
+        version-from = { name="kwargs", a=1 }
+        when = []
+        actions = []
+        """)
+        config = load_config(path)
+
+        def kwargs(**kw):
+            return kw
+
+        result = config.run({'kwargs': kwargs}, config['version-from'])
+        compare(result, expected={'a': 1})
+
+
+class TestProjects(object):
+
+    def test_parse(self, dir):
+        path = dir.write('pyproject.toml', """
+        [tool.carthorse]
+        when = ["version-not-tagged"]
+        actions = [{run="make release"}]
+        project-jobs = 4
+
+        [tool.carthorse.projects.lib]
+        version-from = "pyproject"
+        tag-format = "lib-v{version}"
+
+        [tool.carthorse.projects.app]
+        path = "apps/app"
+        needs = ["lib"]
+        version-from = "pyproject"
+        when = ["always"]
+        """)
+        config = load_config(path)
+        compare(list(config['projects']), expected=['lib', 'app'])
+        lib, app = config['projects'].values()
+        compare(lib.name, expected='lib')
+        compare(lib.data, expected={
+            'version-from': {'name': 'pyproject', 'args': (), 'kw': {}},
+            'tag-format': 'lib-v{version}',
+            'when': [{'name': 'version-not-tagged', 'args': (), 'kw': {}}],
+            'actions': [{'name': 'run', 'args': ('make release',), 'kw': {}}],
+            'project-jobs': 4,
+        })
+        compare(app.data, expected={
+            'path': 'apps/app',
+            'needs': ['lib'],
+            'version-from': {'name': 'pyproject', 'args': (), 'kw': {}},
+            'when': [{'name': 'always', 'args': (), 'kw': {}}],
+            'actions': [{'name': 'run', 'args': ('make release',), 'kw': {}}],
+            'project-jobs': 4,
+        })
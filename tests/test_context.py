@@ -0,0 +1,122 @@
+import os
+from concurrent.futures import ThreadPoolExecutor
+
+from testfixtures import compare, Replace
+
+from carthorse.cli import carthorse
+from carthorse.config import load_config
+from carthorse.context import RunContext, current, activated, time_limit, deadline
+from carthorse.execution import SubprocessBackend
+from carthorse.plugins import Plugins
+
+
+class TestRunContext(object):
+
+    def test_from_environment(self, dir):
+        with Replace('os.environ.TAG', 'v1.2.3', strict=False):
+            context = RunContext.from_environment()
+        compare(context.tag, expected='v1.2.3')
+        compare(context.cwd, expected=os.getcwd())
+        assert context.env is os.environ
+        assert isinstance(context.backend, SubprocessBackend)
+
+    def test_defaults_isolated(self):
+        context = RunContext()
+        context.env['TAG'] = 'v1'
+        assert os.environ.get('TAG') != 'v1'
+
+    def test_path(self):
+        context = RunContext(cwd='/some/project')
+        compare(context.path('pyproject.toml'), expected='/some/project/pyproject.toml')
+        compare(context.path('/elsewhere/x'), expected='/elsewhere/x')
+
+    def test_ref_store(self, repo):
+        store = RunContext(cwd=str(repo)).ref_store()
+        compare(store.git_dir, expected=repo / '.git')
+
+    def test_ref_store_unsupported(self, dir):
+        compare(RunContext(cwd=dir.path, env={}).ref_store(), expected=None)
+
+
+class TestCurrent(object):
+
+    def test_none_active(self):
+        with Replace('os.environ.TAG', 'v2', strict=False):
+            compare(current().tag, expected='v2')
+
+    def test_activated(self):
+        context = RunContext(tag='v1')
+        with activated(context):
+            assert current() is context
+        assert current() is not context
+
+
+class TestTimeLimit(object):
+
+    def test_none(self):
+        with time_limit(None) as limit:
+            compare(limit, expected=None)
+            compare(deadline(), expected=None)
+
+    def test_set(self):
+        with time_limit(10) as limit:
+            assert deadline() is limit
+            compare(limit.seconds, expected=10)
+            assert 9 < limit.remaining() <= 10
+        compare(deadline(), expected=None)
+
+    def test_earlier_kept(self):
+        with time_limit(1) as outer:
+            with time_limit(10) as inner:
+                assert inner is outer
+            with time_limit(None) as inner:
+                assert inner is outer
+            with time_limit(0.5) as inner:
+                compare(inner.seconds, expected=0.5)
+            assert deadline() is outer
+
+    def test_expired(self):
+        with time_limit(0) as limit:
+            compare(limit.remaining(), expected=0)
+
+
+def write_project(dir, name, version):
+    dir.write([name, 'pyproject.toml'], f"""
+        [project]
+        version = "{version}"
+        [tool.carthorse]
+        version-from = "pyproject"
+        when = ["always"]
+        actions = [{{run = "sleep 0.2 && echo $TAG > tag.txt"}}]
+    """)
+    return dir.getpath(name)
+
+
+class TestReentrant(object):
+
+    def test_concurrent_releases(self, dir, capfd):
+        plugins = Plugins.load()
+        paths = [write_project(dir, 'one', '1.0'), write_project(dir, 'two', '2.0')]
+
+        def release(path):
+            config = load_config(os.path.join(path, 'pyproject.toml'))
+            return carthorse(config, plugins, dry_run=False, context=RunContext(cwd=path))
+
+        with Replace('os.environ.TAG', 'untouched', strict=False):
+            with ThreadPoolExecutor(max_workers=2) as executor:
+                compare(list(executor.map(release, paths)), expected=[True, True])
+            compare(os.environ['TAG'], expected='untouched')
+        compare(dir.read('one/tag.txt').strip(), expected='v1.0')
+        compare(dir.read('two/tag.txt').strip(), expected='v2.0')
+        compare(os.getcwd(), expected=dir.path)
+        capfd.readouterr()
+
+    def test_dry_run_with_context(self, dir, capfd):
+        path = write_project(dir, 'one', '1.0')
+        config = load_config(os.path.join(path, 'pyproject.toml'))
+        context = RunContext(cwd=path)
+        carthorse(config, Plugins.load(), dry_run=True, context=context)
+        compare(context.tag, expected='v1.0')
+        assert isinstance(context.backend, SubprocessBackend)
+        assert not os.path.exists(os.path.join(path, 'tag.txt'))
+        compare(capfd.readouterr().out, expected='$ sleep 0.2 && echo $TAG > tag.txt\n')
@@ -0,0 +1,115 @@
+import os
+from unittest.mock import Mock
+
+from testfixtures import compare, ShouldRaise, Replace
+from toml import load as parse_toml
+
+from carthorse.config import load_config
+from carthorse.documents import Documents, write_json
+from carthorse.version_from import poetry
+
+
+def counting_parser():
+    return Mock(side_effect=parse_toml)
+
+
+class TestDocuments(object):
+
+    def test_parsed_once(self, dir):
+        path = dir.write('test.toml', 'x = 1\n')
+        parse = counting_parser()
+        documents = Documents()
+        first = documents.load(path, parse)
+        second = documents.load(path, parse)
+        compare(first, expected={'x': 1})
+        assert first is second
+        compare(parse.call_count, expected=1)
+
+    def test_relative_and_absolute_paths(self, dir):
+        path = dir.write('test.toml', 'x = 1\n')
+        parse = counting_parser()
+        documents = Documents()
+        documents.load(path, parse)
+        documents.load('test.toml', parse)
+        compare(parse.call_count, expected=1)
+
+    def test_file_changed(self, dir):
+        path = dir.write('test.toml', 'x = 1\n')
+        parse = counting_parser()
+        documents = Documents()
+        documents.load(path, parse)
+        dir.write('test.toml', 'x = 22\n')
+        compare(documents.load(path, parse), expected={'x': 22})
+        compare(parse.call_count, expected=2)
+
+    def test_file_touched(self, dir):
+        path = dir.write('test.toml', 'x = 1\n')
+        parse = counting_parser()
+        documents = Documents()
+        documents.load(path, parse)
+        stat = os.stat(path)
+        os.utime(path, ns=(stat.st_atime_ns, stat.st_mtime_ns + 1000))
+        documents.load(path, parse)
+        compare(parse.call_count, expected=2)
+
+    def test_different_parsers(self, dir):
+        path = dir.write('test.toml', 'x = 1\n')
+        parse1 = counting_parser()
+        parse2 = counting_parser()
+        documents = Documents()
+        documents.load(path, parse1)
+        documents.load(path, parse2)
+        compare(parse1.call_count, expected=1)
+        compare(parse2.call_count, expected=1)
+
+    def test_bounded(self, dir):
+        parse = counting_parser()
+        documents = Documents(size=2)
+        for name in 'a', 'b', 'c':
+            dir.write(name+'.toml', 'x = 1\n')
+        for name in 'a', 'b', 'a', 'c', 'a':
+            documents.load(name+'.toml', parse)
+        compare(len(documents.cache), expected=2)
+        compare(parse.call_count, expected=3)
+
+    def test_clear(self, dir):
+        path = dir.write('test.toml', 'x = 1\n')
+        parse = counting_parser()
+        documents = Documents()
+        documents.load(path, parse)
+        documents.clear()
+        documents.load(path, parse)
+        compare(parse.call_count, expected=2)
+
+    def test_missing(self, dir):
+        with ShouldRaise(FileNotFoundError):
+            Documents().load('missing.toml', parse_toml)
+
+
+def test_config_and_version_share_parse(dir):
+    dir.write('pyproject.toml', """
+    [tool.poetry]
+    version = "1.2.3"
+    [tool.carthorse]
+    version-from = "poetry"
+    when = ["always"]
+    actions = []
+    """)
+    documents = Documents()
+    parse = counting_parser()
+    with Replace('carthorse.config.documents', documents), \
+            Replace('carthorse.version_from.documents', documents), \
+            Replace('carthorse.config.TomlConfig.parse', parse), \
+            Replace('carthorse.version_from.toml.load', parse):
+        config = load_config('pyproject.toml')
+        compare(poetry(), expected='1.2.3')
+        # config processing must not change the shared document:
+        compare(load_config('pyproject.toml').data, expected=config.data)
+    compare(parse.call_count, expected=1)
+
+
+def test_write_json(dir):
+    dir.write('data.json', 'old')
+    write_json(dir.as_path('data.json'), {'b': 1, 'a': [2]}, sort_keys=True)
+    compare(dir.read('data.json', encoding='ascii'), expected='{"a": [2], "b": 1}')
+    dir.compare(expected=['data.json'])
@@ -0,0 +1,362 @@
+import os
+import signal
+from concurrent.futures import ThreadPoolExecutor
+from subprocess import Popen, TimeoutExpired
+from threading import Event
+from time import monotonic, sleep
+from unittest.mock import Mock
+
+import pytest
+from testfixtures import compare, Replace, ShouldRaise
+
+from carthorse.execution import (
+    AsyncioBackend, SubprocessBackend, DryRunBackend, make_backend, Cancellation, Cancelled,
+    signal_group, exited, Backend, MAX_LINE,
+)
+
+
+@pytest.fixture()
+def backend():
+    backend = AsyncioBackend()
+    yield backend
+    backend.close()
+
+
+@pytest.fixture(params=[SubprocessBackend, AsyncioBackend])
+def each_backend(request):
+    backend = request.param()
+    yield backend
+    backend.close()
+
+
+class TestBackends(object):
+
+    def test_streams(self, each_backend):
+        seen = []
+        returncode = each_backend.execute('echo first && sleep 0.5 && echo second', lambda line: seen.append(
+            (line, monotonic())
+        ))
+        compare(returncode, expected=0)
+        (first, first_time), (second, second_time) = seen
+        compare([first, second], expected=['first\n', 'second\n'])
+        assert second_time - first_time > 0.3
+
+    def test_returncode(self, each_backend):
+        seen = []
+        compare(each_backend.execute('echo out && exit 3', seen.append), expected=3)
+        compare(seen, expected=['out\n'])
+
+    def test_argv(self, each_backend):
+        seen = []
+        compare(each_backend.execute(['echo', 'a;b', '$HOME'], seen.append), expected=0)
+        compare(seen, expected=['a;b $HOME\n'])
+
+    def test_cwd_and_env(self, each_backend, dir):
+        seen = []
+        each_backend.execute('pwd && echo $GREETING', seen.append, cwd=dir.path, env={'GREETING': 'hi'})
+        compare(seen, expected=[dir.path+'\n', 'hi\n'])
+
+    def test_not_found(self, each_backend):
+        seen = []
+        compare(each_backend.execute(['/does/not/exist'], seen.append), expected=127)
+        compare(seen, expected=['/does/not/exist: No such file or directory\n'])
+
+    def test_not_executable(self, each_backend):
+        seen = []
+        compare(each_backend.execute(['/dev/null'], seen.append), expected=126)
+        compare(seen, expected=['/dev/null: Permission denied\n'])
+
+    def test_long_line_and_no_newline(self, each_backend):
+        seen = []
+        each_backend.execute(['python', '-c', "print('x' * 10000); print('end', end='')"], seen.append)
+        compare(seen, expected=['x' * 4096, 'x' * 4096, 'x' * 1808 + '\n', 'end'])
+
+    def test_no_newlines(self, each_backend):
+        seen = []
+        each_backend.execute(['python', '-c', "print('\\r'.join(['50%'] * 5000), end='')"], seen.append)
+        assert max(len(piece) for piece in seen) <= MAX_LINE
+        compare(''.join(seen), expected='\r'.join(['50%'] * 5000))
+
+    def test_invalid_utf8(self, each_backend):
+        seen = []
+        each_backend.execute(r"printf 'caf\351\n'", seen.append)
+        compare(seen, expected=['caf\ufffd\n'])
+
+    def test_multibyte_character_split_across_reads(self, each_backend):
+        seen = []
+        with Replace('carthorse.execution.READ_SIZE', 1):
+            each_backend.execute(['printf', 'caf\\303\\251\\n'], seen.append)
+        compare(''.join(seen), expected='caf\u00e9\n')
+
+
+class TestSubprocessBackend(object):
+
+    def test_argv_without_shell(self):
+        seen = []
+        with Replace('carthorse.execution.Popen', Mock(wraps=Popen)) as popen:
+            compare(SubprocessBackend().execute(['echo', 'a;b'], seen.append), expected=0)
+        compare(seen, expected=['a;b\n'])
+        compare(popen.call_args.kwargs['shell'], expected=False)
+
+
+class TestAsyncioBackend(object):
+
+    def test_overlaps(self, dir):
+        # each command waits for all four to have started:
+        command = (f'touch {dir.path}/$N && '
+                   f'until [ $(ls {dir.path} | wc -l) -eq 4 ]; do sleep 0.01; done')
+        backend = AsyncioBackend(limit=4, timeout=30)
+        try:
+            with ThreadPoolExecutor(max_workers=4) as executor:
+                results = list(executor.map(
+                    lambda n: backend.execute(command, print, env=dict(os.environ, N=str(n))),
+                    range(4),
+                ))
+            compare(results, expected=[0, 0, 0, 0])
+        finally:
+            backend.close()
+
+    def test_limit(self, dir):
+        # mkdir fails if the directory exists, so this fails if commands overlap:
+        command = f'mkdir {dir.path}/running && sleep 0.05 && rmdir {dir.path}/running'
+        backend = AsyncioBackend(limit=1)
+        try:
+            with ThreadPoolExecutor(max_workers=3) as executor:
+                results = list(executor.map(lambda _: backend.execute(command, print), range(3)))
+            compare(results, expected=[0, 0, 0])
+        finally:
+            backend.close()
+
+    def test_backend_timeout(self):
+        backend = AsyncioBackend(timeout=0.2)
+        try:
+            start = monotonic()
+            with ShouldRaise(TimeoutExpired(['sleep', '5'], 0.2)):
+                backend.execute(['sleep', '5'], print)
+            assert monotonic() - start < 2
+        finally:
+            backend.close()
+
+    def test_close_and_reuse(self, backend):
+        compare(backend.execute('true', print), expected=0)
+        backend.close()
+        compare(backend.loop, expected=None)
+        compare(backend.execute('true', print), expected=0)
+
+    def test_close_not_started(self, backend):
+        backend.close()
+
+
+class TestUsage(object):
+
+    def test_subprocess(self):
+        usage = []
+        SubprocessBackend().execute(
+            ['python', '-c', 'open("/dev/null", "w").write("x")'], print, usage=usage.append
+        )
+        measured, = usage
+        assert measured.wall > 0
+        assert measured.user + measured.system > 0
+        assert measured.max_rss > 2**20
+
+    def test_subprocess_timeout(self):
+        usage = []
+        with ShouldRaise(TimeoutExpired(['sleep', '5'], 0.1)):
+            SubprocessBackend().execute(['sleep', '5'], print, timeout=0.1, usage=usage.append)
+        measured, = usage
+        assert 0.1 <= measured.wall < 2, measured
+        assert measured.max_rss is not None
+
+    def test_asyncio(self, backend):
+        usage = []
+        backend.execute(['true'], print, usage=usage.append)
+        measured, = usage
+        assert measured.wall > 0
+        compare(measured.max_rss, expected=None)
+
+
+class TestMakeBackend(object):
+
+    def test_name(self):
+        assert isinstance(make_backend('subprocess'), SubprocessBackend)
+
+    def test_params(self):
+        backend = make_backend({'name': 'asyncio', 'limit': 8, 'timeout': 60})
+        assert isinstance(backend, AsyncioBackend)
+        compare(backend.limit, expected=8)
+        compare(backend.timeout, expected=60)
+
+    def test_unknown(self):
+        with ShouldRaise(ValueError(
+                "backend must be one of ('subprocess', 'asyncio'), not 'foo'"
+        )):
+            make_backend('foo')
+
+    def test_dry_run_close(self):
+        DryRunBackend().close()
+
+    def test_interface(self):
+        backend = Backend()
+        with ShouldRaise(NotImplementedError):
+            backend.execute('true', print)
+        backend.close()
+
+
+def process_exists(pid):
+    try:
+        os.kill(pid, 0)
+    except ProcessLookupError:
+        return False
+    # it may be a zombie that has not yet been reaped:
+    with open(f'/proc/{pid}/stat') as source:
+        return source.read().split(')')[-1].split()[0] != 'Z'
+
+
+@pytest.mark.parametrize('backend_class', [SubprocessBackend, AsyncioBackend])
+class TestTimeout(object):
+
+    def run(self, backend, command, timeout):
+        seen = []
+        start = monotonic()
+        try:
+            with ShouldRaise(TimeoutExpired(command, timeout)):
+                backend.execute(command, seen.append, timeout=timeout)
+        finally:
+            backend.close()
+        return seen, monotonic() - start
+
+    def test_process_group_terminated(self, backend_class, dir):
+        command = 'sleep 30 & echo $! > child.pid; echo started; wait'
+        seen, duration = self.run(backend_class(), command, 0.3)
+        compare(seen, expected=['started\n'])
+        assert duration < 2, duration
+        child = int(dir.read('child.pid'))
+        sleep(0.1)
+        assert not process_exists(child)
+
+    def test_killed_after_grace(self, backend_class):
+        command = ['sh', '-c', 'trap "" TERM; echo trapped; sleep 30']
+        seen, duration = self.run(backend_class(grace=0.3), command, 0.3)
+        compare(seen, expected=['trapped\n'])
+        assert 0.6 <= duration < 2, duration
+
+    def test_finishes_in_time(self, backend_class):
+        backend = backend_class()
+        try:
+            compare(backend.execute(['true'], print, timeout=5), expected=0)
+        finally:
+            backend.close()
+
+
+class TestSubprocessBackendStopping(object):
+
+    def test_output_raises_kills_process_group(self, dir):
+        command = 'sleep 30 & echo $! > child.pid; echo started; wait'
+
+        def output(line):
+            raise KeyboardInterrupt()
+
+        with ShouldRaise(KeyboardInterrupt()):
+            SubprocessBackend().execute(command, output, timeout=30)
+        child = int(dir.read('child.pid'))
+        sleep(0.1)
+        assert not process_exists(child)
+
+    def test_terminate_already_exited(self):
+        process = Popen(['true'])
+        while not exited(process):
+            sleep(0.01)
+        stopped = Event()
+        SubprocessBackend().terminate(process, stopped)
+        assert not stopped.is_set()
+        compare(process.wait(), expected=0)
+
+    def test_signal_group_gone(self):
+        process = Popen(['true'], start_new_session=True)
+        process.wait()
+        signal_group(process.pid, signal.SIGKILL)
+
+
+@pytest.mark.parametrize('backend_class', [SubprocessBackend, AsyncioBackend])
+class TestCancellation(object):
+
+    def test_process_group_terminated(self, backend_class, dir):
+        command = 'sleep 30 & echo $! > child.pid; echo started; wait'
+        backend = backend_class()
+        cancel = Cancellation()
+        seen = []
+
+        def output(line):
+            seen.append(line)
+            cancel.cancel()
+
+        try:
+            with ShouldRaise(Cancelled(command)):
+                backend.execute(command, output, cancel=cancel)
+        finally:
+            backend.close()
+        compare(seen, expected=['started\n'])
+        child = int(dir.read('child.pid'))
+        sleep(0.1)
+        assert not process_exists(child)
+
+    def test_already_cancelled(self, backend_class, dir):
+        backend = backend_class()
+        cancel = Cancellation()
+        cancel.cancel()
+        try:
+            with ShouldRaise(Cancelled(['touch', 'ran'])):
+                backend.execute(['touch', 'ran'], print, cwd=dir.path, cancel=cancel)
+        finally:
+            backend.close()
+        dir.compare(expected=[])
+
+    def test_not_cancelled(self, backend_class):
+        backend = backend_class()
+        cancel = Cancellation()
+        try:
+            compare(backend.execute(['true'], print, cancel=cancel), expected=0)
+        finally:
+            backend.close()
+        compare(cancel.callbacks, expected=[])
+        cancel.cancel()
+
+
+class TestCancellationCallbacks(object):
+
+    def test_cancelled_during(self):
+        called = []
+        cancel = Cancellation()
+        with cancel.watch(lambda: called.append(1)):
+            cancel.cancel()
+        compare(called, expected=[1])
+        compare(cancel.callbacks, expected=[])
+
+    def test_already_cancelled(self):
+        called = []
+        cancel = Cancellation()
+        cancel.cancel()
+        with cancel.watch(lambda: called.append(1)):
+            compare(called, expected=[1])
+
+    def test_cancelled_after(self):
+        called = []
+        cancel = Cancellation()
+        with cancel.watch(lambda: called.append(1)):
+            pass
+        cancel.cancel()
+        compare(called, expected=[])
+
+
+@pytest.mark.parametrize('backend_class', [SubprocessBackend, AsyncioBackend])
+@pytest.mark.parametrize('command', ['echo hello', ['echo', 'hello']])
+def test_cwd_does_not_exist(backend_class, command, dir):
+    backend = backend_class()
+    seen = []
+    try:
+        with ShouldRaise(FileNotFoundError) as s:
+            backend.execute(command, seen.append, cwd=dir.getpath('missing'))
+    finally:
+        backend.close()
+    compare(s.raised.filename, expected=dir.getpath('missing'))
+    compare(seen, expected=[])
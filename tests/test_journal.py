@@ -0,0 +1,91 @@
+import json
+
+from testfixtures import compare, ShouldRaise
+
+from carthorse.context import RunContext
+from carthorse.journal import Journal
+from carthorse.refs import UnsupportedRepository
+
+
+def make_journal(dir, tag='v1.0', commit='abc123'):
+    return Journal(dir.as_path('journal.json'), tag, commit)
+
+
+class TestJournal(object):
+
+    def test_find(self, git):
+        git.make_repo_with_content()
+        journal = Journal.find(RunContext(tag='v1.0', cwd=git.dir.getpath('local')))
+        compare(journal.path, expected=git.dir.as_path('local/.git/carthorse-journal.json'))
+        compare(journal.tag, expected='v1.0')
+        compare(journal.commit, expected=git.rev_parse('HEAD'))
+
+    def test_find_no_repo(self, dir):
+        with ShouldRaise(UnsupportedRepository):
+            Journal.find(RunContext(cwd=dir.path, env={}))
+
+    def test_find_no_commit(self, git):
+        git.dir.makedir('local')
+        git('init')
+        with ShouldRaise(UnsupportedRepository(f"no commit checked out in {git.dir.getpath('local')}")):
+            Journal.find(RunContext(cwd=git.dir.getpath('local')))
+
+    def test_key(self):
+        action = {'name': 'run', 'args': ('echo 1',), 'kw': {}, 'timeout': 10}
+        key = Journal.key(0, action)
+        compare(Journal.key(0, dict(action, timeout=20)), expected=key)
+        assert Journal.key(1, action) != key
+        assert Journal.key(0, dict(action, args=('echo 2',))) != key
+
+    def test_missing(self, dir):
+        journal = make_journal(dir)
+        compare(journal.completed(), expected=set())
+        compare(journal.pushes(), expected={})
+
+    def test_started(self, dir):
+        journal = make_journal(dir)
+        compare(journal.started(), expected=False)
+        journal.record()
+        compare(journal.started(), expected=True)
+        compare(journal.completed(), expected=set())
+        compare(make_journal(dir, commit='other').started(), expected=False)
+
+    def test_corrupt(self, dir):
+        dir.write('journal.json', '{')
+        compare(make_journal(dir).completed(), expected=set())
+
+    def test_record(self, dir):
+        journal = make_journal(dir)
+        journal.record('a')
+        journal.record('b', 'a')
+        compare(journal.completed(), expected={'a', 'b'})
+        compare(json.loads(dir.read('journal.json')), expected={
+            'v1.0': {'commit': 'abc123', 'actions': ['a', 'b'], 'pushes': {}},
+        })
+
+    def test_record_pushes(self, dir):
+        journal = make_journal(dir)
+        journal.record('a', pushes={'origin': {'v1.0': False}})
+        journal.record('b')
+        compare(journal.pushes(), expected={'origin': {'v1.0': False}})
+
+    def test_other_commit(self, dir):
+        make_journal(dir, commit='old').record('a')
+        journal = make_journal(dir)
+        compare(journal.completed(), expected=set())
+        journal.record('b')
+        compare(journal.completed(), expected={'b'})
+        compare(make_journal(dir, commit='old').completed(), expected=set())
+
+    def test_other_tags(self, dir):
+        make_journal(dir, tag='lib-v1.0').record('a')
+        journal = make_journal(dir, tag='app-v2.0')
+        journal.record('b')
+        journal.clear()
+        compare(json.loads(dir.read('journal.json')), expected={
+            'lib-v1.0': {'commit': 'abc123', 'actions': ['a'], 'pushes': {}},
+        })
+
+    def test_clear_missing(self, dir):
+        make_journal(dir).clear()
+        dir.compare(expected=[])
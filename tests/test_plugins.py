@@ -1,6 +1,13 @@
-from testfixtures import compare
+import os
+from importlib.metadata import EntryPoint, EntryPoints
+from pathlib import Path
+from unittest.mock import Mock, call
 
-from carthorse.plugins import Plugins
+from testfixtures import compare, ShouldRaise, Replace, not_there
+
+from carthorse.plugins import (
+    Plugins, LazyPlugins, discover, cache_path, cost, estimate, COSTS
+)
 
 
 def test_load_plugins():
@@ -18,3 +25,148 @@ def test_load_plugins():
         'when': ['always', 'never', 'version-not-tagged'],
         'actions': ['create-tag', 'run', 'update-major-tag'],
     })
+
+
+def make_entrypoint(name, group='carthorse.actions'):
+    return EntryPoint(name, f'tests.missing_module:{name}', group)
+
+
+class TestLazyPlugins(object):
+
+    def test_not_imported_until_looked_up(self):
+        ep = Mock(spec=EntryPoint)
+        ep.name = 'thing'
+        plugins = LazyPlugins()
+        plugins.register(ep)
+        compare(ep.load.mock_calls, expected=[])
+        assert 'thing' in plugins
+        compare(list(plugins), expected=['thing'])
+        compare(ep.load.mock_calls, expected=[])
+        assert plugins['thing'] is ep.load.return_value
+        assert plugins['thing'] is ep.load.return_value
+        compare(ep.load.mock_calls, expected=[call()])
+
+    def test_broken_plugin_only_matters_when_used(self):
+        plugins = LazyPlugins()
+        plugins.register(make_entrypoint('broken'))
+        plugins['ok'] = ok = lambda: None
+        compare(plugins['ok'], expected=ok)
+        with ShouldRaise(ModuleNotFoundError):
+            plugins['broken']
+
+    def test_missing(self):
+        plugins = LazyPlugins()
+        with ShouldRaise(KeyError('foo')):
+            plugins['foo']
+        with ShouldRaise(KeyError('foo')):
+            del plugins['foo']
+
+    def test_mapping_interface(self):
+        plugins = LazyPlugins()
+        plugins.register(make_entrypoint('a'))
+        plugins['b'] = b = lambda: None
+        plugins['a'] = a = lambda: None
+        compare(len(plugins), expected=2)
+        compare(dict(plugins), expected={'a': a, 'b': b})
+        del plugins['a']
+        compare(dict(plugins), expected={'b': b})
+        compare(repr(plugins), expected='<LazyPlugins: b>')
+
+    def test_load_does_not_import(self):
+        with Replace('carthorse.plugins.entry_points', lambda: EntryPoints([
+            make_entrypoint('broken')
+        ])):
+            plugins = Plugins.load()
+        compare(list(plugins['actions']), expected=['broken'])
+
+
+class TestDiscover(object):
+
+    def test_cached(self, cache_dir):
+        installed = Mock(return_value=EntryPoints([
+            make_entrypoint('foo', 'carthorse.when'),
+            make_entrypoint('bar', 'other.group'),
+        ]))
+        with Replace('carthorse.plugins.entry_points', installed):
+            first = discover()
+            second = discover()
+        expected = [make_entrypoint('foo', 'carthorse.when')]
+        compare(first, expected=expected)
+        compare(second, expected=expected)
+        compare(installed.mock_calls, expected=[call()])
+        assert (cache_dir / 'entry-points.json').exists()
+
+    def test_installed_set_changes(self, cache_dir, dir):
+        installed = Mock(return_value=EntryPoints([make_entrypoint('foo')]))
+        with Replace('carthorse.plugins.entry_points', installed), \
+                Replace('sys.path', [dir.path]):
+            discover()
+            dir.makedir('new_package-1.0.dist-info')
+            discover()
+        compare(installed.mock_calls, expected=[call(), call()])
+
+    def test_entry_points_edited(self, cache_dir, dir):
+        installed = Mock(return_value=EntryPoints([make_entrypoint('foo')]))
+        dir.makedir('other-1.0.dist-info')
+        path = dir.write('package.egg-info/entry_points.txt', '[carthorse.when]\n')
+        with Replace('carthorse.plugins.entry_points', installed), \
+                Replace('sys.path', [dir.path, dir.getpath('missing'), path]):
+            discover()
+            discover()
+            dir.write('package.egg-info/entry_points.txt', '[carthorse.when]\nfoo = x:y\n')
+            os.utime(path, ns=(0, 0))
+            discover()
+        compare(installed.mock_calls, expected=[call(), call()])
+
+    def test_corrupt_cache(self, cache_dir):
+        (cache_dir / 'entry-points.json').write_text('{')
+        installed = Mock(return_value=EntryPoints([make_entrypoint('foo')]))
+        with Replace('carthorse.plugins.entry_points', installed):
+            compare(discover(), expected=[make_entrypoint('foo')])
+        compare(installed.mock_calls, expected=[call()])
+
+    def test_cache_not_writable(self, dir):
+        dir.write('file', '')
+        installed = Mock(return_value=EntryPoints([make_entrypoint('foo')]))
+        with Replace('carthorse.plugins.entry_points', installed), \
+                Replace('os.environ.CARTHORSE_CACHE', dir.getpath('file'), strict=False):
+            compare(discover(), expected=[make_entrypoint('foo')])
+
+    def test_disabled(self):
+        installed = Mock(return_value=EntryPoints([make_entrypoint('foo')]))
+        with Replace('carthorse.plugins.entry_points', installed), \
+                Replace('os.environ.CARTHORSE_CACHE', '', strict=False):
+            discover()
+            discover()
+        compare(installed.mock_calls, expected=[call(), call()])
+
+    def test_default_location(self):
+        with Replace('os.environ.CARTHORSE_CACHE', not_there, strict=False), \
+                Replace('os.environ.XDG_CACHE_HOME', '/cache', strict=False):
+            compare(cache_path(), expected=Path('/cache/carthorse/entry-points.json'))
+
+
+class TestCost(object):
+
+    def test_declared(self):
+        @cost('local')
+        def plugin():
+            pass
+        compare(plugin.cost, expected='local')
+        compare(estimate(plugin), expected=COSTS['local'])
+
+    def test_not_declared(self):
+        compare(estimate(lambda: None), expected=COSTS['network'])
+
+    def test_invalid(self):
+        with ShouldRaise(ValueError(
+                "cost must be one of ('local', 'subprocess', 'network'), not 'cheap'"
+        )):
+            cost('cheap')
+
+    def test_builtin(self):
+        plugins = Plugins.load()
+        compare(
+            {name: plugin.cost for name, plugin in plugins['when'].items()},
+            expected={'always': 'local', 'never': 'local', 'version-not-tagged': 'network'}
+        )
@@ -0,0 +1,99 @@
+import os
+import pstats
+import sys
+from time import monotonic
+
+from testfixtures import compare
+
+from carthorse.profiling import Profiler, CProfiler, StackSampler, collapse
+
+
+def busy(seconds=0.1):
+    end = monotonic() + seconds
+    while monotonic() < end:
+        pass
+
+
+def other():
+    busy(0.01)
+
+
+def functions(path):
+    return {name for _, _, name in pstats.Stats(path).stats}
+
+
+class TestProfiler(object):
+
+    def test_does_nothing(self):
+        profiler = Profiler()
+        with profiler.phase('when'):
+            pass
+        profiler.close()
+
+
+class TestCProfiler(object):
+
+    def test_phases(self, dir):
+        profiler = CProfiler(dir.getpath('profile'))
+        with profiler.phase('when'):
+            busy(0.01)
+        with profiler.phase('actions'):
+            other()
+        with profiler.phase('when'):
+            other()
+        profiler.close()
+        compare(sorted(os.listdir(dir.getpath('profile'))),
+                expected=['actions.pstats', 'when.pstats'])
+        assert {'busy', 'other'} <= functions(dir.getpath('profile/when.pstats'))
+        assert 'other' in functions(dir.getpath('profile/actions.pstats'))
+
+    def test_overlapping(self, dir):
+        profiler = CProfiler(dir.getpath('profile'))
+        with profiler.phase('outer'):
+            with profiler.phase('inner'):
+                other()
+        profiler.close()
+        compare(os.listdir(dir.getpath('profile')), expected=['outer.pstats'])
+        assert 'other' in functions(dir.getpath('profile/outer.pstats'))
+
+
+def read_collapsed(path):
+    stacks = {}
+    with open(path) as source:
+        for line in source:
+            stack, count = line.rsplit(' ', 1)
+            stacks[stack] = int(count)
+    return stacks
+
+
+class TestStackSampler(object):
+
+    def test_phases(self, dir):
+        profiler = StackSampler(dir.getpath('profile'), interval=0.001)
+        with profiler.phase('actions'):
+            busy(0.2)
+        profiler.close()
+        assert not profiler.thread.is_alive()
+        stacks = read_collapsed(dir.getpath('profile/actions.collapsed'))
+        busy_stacks = [stack for stack in stacks if stack.endswith('test_profiling:busy')]
+        assert busy_stacks, stacks
+        assert sum(stacks[stack] for stack in busy_stacks) > 10, stacks
+        assert f'{__name__}:TestStackSampler.test_phases' in busy_stacks[0]
+
+    def test_previous_phase_restored(self, dir):
+        profiler = StackSampler(dir.getpath('profile'))
+        with profiler.phase('outer'):
+            with profiler.phase('inner'):
+                compare(profiler.current, expected='inner')
+            compare(profiler.current, expected='outer')
+        compare(profiler.current, expected='carthorse')
+        profiler.close()
+
+
+def test_collapse():
+    def inner():
+        return collapse(sys._getframe())
+    stack = inner().split(';')
+    compare(stack[-2:], expected=[
+        f'{__name__}:test_collapse', f'{__name__}:test_collapse.<locals>.inner'
+    ])
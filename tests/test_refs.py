@@ -0,0 +1,183 @@
+import os
+from unittest.mock import Mock
+
+from testfixtures import compare, ShouldRaise, Replacer, StringComparison
+
+from carthorse.refs import RefStore, UnsupportedRepository, search_packed
+from carthorse.when import tag_rev
+from conftest import GitHelper
+
+
+def make_tags(git: GitHelper, *names, annotated=False):
+    for name in names:
+        if annotated:
+            git(f'tag -a -m {name} {name}')
+        else:
+            git(f'tag {name}')
+
+
+class TestRefStore(object):
+
+    def test_loose(self, git: GitHelper):
+        git.make_repo_with_content()
+        make_tags(git, 'v1.0', 'v1.1')
+        store = RefStore.find(git.dir.getpath(git.repo))
+        compare(store.resolve('refs/tags/v1.0'), expected=git.rev_parse('v1.0'))
+        compare(store.resolve('refs/tags/v2.0'), expected=None)
+
+    def test_packed(self, git: GitHelper):
+        git.make_repo_with_content()
+        names = [f'v{i}.{j}' for i in range(10) for j in range(10)]
+        make_tags(git, *names)
+        git('pack-refs --all')
+        store = RefStore.find(git.dir.getpath(git.repo))
+        rev = git.rev_parse('HEAD')
+        for name in names:
+            compare(store.resolve('refs/tags/'+name), expected=rev)
+        for name in 'v', 'v0', 'v0.10', 'v99', 'a', 'z':
+            compare(store.resolve('refs/tags/'+name), expected=None)
+
+    def test_packed_annotated(self, git: GitHelper):
+        git.make_repo_with_content()
+        names = [f'v{i}' for i in range(20)]
+        make_tags(git, *names, annotated=True)
+        git('pack-refs --all')
+        store = RefStore.find(git.dir.getpath(git.repo))
+        for name in names:
+            compare(store.resolve('refs/tags/'+name), expected=git.rev_parse(name))
+        compare(store.resolve('refs/tags/v20'), expected=None)
+
+    def test_loose_overrides_packed(self, git: GitHelper):
+        git.make_repo_with_content()
+        make_tags(git, 'v1')
+        git('pack-refs --all')
+        git.dir.write('local/b', 'changed')
+        git('commit -am changed')
+        git('tag --force v1')
+        store = RefStore.find(git.dir.getpath(git.repo))
+        compare(store.resolve('refs/tags/v1'), expected=git.rev_parse('HEAD'))
+
+    def test_symbolic(self, git: GitHelper):
+        git.make_repo_with_content()
+        store = RefStore.find(git.dir.getpath(git.repo))
+        compare(store.resolve('HEAD'), expected=git.rev_parse('HEAD'))
+
+    def test_from_subdirectory(self, git: GitHelper):
+        git.make_repo_with_content()
+        make_tags(git, 'v1')
+        store = RefStore.find(git.dir.makedir('local/sub/dir'))
+        compare(store.resolve('refs/tags/v1'), expected=git.rev_parse('v1'))
+
+    def test_worktree(self, git: GitHelper):
+        git.make_repo_with_content()
+        make_tags(git, 'v1')
+        git(f"worktree add {git.dir.getpath('worktree')}")
+        store = RefStore.find(git.dir.getpath('worktree'))
+        compare(store.resolve('refs/tags/v1'), expected=git.rev_parse('v1'))
+
+    def test_invalid_names(self, git: GitHelper):
+        git.make_repo_with_content()
+        store = RefStore.find(git.dir.getpath(git.repo))
+        for name in 'refs/tags/../../config', 'refs/tags/v1 2', 'refs/tags/.v1', 'refs//x':
+            compare(store.resolve(name), expected=None)
+
+    def test_symbolic_loop(self, git: GitHelper):
+        git.make_repo_with_content()
+        git.dir.write('local/.git/refs/heads/a', 'ref: refs/heads/b\n')
+        git.dir.write('local/.git/refs/heads/b', 'ref: refs/heads/a\n')
+        store = RefStore.find(git.dir.getpath(git.repo))
+        compare(store.resolve('refs/heads/a'), expected=None)
+
+    def test_empty_packed_refs(self, git: GitHelper):
+        git.make_repo_with_content()
+        git.dir.write('local/.git/packed-refs', '')
+        store = RefStore.find(git.dir.getpath(git.repo))
+        compare(store.resolve('refs/tags/v1'), expected=None)
+
+    def test_not_a_repo(self, dir):
+        with ShouldRaise(UnsupportedRepository):
+            RefStore.find(dir.path)
+
+    def test_unexpected_dot_git_file(self, dir):
+        dir.write('.git', 'rubbish')
+        with ShouldRaise(UnsupportedRepository(f"unexpected content in {dir.getpath('.git')}")):
+            RefStore.find(dir.path)
+
+    def test_reftable_directory(self, git: GitHelper):
+        git.make_repo_with_content()
+        git.dir.makedir('local/.git/reftable')
+        with ShouldRaise(UnsupportedRepository(
+                f"{git.dir.getpath('local/.git')} uses reftable"
+        )):
+            RefStore.find(git.dir.getpath(git.repo))
+
+    def test_reftable(self, git: GitHelper):
+        git.make_repo_with_content()
+        git('config extensions.refStorage reftable')
+        with ShouldRaise(UnsupportedRepository(
+                StringComparison('.+ uses reftable refs')
+        )):
+            RefStore.find(git.dir.getpath(git.repo))
+
+
+class TestSearchPacked(object):
+
+    def test_empty(self):
+        compare(search_packed(b'', b'refs/tags/v1'), expected=None)
+
+    def test_unsorted(self):
+        data = (
+            b'# pack-refs with: peeled\n'
+            b'2222 refs/tags/v2\n'
+            b'1111 refs/tags/v1\n'
+        )
+        compare(search_packed(data, b'refs/tags/v1'), expected='1111')
+        compare(search_packed(data, b'refs/tags/v3'), expected=None)
+
+    def test_no_header(self):
+        data = b'1111 refs/tags/v1\n'
+        compare(search_packed(data, b'refs/tags/v1'), expected='1111')
+
+    def test_sorted_peeled(self):
+        data = (
+            b'# pack-refs with: peeled fully-peeled sorted \n'
+            b'1111 refs/tags/a\n'
+            b'^aaaa\n'
+            b'2222 refs/tags/b\n'
+            b'^bbbb\n'
+            b'3333 refs/tags/c\n'
+            b'^cccc\n'
+            b'4444 refs/tags/d'
+        )
+        for name, expected in ('a', '1111'), ('b', '2222'), ('c', '3333'), ('d', '4444'):
+            compare(search_packed(data, b'refs/tags/'+name.encode()), expected=expected)
+        for name in '0', 'bb', 'e':
+            compare(search_packed(data, b'refs/tags/'+name.encode()), expected=None)
+
+
+class TestTagRev(object):
+
+    def test_in_process(self, git: GitHelper, capfd):
+        git.make_repo_with_content()
+        make_tags(git, 'v1')
+        os.chdir(git.dir.getpath(git.repo))
+        compare(tag_rev('v1'), expected=git.rev_parse('v1'))
+        compare(tag_rev('v2'), expected=None)
+        compare(capfd.readouterr().out, expected='')
+
+    def test_fallback(self, git: GitHelper, capfd):
+        git.make_repo_with_content()
+        make_tags(git, 'v1')
+        os.chdir(git.dir.getpath(git.repo))
+        with Replacer() as replace:
+            replace('carthorse.refs.RefStore._check_format', Mock(
+                side_effect=UnsupportedRepository('reftable')
+            ))
+            compare(tag_rev('v1'), expected=git.rev_parse('v1'))
+            compare(tag_rev('v2'), expected=None)
+        compare(capfd.readouterr().out, expected=(
+            '$ git rev-parse --verify -q refs/tags/v1\n'
+            f"{git.rev_parse('v1')}\n"
+            '$ git rev-parse --verify -q refs/tags/v2\n'
+            'returncode=1\n'
+        ))
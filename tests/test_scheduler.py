@@ -0,0 +1,245 @@
+from threading import Event, Lock
+from time import sleep, monotonic
+
+from testfixtures import compare, ShouldRaise
+
+from carthorse.actions import execute
+from carthorse.context import cancellable
+from carthorse.execution import Cancellation, Cancelled
+from carthorse.scheduler import (
+    dependencies, dependency_order, run_in_order, first_failure, by_cost
+)
+
+
+def item(name, **options):
+    return dict(name=name, args=(), kw={}, **options)
+
+
+class TestDependencies(object):
+
+    def test_default_is_sequential(self):
+        compare(dependencies([item('a'), item('b'), item('c')]),
+                expected=[set(), {0}, {0, 1}])
+
+    def test_needs(self):
+        compare(dependencies([
+            item('docs', id='docs'),
+            item('wheel', id='wheel', needs=[]),
+            item('image', needs='wheel'),
+            item('tag', needs=['docs', 'wheel']),
+            item('after'),
+        ]), expected=[set(), set(), {1}, {0, 1}, {0, 1, 2, 3}])
+
+    def test_unknown(self):
+        with ShouldRaise(ValueError(
+                "'tag' needs 'docs', which is not the id of an earlier action"
+        )):
+            dependencies([item('tag', needs=['docs']), item('docs', id='docs')])
+
+    def test_duplicate_id(self):
+        with ShouldRaise(ValueError("More than one action has an id of 'x'")):
+            dependencies([item('a', id='x'), item('b', id='x')])
+
+
+class TestDependencyOrder(object):
+
+    def test_order_kept(self):
+        compare(dependency_order({'a': [], 'b': [], 'c': []}), expected=['a', 'b', 'c'])
+
+    def test_needs(self):
+        compare(dependency_order({'app': ['lib', 'util'], 'lib': ['util'], 'util': [], 'x': []}),
+                expected=['util', 'lib', 'app', 'x'])
+
+    def test_unknown(self):
+        with ShouldRaise(ValueError("'app' needs 'lib', which does not exist")):
+            dependency_order({'app': ['lib']})
+
+    def test_circular(self):
+        with ShouldRaise(ValueError("Circular dependency between 'a', 'b'")):
+            dependency_order({'a': ['b'], 'b': ['a'], 'c': []})
+
+
+class Recorder(object):
+
+    def __init__(self, fail=(), delay=0.05):
+        self.fail = fail
+        self.delay = delay
+        self.lock = Lock()
+        self.started = []
+        self.finished = []
+        self.active = 0
+        self.max_active = 0
+
+    def __call__(self, item):
+        name = item['name']
+        with self.lock:
+            self.started.append(name)
+            self.active += 1
+            self.max_active = max(self.max_active, self.active)
+        sleep(self.delay)
+        with self.lock:
+            self.active -= 1
+            self.finished.append(name)
+        if name in self.fail:
+            raise SystemExit(name)
+
+
+class TestRunInOrder(object):
+
+    def test_sequential(self):
+        recorder = Recorder()
+        run_in_order([item('a'), item('b', needs=[]), item('c')], recorder)
+        compare(recorder.started, expected=['a', 'b', 'c'])
+        compare(recorder.max_active, expected=1)
+
+    def test_sequential_failure(self):
+        recorder = Recorder(fail=['b'])
+        with ShouldRaise(SystemExit('b')):
+            run_in_order([item('a'), item('b'), item('c', needs=[])], recorder)
+        compare(recorder.started, expected=['a', 'b'])
+
+    def test_parallel(self):
+        recorder = Recorder()
+        run_in_order([
+            item('docs', id='docs', needs=[]),
+            item('wheel', id='wheel', needs=[]),
+            item('image', id='image', needs=[]),
+            item('tag'),
+        ], recorder, jobs=3)
+        compare(recorder.max_active, expected=3)
+        compare(sorted(recorder.finished[:3]), expected=['docs', 'image', 'wheel'])
+        compare(recorder.started[-1], expected='tag')
+
+    def test_jobs_limit(self):
+        recorder = Recorder()
+        run_in_order([item(str(i), needs=[]) for i in range(6)], recorder, jobs=2)
+        compare(recorder.max_active, expected=2)
+        compare(sorted(recorder.finished), expected=[str(i) for i in range(6)])
+
+    def test_dependent_not_run_after_failure(self):
+        recorder = Recorder(fail=['wheel'])
+        with ShouldRaise(SystemExit('wheel')):
+            run_in_order([
+                item('docs', id='docs', needs=[]),
+                item('wheel', id='wheel', needs=[]),
+                item('upload', needs=['wheel']),
+                item('tag'),
+            ], recorder, jobs=4)
+        compare(sorted(recorder.started), expected=['docs', 'wheel'])
+
+    def test_running_actions_finish_before_failure_raised(self):
+        finished = Event()
+
+        def call(item):
+            if item['name'] == 'fail':
+                raise SystemExit(1)
+            sleep(0.1)
+            finished.set()
+
+        with ShouldRaise(SystemExit(1)):
+            run_in_order([item('slow', needs=[]), item('fail', needs=[])], call, jobs=2)
+        assert finished.is_set()
+
+
+class TestFirstFailure(object):
+
+    def test_sequential(self):
+        calls = []
+
+        def call(item):
+            calls.append(item['name'])
+            return item['name'] != 'b'
+
+        compare(first_failure([item('a'), item('b'), item('c')], call), expected=item('b'))
+        compare(calls, expected=['a', 'b'])
+
+    def test_sequential_all_pass(self):
+        compare(first_failure([item('a'), item('b')], lambda item: True), expected=None)
+
+    def test_concurrent_all_pass(self):
+        recorder = Recorder()
+
+        def call(item):
+            recorder(item)
+            return True
+
+        compare(first_failure([item('a'), item('b'), item('c')], call, jobs=3), expected=None)
+        compare(recorder.max_active, expected=3)
+
+    def test_concurrent_stops_early(self):
+        started = []
+        slow_running = Event()
+        outcomes = {}
+
+        def call(item):
+            started.append(item['name'])
+            if item['name'] == 'fail':
+                slow_running.wait()
+                return False
+            try:
+                execute(['sh', '-c', 'echo running; sleep 30'], lambda line: slow_running.set())
+            except Exception as e:
+                outcomes[item['name']] = e
+                raise
+            return True  # pragma: no cover
+
+        items = [item('fail'), item('slow')] + [item(f'later{i}') for i in range(10)]
+        start = monotonic()
+        compare(first_failure(items, call, jobs=2), expected=item('fail'))
+        assert monotonic() - start < 10
+        compare(outcomes['slow'], expected=Cancelled(['sh', '-c', 'echo running; sleep 30']))
+        # a later check may have started before the cancellation, but is also cancelled:
+        assert len(started) < 4, started
+        compare(set(outcomes), expected=set(started) - {'fail'})
+
+    def test_cancelled_before_command_started(self):
+        cancel = Cancellation()
+        cancel.cancel()
+        with cancellable(cancel):
+            with ShouldRaise(Cancelled(['true'])):
+                execute(['true'], print)
+
+    def test_concurrent_earlier_failure_wins(self):
+        def call(item):
+            if item['name'] == 'early':
+                sleep(0.2)
+                return False
+            return item['name'] != 'late'
+
+        compare(first_failure([item('early'), item('late')], call, jobs=2),
+                expected=item('early'))
+
+    def test_concurrent_earlier_pass_waited_for(self):
+        def call(item):
+            if item['name'] == 'early':
+                sleep(0.2)
+                return True
+            return False
+
+        compare(first_failure([item('early'), item('late')], call, jobs=2),
+                expected=item('late'))
+
+    def test_concurrent_exception(self):
+        def call(item):
+            if item['name'] == 'boom':
+                raise SystemExit(128)
+            return True
+
+        with ShouldRaise(SystemExit(128)):
+            first_failure([item('ok'), item('boom'), item('ok2')], call, jobs=2)
+
+    def test_concurrent_earlier_failure_beats_exception(self):
+        def call(item):
+            if item['name'] == 'boom':
+                raise SystemExit(128)
+            sleep(0.2)
+            return False
+
+        compare(first_failure([item('fail'), item('boom')], call, jobs=2),
+                expected=item('fail'))
+
+
+def test_by_cost():
+    items = [item('a'), item('b'), item('c'), item('d')]
+    compare(by_cost(items, [1.0, 0.001, 1.0, 0.05]),
+            expected=[item('b'), item('d'), item('a'), item('c')])
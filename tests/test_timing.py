@@ -0,0 +1,143 @@
+import json
+from time import sleep
+
+from testfixtures import compare, ShouldRaise
+
+from carthorse.actions import run
+from carthorse.scheduler import run_in_order
+from carthorse.timing import Timings, Timing, describe, format_table
+
+
+class TestTimings(object):
+
+    def test_record(self):
+        timings = Timings()
+        with timings.record('when', 'check') as timing:
+            sleep(0.01)
+        assert timing.wall >= 0.01
+        compare(timings.entries, expected=[timing])
+        compare(timing.phase, expected='when')
+        compare(timing.name, expected='check')
+        compare(timing.error, expected=None)
+
+    def test_exception(self):
+        timings = Timings()
+        with ShouldRaise(SystemExit(1)):
+            with timings.record('actions', 'run: false'):
+                raise SystemExit(1)
+        compare(timings.entries[0].error, expected='SystemExit(1)')
+
+    def test_table(self):
+        timings = Timings()
+        timings.entries = [
+            Timing('carthorse', '', start=0, wall=2, cpu=0.5, children_cpu=1.25),
+            Timing('when', 'version-not-tagged', start=2, wall=0.5, cpu=0.125),
+            Timing('actions', 'run: '+'x'*50, start=1, wall=1.5, error='SystemExit(1)',
+                   commands=[{'max_rss': 3 * 2**20}, {'max_rss': 25 * 2**19}, {'max_rss': None}]),
+        ]
+        compare(timings.table(), expected='\n'.join((
+            'phase      name                                                wall     cpu  children  max rss',
+            'carthorse                                                    2.000s  0.500s    1.250s',
+            'actions    run: xxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxx... (error)  1.500s  0.000s    0.000s    12.5M',
+            'when       version-not-tagged                                0.500s  0.125s    0.000s',
+        )))
+
+    def test_write(self, dir):
+        timings = Timings()
+        timings.attributes['tag'] = 'v1.0'
+        with timings.record('when', 'always'):
+            pass
+        path = dir.getpath('timings.json')
+        timings.write(path)
+        data = json.loads(dir.read('timings.json'))
+        compare(data, expected={
+            'attributes': {'tag': 'v1.0'},
+            'timings': [{
+                'phase': 'when',
+                'name': 'always',
+                'start': data['timings'][0]['start'],
+                'wall': data['timings'][0]['wall'],
+                'cpu': data['timings'][0]['cpu'],
+                'children_cpu': data['timings'][0]['children_cpu'],
+                'error': None,
+                'commands': [],
+                'span_id': timings.entries[0].span_id,
+                'parent_id': None,
+            }],
+        })
+
+    def test_commands(self, capfd):
+        timings = Timings()
+        with timings.record('actions', 'run'):
+            run(['python', '-c', 'x = bytearray(50 * 2**20)'])
+        run('true')
+        timing, = timings.entries
+        command, = timing.commands
+        compare(command, expected={
+            'command': "python -c 'x = bytearray(50 * 2**20)'",
+            'start': command['start'],
+            'returncode': 0,
+            'wall': command['wall'],
+            'user': command['user'],
+            'system': command['system'],
+            'max_rss': command['max_rss'],
+            'inblock': command['inblock'],
+            'oublock': command['oublock'],
+        })
+        assert command['max_rss'] > 50 * 2**20, command
+        assert command['wall'] > 0
+        assert command['user'] + command['system'] > 0
+        capfd.readouterr()
+
+    def test_nested(self):
+        timings = Timings()
+        with timings.record('carthorse') as outer:
+            with timings.record('when', 'always') as inner:
+                pass
+        compare(inner.parent_id, expected=outer.span_id)
+        compare(outer.parent_id, expected=None)
+        assert inner.span_id != outer.span_id
+
+    def test_commands_in_parallel_actions(self, capfd):
+        timings = Timings()
+
+        def action(name):
+            with timings.record('actions', name):
+                run(['echo', name])
+
+        run_in_order([{'name': 'a', 'needs': []}, {'name': 'b', 'needs': []}],
+                     lambda item: action(item['name']), jobs=2)
+        compare(sorted((t.name, [c['command'] for c in t.commands]) for t in timings.entries),
+                expected=[('a', ['echo a']), ('b', ['echo b'])])
+        capfd.readouterr()
+
+    def test_previous(self, dir):
+        timings = Timings()
+        timings.entries = [
+            Timing('when', 'a', wall=0.5),
+            Timing('when', 'b', wall=2.0, error='SystemExit(1)'),
+            Timing('actions', 'a', wall=3.0),
+        ]
+        timings.write(dir.getpath('timings.json'))
+        compare(Timings.previous(dir.getpath('timings.json'), 'when'), expected={'a': 0.5})
+
+    def test_previous_missing(self, dir):
+        compare(Timings.previous(dir.getpath('timings.json'), 'when'), expected={})
+
+    def test_previous_corrupt(self, dir):
+        dir.write('timings.json', '{')
+        compare(Timings.previous(dir.getpath('timings.json'), 'when'), expected={})
+
+
+def test_describe():
+    compare(describe({'name': 'create-tag', 'args': (), 'kw': {}}), expected='create-tag')
+    compare(describe({'name': 'run', 'args': ('echo 1',), 'kw': {}}), expected='run: echo 1')
+    compare(describe({'name': 'run', 'args': (['echo', 'a b'],), 'kw': {}}),
+            expected="run: echo 'a b'")
+
+
+def test_format_table():
+    compare(format_table([('a', 'bb', 'c'), ('aaa', 'b', 'ccc')], left=1), expected=(
+        'a    bb    c\n'
+        'aaa   b  ccc'
+    ))
@@ -0,0 +1,101 @@
+import json
+
+from testfixtures import compare, Replace
+
+from carthorse.timing import Timings, Timing
+from carthorse.trace import as_otlp, attribute, nanoseconds, write_trace
+
+
+def make_timings():
+    timings = Timings()
+    timings.attributes.update(version='1.0', tag='v1.0')
+    timings.entries = [
+        Timing('actions', 'run: false', start=1.5, wall=0.25, error='SystemExit(1)',
+               span_id='a'*16, parent_id='r'*16, commands=[{
+                   'command': 'false', 'start': 1.5, 'returncode': 1, 'wall': 0.125,
+                   'user': 0.001, 'system': 0.002, 'max_rss': 2048, 'inblock': 0, 'oublock': 8,
+               }]),
+        Timing('carthorse', '', start=1, wall=1, span_id='r'*16),
+    ]
+    return timings
+
+
+class TestAsOtlp(object):
+
+    def test_spans(self):
+        with Replace('carthorse.trace.secrets.token_hex', lambda n: str(n)*n):
+            trace = as_otlp(make_timings())
+        resource_spans, = trace['resourceSpans']
+        compare(resource_spans['resource'], expected={'attributes': [
+            {'key': 'service.name', 'value': {'stringValue': 'carthorse'}},
+        ]})
+        scope_spans, = resource_spans['scopeSpans']
+        compare(scope_spans['scope']['name'], expected='carthorse')
+        trace_id = '16'*16
+        compare(scope_spans['spans'], expected=[{
+            'traceId': trace_id,
+            'spanId': 'r'*16,
+            'name': 'carthorse',
+            'kind': 1,
+            'startTimeUnixNano': '1000000000',
+            'endTimeUnixNano': '2000000000',
+            'attributes': [
+                {'key': 'carthorse.phase', 'value': {'stringValue': 'carthorse'}},
+                {'key': 'carthorse.version', 'value': {'stringValue': '1.0'}},
+                {'key': 'carthorse.tag', 'value': {'stringValue': 'v1.0'}},
+            ],
+        }, {
+            'traceId': trace_id,
+            'spanId': 'a'*16,
+            'parentSpanId': 'r'*16,
+            'name': 'actions: run: false',
+            'kind': 1,
+            'startTimeUnixNano': '1500000000',
+            'endTimeUnixNano': '1750000000',
+            'attributes': [
+                {'key': 'carthorse.phase', 'value': {'stringValue': 'actions'}},
+                {'key': 'carthorse.name', 'value': {'stringValue': 'run: false'}},
+            ],
+            'status': {'code': 2, 'message': 'SystemExit(1)'},
+        }, {
+            'traceId': trace_id,
+            'spanId': '8'*8,
+            'parentSpanId': 'a'*16,
+            'name': 'false',
+            'kind': 1,
+            'startTimeUnixNano': '1500000000',
+            'endTimeUnixNano': '1625000000',
+            'attributes': [
+                {'key': 'process.command_line', 'value': {'stringValue': 'false'}},
+                {'key': 'process.exit.code', 'value': {'intValue': '1'}},
+                {'key': 'carthorse.cpu.user', 'value': {'doubleValue': 0.001}},
+                {'key': 'carthorse.cpu.system', 'value': {'doubleValue': 0.002}},
+                {'key': 'carthorse.memory.max_rss', 'value': {'intValue': '2048'}},
+                {'key': 'carthorse.disk.blocks_read', 'value': {'intValue': '0'}},
+                {'key': 'carthorse.disk.blocks_written', 'value': {'intValue': '8'}},
+            ],
+            'status': {'code': 2, 'message': 'returncode=1'},
+        }])
+
+    def test_command_did_not_finish(self):
+        timings = make_timings()
+        timings.entries[0].commands[0]['returncode'] = None
+        spans = as_otlp(timings)['resourceSpans'][0]['scopeSpans'][0]['spans']
+        compare(spans[-1]['status'], expected={'code': 2, 'message': 'did not finish'})
+
+
+def test_attribute():
+    compare(attribute('a', True), expected={'key': 'a', 'value': {'boolValue': True}})
+    compare(attribute('a', 1), expected={'key': 'a', 'value': {'intValue': '1'}})
+    compare(attribute('a', 0.5), expected={'key': 'a', 'value': {'doubleValue': 0.5}})
+    compare(attribute('a', 'x'), expected={'key': 'a', 'value': {'stringValue': 'x'}})
+
+
+def test_nanoseconds():
+    compare(nanoseconds(1760000000.123456), expected='1760000000123456000')
+
+
+def test_write_trace(dir):
+    write_trace(make_timings(), dir.getpath('trace.json'))
+    data = json.loads(dir.read('trace.json'))
+    compare(len(data['resourceSpans'][0]['scopeSpans'][0]['spans']), expected=3)
@@ -1,8 +1,13 @@
+from subprocess import TimeoutExpired
 from textwrap import dedent
 
-from testfixtures import compare, ShouldRaise, Replace
+from testfixtures import compare, ShouldRaise, Replace, OutputCapture
 
-from carthorse.version_from import poetry, setup_py, file, flit, none, env, pyproject
+from carthorse.context import RunContext, activated, time_limit
+from carthorse.execution import Backend
+from carthorse.version_from import (
+    poetry, setup_py, file, flit, none, env, pyproject, static_setup_py
+)
 
 
 def test_pyproject(dir):
@@ -25,6 +30,111 @@ def test_setup_py(dir):
     """))
     compare(setup_py(), expected='1.2.3')
 
+def test_setup_py_warnings(dir):
+    dir.write('setup.py', dedent("""
+    import sys
+    sys.stderr.write('deprecated!\\n')
+    sys.stderr.flush()
+    print('1.2.3')
+    """))
+    compare(setup_py(), expected='1.2.3')
+
+def test_setup_py_fails(dir):
+    dir.write('setup.py', 'print("oops")\nraise SystemExit(2)\n')
+    with OutputCapture() as output:
+        with ShouldRaise(SystemExit(2)):
+            setup_py()
+    output.compare('$ python setup.py --version\noops\nreturncode=2')
+
+def test_setup_py_no_output(dir):
+    dir.write('setup.py', 'pass\n')
+    compare(setup_py(), expected='')
+
+def test_setup_py_backend(dir):
+    dir.write('setup.py', 'pass\n')
+    executed = []
+
+    class FakeBackend(Backend):
+        def execute(self, command, output, cwd=None, env=None, timeout=None, usage=None,
+                    cancel=None):
+            executed.append((command, cwd))
+            output('1.2.3\n')
+            return 0
+
+    with activated(RunContext(backend=FakeBackend())):
+        compare(setup_py('python3'), expected='1.2.3')
+    compare(executed, expected=[(['python3', 'setup.py', '--version'], dir.path)])
+
+def test_setup_py_time_limit(dir):
+    dir.write('setup.py', 'import time\ntime.sleep(5)\n')
+    with OutputCapture() as output:
+        with time_limit(0.2), ShouldRaise(TimeoutExpired):
+            setup_py()
+    output.compare('timed out after 0.2s')
+
+def raiser(*args, **kw):  # pragma: no cover
+    raise Exception('Boom!')
+
+def test_setup_py_literal(dir):
+    dir.write('setup.py', dedent("""
+    from setuptools import setup
+    setup(name='foo', version='1.2.3')
+    """))
+    with Replace('carthorse.version_from.capture', raiser):
+        compare(setup_py(), expected='1.2.3')
+
+def test_setup_py_constant(dir):
+    dir.write('setup.py', dedent("""
+    import setuptools
+    VERSION: str = '1.2.3.post1'
+    setuptools.setup(name='foo', version=VERSION)
+    """))
+    with Replace('carthorse.version_from.capture', raiser):
+        compare(setup_py(), expected='1.2.3.post1')
+
+def test_setup_py_dynamic(dir):
+    dir.write('setup.py', dedent("""
+    def setup(**kw):
+        print(kw['version'])
+    def get_version():
+        return '1.2.3'
+    setup(version=get_version())
+    """))
+    compare(static_setup_py(), expected=None)
+    compare(setup_py(), expected='1.2.3')
+
+def test_setup_py_constant_reassigned(dir):
+    dir.write('setup.py', dedent("""
+    def setup(**kw):
+        print(kw['version'])
+    VERSION = '1.0'
+    if True:
+        VERSION = '1.2.3'
+    setup(version=VERSION)
+    """))
+    compare(static_setup_py(), expected=None)
+    compare(setup_py(), expected='1.2.3')
+
+def test_setup_py_not_normalized(dir):
+    dir.write('setup.py', dedent("""
+    def setup(**kw):
+        print('1.0b0')
+    setup(version='1.0-beta')
+    """))
+    compare(static_setup_py(), expected=None)
+    compare(setup_py(), expected='1.0b0')
+
+def test_setup_py_syntax_error(dir):
+    dir.write('setup.py', 'print "1.2.3"\n')
+    compare(static_setup_py(), expected=None)
+
+def test_setup_py_multiple_setup_calls(dir):
+    dir.write('setup.py', dedent("""
+    setup(version='1.0')
+    setup(version='2.0')
+    """))
+    compare(static_setup_py(), expected=None)
+
 def test_file(dir):
     dir.write('package/version.txt', '1.2.3\n')
     compare(file('package/version.txt'), expected='1.2.3')
@@ -44,6 +154,54 @@ def test_file_multiple_matches(dir):
     dir.write('package/changelog.txt', '1.2.3\n1.2.2\n2.0.0\n')
     compare(file('package/changelog.txt'), expected='1.2.3')
 
+def test_file_limit(dir):
+    dir.write('CHANGELOG', 'intro\n' + 'x' * 100 + '\n## 1.2.3\n')
+    with ShouldRaise(ValueError(r'## (?P<version>\S+) not found in CHANGELOG')):
+        file('CHANGELOG', pattern=r'## (?P<version>\S+)', limit=50)
+    compare(file('CHANGELOG', pattern=r'## (?P<version>\S+)', limit=200), expected='1.2.3')
+
+def test_file_limit_splits_match(dir):
+    dir.write('CHANGELOG', '## 1.2.3\n')
+    compare(file('CHANGELOG', pattern=r'## (?P<version>[\d.]+)', limit=6), expected='1.2')
+
+def test_file_large(dir):
+    path = dir.write('CHANGELOG', '## 2.0.0\n' + 'filler line\n' * 200_000 + '## 1.0.0\n')
+    compare(file(path, pattern=r'## (?P<version>\S+)'), expected='2.0.0')
+
+def test_file_crlf(dir):
+    (dir.as_path() / 'version.txt').write_bytes(b'1.2.3\r\n')
+    compare(file('version.txt'), expected='1.2.3')
+
+def test_file_crlf_multiline_pattern(dir):
+    (dir.as_path() / 'meta.txt').write_bytes(b'name: foo\r\nversion: 1.2.3\r\n')
+    compare(file('meta.txt', pattern=r'(?m)^version: (?P<version>[\d.]+)$'), expected='1.2.3')
+
+def test_file_unicode_classes(dir):
+    dir.write('version.txt', 'versión: 1.2.3\n', encoding='utf-8')
+    compare(file('version.txt', pattern=r'^\w+: (?P<version>.+)'), expected='1.2.3')
+
+def test_file_match_across_chunks(dir):
+    dir.write('CHANGELOG', 'x' * 10 + '\n## 1.2.3\n')
+    with Replace('carthorse.version_from.CHUNK_SIZE', 3):
+        compare(file('CHANGELOG', pattern=r'## (?P<version>\S+)'), expected='1.2.3')
+
+def test_file_limit_across_chunks(dir):
+    dir.write('CHANGELOG', 'x' * 10 + '\n## 1.2.3\n')
+    with Replace('carthorse.version_from.CHUNK_SIZE', 3):
+        compare(file('CHANGELOG', pattern=r'## (?P<version>[\d.]+)', limit=17), expected='1.2')
+
+def test_file_empty(dir):
+    dir.write('version.txt', '')
+    compare(file('version.txt'), expected='')
+
+def test_file_non_ascii_pattern(dir):
+    dir.write('version.txt', 'versión: 1.2.3\n', encoding='utf-8')
+    compare(file('version.txt', pattern='versión: (?P<version>.+)'), expected='1.2.3')
+
+def test_file_non_ascii_content(dir):
+    dir.write('version.txt', '# café\nversion: 1.2.3\n', encoding='utf-8')
+    compare(file('version.txt', pattern='version: (?P<version>.+)'), expected='1.2.3')
+
 def test_flit_module(dir):
     dir.write('foobar.py', dedent('''
     """An amazing sample package!"""
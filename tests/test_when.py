@@ -3,7 +3,8 @@ from subprocess import CalledProcessError
 
 from testfixtures import Replace, compare, ShouldRaise, Replacer
 
-from carthorse.when import never, always, version_not_tagged
+from carthorse.context import RunContext, activated
+from carthorse.when import never, always, version_not_tagged, TagSnapshot
 from conftest import GitHelper
 
 
@@ -31,8 +32,6 @@ class TestVersionNotTagged(object):
             out, err = capfd.readouterr()
             compare(out, expected=(
                 '$ git remote -v\n'
-                '$ git rev-parse --verify -q 1.2.3\n'
-                'returncode=1\n'
                 'No tag found.\n'
             ))
             compare(err, expected='')
@@ -41,7 +40,6 @@ class TestVersionNotTagged(object):
         with Replace('os.environ.TAG', 'v1.2.3', strict=False):
             git.make_repo_with_content()
             git('tag v1.2.3')
-            rev = git.rev_parse('HEAD')
             os.chdir(git.dir.getpath(git.repo))
 
             assert not version_not_tagged()
@@ -49,8 +47,6 @@ class TestVersionNotTagged(object):
             out, err = capfd.readouterr()
             compare(out, expected=(
                 '$ git remote -v\n'
-                '$ git rev-parse --verify -q v1.2.3\n'
-                f'{rev}\n'
                 'Version is already tagged.\n'
             ))
             compare(err, expected='')
@@ -64,8 +60,8 @@ class TestVersionNotTagged(object):
             out,
             expected=(
                 '$ git remote -v\n'
-                'returncode=128\n'
                 'fatal: not a git repository (or any of the parent directories): .git\n'
+                'returncode=128\n'
                 ''
             ),
         )
@@ -110,7 +106,145 @@ class TestVersionNotTagged(object):
             "$ git fetch origin 'refs/tags/*:refs/tags/*'\n"
             f"From {remote}\n"
             f" * [new tag]         v1.2.3     -> v1.2.3\n"
-            '$ git rev-parse --verify -q v1.2.3\n'
-            f'{rev}\n'
             'Version is already tagged.\n'
         ))
+
+    def test_ls_remote_tagged_upstream(self, git: GitHelper, capfd):
+        with Replace('os.environ.TAG', 'v1.2.3', strict=False):
+            git.make_repo_with_content('remote')
+            rev = git.rev_parse('HEAD', 'remote')
+            git('clone remote local', git.dir.path)
+            git('tag v1.2.3', 'remote')
+            git('tag v1.2.2', 'remote')
+            os.chdir(git.dir.getpath('local'))
+
+            assert not version_not_tagged(lookup='ls-remote')
+
+            git.check_tags(repo='local', expected={})
+
+        out, _ = capfd.readouterr()
+        compare(out, expected=(
+            '$ git remote -v\n'
+            f"{git('remote -v').decode('ascii')}"
+            '$ git ls-remote --tags origin refs/tags/v1.2.3\n'
+            f'{rev}\trefs/tags/v1.2.3\n'
+            'Version is already tagged.\n'
+        ))
+
+    def test_ls_remote_not_tagged(self, git: GitHelper, capfd):
+        with Replace('os.environ.TAG', 'v1.2.3', strict=False):
+            git.make_repo_with_content('remote')
+            git('clone remote local', git.dir.path)
+            git('tag v1.2.2', 'remote')
+            os.chdir(git.dir.getpath('local'))
+
+            assert version_not_tagged(lookup='ls-remote')
+
+            git.check_tags(repo='local', expected={})
+
+        out, _ = capfd.readouterr()
+        compare(out, expected=(
+            '$ git remote -v\n'
+            f"{git('remote -v').decode('ascii')}"
+            '$ git ls-remote --tags origin refs/tags/v1.2.3\n'
+            'No tag found.\n'
+        ))
+
+    def test_ls_remote_tagged_locally(self, git: GitHelper, capfd):
+        with Replace('os.environ.TAG', 'v1.2.3', strict=False):
+            git.make_repo_with_content('remote')
+            git('clone remote local', git.dir.path)
+            git('tag v1.2.3')
+            os.chdir(git.dir.getpath('local'))
+
+            assert not version_not_tagged(lookup='ls-remote')
+
+        out, _ = capfd.readouterr()
+        assert out.endswith('Version is already tagged.\n'), out
+
+    def test_bad_lookup(self, dir):
+        with Replace('os.environ.TAG', 'v1.2.3', strict=False):
+            with ShouldRaise(ValueError(
+                    "lookup must be one of ('fetch', 'ls-remote'), not 'foo'"
+            )):
+                version_not_tagged(lookup='foo')
+
+
+class TestTagSnapshot(object):
+
+    def make_repos(self, git):
+        rev = git.make_clone()
+        git('tag v1.2.3', 'remote')
+        git('tag -a -m annotated v1.2.2', 'remote')
+        return rev
+
+    def test_fetch_once(self, git: GitHelper, capfd):
+        rev = self.make_repos(git)
+        snapshot = TagSnapshot()
+        with activated(RunContext(tag='v1.2.3', snapshot=snapshot)):
+            assert not version_not_tagged()
+        with activated(RunContext(tag='v1.2.4', snapshot=snapshot)):
+            assert version_not_tagged()
+        git.check_tags(repo='local', expected={
+            b'v1.2.2': git.rev_parse('v1.2.2'), b'v1.2.3': rev
+        })
+        out = capfd.readouterr().out
+        compare(out.count('$ git fetch'), expected=1)
+
+    def test_ls_remote_once(self, git: GitHelper, capfd):
+        self.make_repos(git)
+        snapshot = TagSnapshot()
+        with activated(RunContext(tag='v1.2.3', snapshot=snapshot)):
+            assert not version_not_tagged(lookup='ls-remote')
+        with activated(RunContext(tag='v1.2.2', snapshot=snapshot)):
+            assert not version_not_tagged(lookup='ls-remote')
+        with activated(RunContext(tag='v1.2.4', snapshot=snapshot)):
+            assert version_not_tagged(lookup='ls-remote')
+        compare(snapshot.listed, expected={
+            (str(git.dir.as_path('local/.git').resolve()), 'origin'): {'v1.2.2', 'v1.2.3'}
+        })
+        git.check_tags(repo='local', expected={})
+        out = capfd.readouterr().out
+        compare([line for line in out.splitlines() if 'ls-remote' in line],
+                expected=['$ git ls-remote --tags origin'])
+
+    def make_other_repos(self, git):
+        git.make_repo_with_content('other-remote')
+        git('clone other-remote local/other', git.dir.path)
+        git('tag other-v1.0', 'other-remote')
+
+    def test_fetch_per_repository(self, git: GitHelper, capfd):
+        self.make_repos(git)
+        self.make_other_repos(git)
+        snapshot = TagSnapshot()
+        with activated(RunContext(tag='v1.2.3', snapshot=snapshot)):
+            assert not version_not_tagged()
+        with activated(RunContext(tag='other-v1.0', snapshot=snapshot,
+                                  cwd=git.dir.getpath('local/other'))):
+            assert not version_not_tagged()
+        compare(capfd.readouterr().out.count('$ git fetch'), expected=2)
+
+    def test_ls_remote_per_repository(self, git: GitHelper, capfd):
+        self.make_repos(git)
+        self.make_other_repos(git)
+        snapshot = TagSnapshot()
+        with activated(RunContext(tag='other-v1.0', snapshot=snapshot)):
+            assert version_not_tagged(lookup='ls-remote')
+        with activated(RunContext(tag='other-v1.0', snapshot=snapshot,
+                                  cwd=git.dir.getpath('local/other'))):
+            assert not version_not_tagged(lookup='ls-remote')
+        compare(capfd.readouterr().out.count('$ git ls-remote'), expected=2)
+
+    def test_key_unsupported_repository(self, dir):
+        with activated(RunContext(cwd=dir.path, env={})):
+            compare(TagSnapshot.key('origin'),
+                    expected=(str(dir.as_path().resolve()), 'origin'))
+
+    def test_ls_remote_fails(self, git: GitHelper, capfd):
+        self.make_repos(git)
+        with activated(RunContext()):
+            with ShouldRaise(SystemExit(128)):
+                TagSnapshot().tags('nonexistent')
+        out = capfd.readouterr().out
+        assert out.startswith('$ git ls-remote --tags nonexistent\n'), out
+        assert out.endswith('returncode=128\n'), out